@@ -0,0 +1,116 @@
+"""
+Micro-benchmark of the feed workers' article extraction: newspaper vs the
+lxml fast mode, inline vs on the process pool (EXTRACT_PROCESSES).
+
+The pages wrap known body paragraphs in navigation, sidebar, comment and
+footer boilerplate, half of them without an <article> element, so the
+extraction quality (token precision / recall / F1 against the known body)
+is reported along with the throughput.
+
+Run from the services/ directory:
+    python -m benchmarks.bench_extraction
+    python -m benchmarks.bench_extraction --pages 400 --processes 4
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fetch_news_crypto"))
+
+from feed_worker.utils import extract_text  # noqa: E402
+
+from benchmarks.fake_upstreams import COINS, SENTENCES  # noqa: E402
+
+_TOKEN_RE = re.compile(r"\w+")
+
+BOILERPLATE = [
+    "Subscribe to our newsletter for the latest crypto news.",
+    "Markets | Prices | Research | Events | Podcasts | Login",
+    "Related: the five coins to watch this week and why they matter.",
+    "Copyright 2025. All rights reserved. Terms of use and privacy policy.",
+    "Sponsored: trade bitcoin with zero fees on our partner exchange.",
+]
+
+
+def build_page(index, paragraphs):
+    """Returns (html bytes, body text) of a synthetic news page."""
+    rng = random.Random(index)
+    coin = COINS[index % len(COINS)].capitalize()
+    body = [
+        " ".join(rng.choice(SENTENCES).format(coin=coin, n=rng.randint(2, 99_999)) for _ in range(4))
+        for _ in range(paragraphs)
+    ]
+    links = "".join(f"<li><a href='/{i}'>{text}</a></li>" for i, text in enumerate(BOILERPLATE))
+    content = f"<h2>{coin} story {index}</h2>" + "".join(f"<p>{p}</p>" for p in body)
+    # half of the pages have no <article> element, as on many WordPress themes
+    main = f"<article>{content}</article>" if index % 2 else f"<div class='entry-content'>{content}</div>"
+    html = (
+        f"<html><head><title>{coin} story {index}</title><script>var ads = [];</script>"
+        "<style>body { margin: 0 }</style></head><body>"
+        f"<header><nav><ul>{links}</ul></nav></header>"
+        f"<div class='layout'><aside><p>{BOILERPLATE[2]}</p><p>{BOILERPLATE[4]}</p></aside>{main}"
+        f"<div class='comments'><p>{BOILERPLATE[0]}</p></div></div>"
+        f"<footer><p>{BOILERPLATE[3]}</p></footer></body></html>"
+    )
+    return html.encode("utf-8"), f"{coin} story {index}\n\n" + "\n\n".join(body)
+
+
+def token_f1(extracted, expected):
+    got = Counter(_TOKEN_RE.findall(extracted.lower()))
+    want = Counter(_TOKEN_RE.findall(expected.lower()))
+    overlap = sum((got & want).values())
+    precision = overlap / max(1, sum(got.values()))
+    recall = overlap / max(1, sum(want.values()))
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def run(pages, mode, processes):
+    urls = [f"http://bench.example.com/{i}.html" for i in range(len(pages))]
+    started = time.perf_counter()
+    if processes <= 0:
+        texts = [extract_text(html, url, mode) for (html, _), url in zip(pages, urls)]
+    else:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # one warm-up task per worker, so process start-up is not timed
+            list(pool.map(extract_text, [pages[0][0]] * processes, urls[:processes], [mode] * processes))
+            started = time.perf_counter()
+            texts = list(pool.map(extract_text, [html for html, _ in pages], urls, [mode] * len(pages)))
+    elapsed = time.perf_counter() - started
+
+    scores = [token_f1(text, body) for text, (_, body) in zip(texts, pages)]
+    return {
+        "pages_per_second": len(pages) / elapsed,
+        "precision": sum(s[0] for s in scores) / len(scores),
+        "recall": sum(s[1] for s in scores) / len(scores),
+        "f1": sum(s[2] for s in scores) / len(scores),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=10)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    pages = [build_page(i, args.paragraphs) for i in range(args.pages)]
+    print(f"{'extractor':<10} {'processes':>9} {'pages/s':>9} {'precision':>9} {'recall':>7} {'f1':>6}")
+    for mode in ("newspaper", "fast"):
+        for processes in (0, args.processes):
+            result = run(pages, mode, processes)
+            print(
+                f"{mode:<10} {processes or 'inline':>9} {result['pages_per_second']:>9.1f} "
+                f"{result['precision']:>9.3f} {result['recall']:>7.3f} {result['f1']:>6.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Offline end-to-end benchmark of the feed workers, the aggregator pipeline
+and fetch_crypto, against local stand-in upstreams (see fake_upstreams.py).
+
+Every app runs as a real uvicorn subprocess, configured through its
+environment (NEWS_FEEDS, COINGECKO_PRICE_URL, OLLAMA_API, FEED_WORKER_URLS)
+to talk to the fake upstreams only. The benchmark reports p50/p95/p99 latency
+and throughput per scenario and saves the results as JSON, so two commits
+can be compared.
+
+Run from the services/ directory:
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --scenarios news,crypto --requests 200
+    python -m benchmarks.e2e --scenarios scaling --workers 4
+    python -m benchmarks.e2e --compare benchmarks/results/<earlier run>.json
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SERVICES_DIR = Path(__file__).resolve().parent.parent
+NEWS_DIR = SERVICES_DIR / "fetch_news_crypto"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SCENARIOS = ["news", "scaling", "crypto", "aggregator"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICES_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Processes:
+    """Starts subprocesses, waits until they answer HTTP, and stops them all on exit."""
+
+    def __init__(self, workdir, verbose=False):
+        self.workdir = workdir
+        self.verbose = verbose
+        self._procs = []
+
+    def start(self, name, args, cwd, env, ready_url, timeout=60):
+        log = None if self.verbose else open(Path(self.workdir) / f"{name}.log", "w")
+        proc = subprocess.Popen(
+            [sys.executable] + args, cwd=cwd, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT
+        )
+        self._procs.append(proc)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {proc.returncode}, see {self.workdir}/{name}.log")
+            try:
+                httpx.get(ready_url, timeout=1)
+                return proc
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError(f"{name} did not start within {timeout}s")
+
+    def uvicorn(self, name, app, cwd, env, pythonpath):
+        port = free_port()
+        env = {**env, "PYTHONPATH": str(pythonpath), "PYTHONUNBUFFERED": "1"}
+        args = ["-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+        self.start(name, args, cwd, env, f"http://127.0.0.1:{port}/metrics")
+        return f"http://127.0.0.1:{port}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for proc in self._procs:
+            proc.terminate()
+        for proc in self._procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def percentiles(latencies):
+    """p50/p95/p99/mean/max of the given latencies (seconds), in milliseconds."""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def rank(p):
+        # nearest-rank percentile
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+    return {
+        "p50": round(rank(50) * 1000, 1),
+        "p95": round(rank(95) * 1000, 1),
+        "p99": round(rank(99) * 1000, 1),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 1),
+        "max": round(ordered[-1] * 1000, 1),
+    }
+
+
+async def drive(method, url, requests, concurrency, timeout, **kwargs):
+    """Sends `requests` requests with `concurrency` in flight and measures every latency."""
+    latencies = []
+    errors = 0
+    sizes = []
+    remaining = iter(range(requests))
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                    response.raise_for_status()
+                    sizes.append(response.json())
+                except (httpx.HTTPError, ValueError):
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": percentiles(latencies),
+    }, sizes
+
+
+def feed_urls(upstream, feeds):
+    return [f"{upstream}/feeds/{n}.xml" for n in range(feeds)]
+
+
+def start_workers(procs, upstream, feeds, replicas, env=None, prefix="feed-worker"):
+    """Starts `replicas` feed workers sharing the feeds; returns their /fetch_news URLs."""
+    names = [f"{prefix}-{i}" for i in range(replicas)]
+    urls = []
+    for name in names:
+        worker_env = {
+            "NEWS_FEEDS": ",".join(feed_urls(upstream, feeds)), "FETCH_INCREMENTAL": "0",
+            "WORKER_NAME": name, "WORKER_MEMBERS": ",".join(names), **(env or {}),
+        }
+        url = procs.uvicorn(
+            name, "main:app", NEWS_DIR / "feed_worker", worker_env,
+            os.pathsep.join([str(NEWS_DIR / "feed_worker"), str(NEWS_DIR)]),
+        )
+        urls.append(f"{url}/fetch_news")
+    return urls
+
+
+def run_news(args, procs, upstream):
+    [service] = start_workers(procs, upstream, args.feeds, 1, prefix="news")
+    result, bodies = asyncio.run(drive(
+        "GET", service, args.news_requests, args.news_concurrency, timeout=300
+    ))
+    articles = sum(body.get("count", 0) for body in bodies)
+    result["articles_per_second"] = round(articles / result["seconds"], 1) if result["seconds"] else 0.0
+    return result
+
+
+async def fan_out(urls):
+    """One aggregator-style fan-out: every replica's /fetch_news at once. Returns (seconds, articles)."""
+    async with httpx.AsyncClient(timeout=600) as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[client.get(url) for url in urls])
+        elapsed = time.perf_counter() - started
+    return elapsed, sum(response.json().get("count", 0) for response in responses)
+
+
+def run_scaling(args, procs, upstream):
+    """
+    Scrape throughput of 1..--workers replicas sharing the same feeds, polling
+    disabled so every fan-out scrapes: each replica only scrapes its share.
+
+    The shares come from the hash ring and are only even on average: with the
+    default 2 feeds per replica one replica may own most of them, which caps
+    the speedup. Pass a larger --feeds for a balanced split.
+    """
+    feeds = args.feeds * args.workers
+    results = {}
+    replicas = 1
+    while True:
+        urls = start_workers(procs, upstream, feeds, replicas, {"NEWS_POLL_INTERVAL": "0"}, prefix=f"scale{replicas}")
+        rounds = [asyncio.run(fan_out(urls)) for _ in range(args.scaling_rounds)]
+        seconds = [elapsed for elapsed, _ in rounds]
+        articles = sum(count for _, count in rounds)
+        results[f"replicas_{replicas}"] = {
+            "fan_out_latency_ms": percentiles(seconds),
+            "articles_per_second": round(articles / sum(seconds), 1),
+        }
+        if replicas == args.workers:
+            return {"feeds": feeds, **results}
+        replicas = min(args.workers, replicas * 2)
+
+
+def run_crypto(args, procs, upstream):
+    service = procs.uvicorn(
+        "fetch_crypto", "fetch_crypto.main:app", procs.workdir,
+        {"COINGECKO_PRICE_URL": f"{upstream}/api/v3/simple/price", "COINGECKO_CALLS_PER_MINUTE": "600000",
+         "PRICE_CACHE_TTL": str(args.price_cache_ttl)},
+        SERVICES_DIR,
+    )
+    coins = [{"symbol": f"coin-{i}", "buy_price": 10.0 + i} for i in range(args.portfolio_size - 1)]
+    coins.append({"symbol": "nonexistentcoin", "buy_price": 1.0})
+    result, _ = asyncio.run(drive(
+        "POST", f"{service}/crypto/get_coins_prices", args.requests, args.concurrency, timeout=60,
+        json={"coins": coins},
+    ))
+    result["portfolio_size"] = args.portfolio_size
+    return result
+
+
+async def stream_analysis_run(url):
+    """One aggregator run over /analysis/stream: total time, time to first token and tokens."""
+    started = time.perf_counter()
+    first_token = None
+    tokens = 0
+    done = {}
+    async with httpx.AsyncClient(timeout=None) as client:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event == "token":
+                    tokens += 1
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                elif line.startswith("data: ") and event in ("done", "error"):
+                    done = {"event": event, **json.loads(line[len("data: "):])}
+    return time.perf_counter() - started, first_token, tokens, done
+
+
+def run_aggregator(args, procs, upstream):
+    workers = start_workers(procs, upstream, args.feeds * args.workers, args.workers)
+
+    aggregator_dir = Path(procs.workdir) / "aggregator"
+    aggregator_dir.mkdir(exist_ok=True)
+    aggregator = procs.uvicorn(
+        "aggregator", "main:app", aggregator_dir,
+        {"FEED_WORKER_URLS": ",".join(workers), "OLLAMA_API": upstream, "LLM_CACHE_ENABLED": "0"},
+        os.pathsep.join([str(NEWS_DIR / "aggregator"), str(NEWS_DIR)]),
+    )
+
+    runs = []
+    for _ in range(args.aggregator_runs):
+        # every run starts from an empty analysis state, so all articles are analyzed
+        (aggregator_dir / "received_data" / "analysis_state.json").unlink(missing_ok=True)
+        runs.append(asyncio.run(stream_analysis_run(f"{aggregator}/analysis/stream")))
+
+    totals = [total for total, _, _, _ in runs]
+    first_tokens = [first for _, first, _, _ in runs if first is not None]
+    tokens = sum(count for _, _, count, _ in runs)
+    limiter = httpx.get(f"{aggregator}/ollama_limiter").json()
+    return {
+        "runs": len(runs),
+        "errors": sum(1 for *_, done in runs if done.get("event") != "done"),
+        "articles_per_run": runs[-1][3].get("analyzed_count"),
+        "run_latency_ms": percentiles(totals),
+        "time_to_first_token_ms": percentiles(first_tokens),
+        "tokens_per_second": round(tokens / sum(totals), 1) if totals else 0.0,
+        "final_ollama_limit": limiter["limit"],
+    }
+
+
+RUNNERS = {"news": run_news, "scaling": run_scaling, "crypto": run_crypto, "aggregator": run_aggregator}
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(previous, current):
+    """Prints every numeric result next to the same result of an earlier run."""
+    old, new = flatten(previous["results"]), flatten(current["results"])
+    print(f"\nCompared with {previous['commit']} ({previous['timestamp']}):")
+    print(f"{'metric':<48} {'before':>12} {'after':>12} {'change':>9}")
+    for key in sorted(set(old) & set(new)):
+        change = f"{(new[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else ""
+        print(f"{key:<48} {old[key]:>12} {new[key]:>12} {change:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ",".join(SCENARIOS))
+    parser.add_argument("--feeds", type=int, default=2, help="feeds per feed-worker replica")
+    parser.add_argument("--workers", type=int, default=3, help="feed-worker replicas")
+    parser.add_argument("--scaling-rounds", type=int, default=3, help="fan-outs per replica count")
+    parser.add_argument("--articles-per-feed", type=int, default=20)
+    parser.add_argument("--article-latency", type=float, default=0.05)
+    parser.add_argument("--news-requests", type=int, default=10)
+    parser.add_argument("--news-concurrency", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=500, help="get_coins_prices requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent get_coins_prices requests")
+    parser.add_argument("--portfolio-size", type=int, default=50)
+    parser.add_argument("--price-cache-ttl", type=float, default=30)
+    parser.add_argument("--coingecko-latency", type=float, default=0.05)
+    parser.add_argument("--aggregator-runs", type=int, default=3)
+    parser.add_argument("--ollama-first-token", type=float, default=0.5)
+    parser.add_argument("--ollama-tokens", type=int, default=100)
+    parser.add_argument("--ollama-tokens-per-second", type=float, default=50)
+    parser.add_argument("--ollama-parallel", type=int, default=2)
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR, help="directory for the JSON results")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare with")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the subprocesses")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(RUNNERS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="financesight-bench-") as workdir, Processes(workdir, args.verbose) as procs:
+        upstream_port = free_port()
+        upstream = f"http://127.0.0.1:{upstream_port}"
+        procs.start(
+            "fake_upstreams",
+            ["-m", "benchmarks.fake_upstreams", "--port", str(upstream_port),
+             "--articles-per-feed", str(args.articles_per_feed), "--article-latency", str(args.article_latency),
+             "--coingecko-latency", str(args.coingecko_latency),
+             "--ollama-first-token", str(args.ollama_first_token), "--ollama-tokens", str(args.ollama_tokens),
+             "--ollama-tokens-per-second", str(args.ollama_tokens_per_second),
+             "--ollama-parallel", str(args.ollama_parallel)],
+            SERVICES_DIR, {}, f"{upstream}/feeds/0.xml",
+        )
+        for name in scenarios:
+            print(f"Running {name}...", flush=True)
+            results[name] = RUNNERS[name](args, procs, upstream)
+            print(json.dumps(results[name], indent=2), flush=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "results": results,
+    }
+    args.output.mkdir(parents=True, exist_ok=True)
+    path = args.output / f"{report['timestamp'].replace(':', '')}-{report['commit']}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Local stand-ins for the external upstreams, for offline benchmarks:
+
+    /feeds/<n>.xml          RSS feed with --articles-per-feed items published "now"
+    /articles/<n>/<i>.html  Article HTML (served after --article-latency seconds)
+    /api/v3/simple/price    CoinGecko simple/price (every id but "nonexistent*" has a price)
+    /api/generate           Ollama streaming generate: --ollama-first-token seconds of
+                            prompt evaluation, then --ollama-tokens tokens at
+                            --ollama-tokens-per-second, at most --ollama-parallel
+                            requests at a time (the rest queue, like a real Ollama)
+
+Run from the services/ directory (e2e.py starts it as a subprocess):
+    python -m benchmarks.fake_upstreams --port 9000
+"""
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+
+COINS = ["bitcoin", "ethereum", "solana", "cardano", "ripple", "dogecoin", "polkadot", "chainlink"]
+# newspaper's extractor scores text blocks by their stopwords, so the filler reads like
+# prose; the random numbers keep articles apart for the aggregator's near-duplicate filter
+SENTENCES = [
+    "The price of {coin} moved {n} percent higher as traders returned to the market after a quiet week.",
+    "Analysts said that the network upgrade could bring {n} more developers to the ecosystem.",
+    "On the other hand, {n} of the largest holders have been moving their coins to exchanges.",
+    "Trading volume in the futures market reached {n} million, the highest since the start of the year.",
+    "Regulators are still looking at how {n} new rules would apply to staking and lending services.",
+    "According to the report, the number of active wallets has grown to {n} thousand this month.",
+    "Many investors are waiting for the next move before they decide to buy or sell {coin} at {n} dollars.",
+    "The team behind {coin} announced a partnership with {n} companies that is expected later this year.",
+]
+
+
+def article_html(feed, index, paragraphs):
+    rng = random.Random(feed * 100_003 + index)
+    coin = COINS[(feed + index) % len(COINS)]
+    body = "".join(
+        "<p>" + " ".join(rng.choice(SENTENCES).format(coin=coin.capitalize(), n=rng.randint(2, 99_999)) for _ in range(5)) + "</p>"
+        for _ in range(paragraphs)
+    )
+    return (
+        f"<html><head><title>{coin} story {feed}-{index}</title></head>"
+        f"<body><article><h1>{coin.capitalize()} story {feed}-{index}</h1>{body}</article></body></html>"
+    )
+
+
+def feed_xml(base_url, feed, articles):
+    # numeric zone, as parsed by the aggregator's is_published_today()
+    now = formatdate(time.time(), localtime=False).replace("-0000", "+0000")
+    items = "".join(
+        f"<item><title>{COINS[(feed + i) % len(COINS)]} story {feed}-{i}</title>"
+        f"<link>{base_url}/articles/{feed}/{i}.html</link><pubDate>{now}</pubDate></item>"
+        for i in range(articles)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>Fake feed {feed}</title><link>{base_url}</link>{items}</channel></rss>"
+    )
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+    ollama_slots = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        base_url = f"http://{self.headers.get('Host')}"
+
+        if parts[0] == "feeds" and len(parts) == 2:
+            feed = int(parts[1].split(".")[0])
+            self._send(200, feed_xml(base_url, feed, self.config.articles_per_feed), "application/rss+xml")
+        elif parts[0] == "articles" and len(parts) == 3:
+            time.sleep(self.config.article_latency)
+            feed, index = int(parts[1]), int(parts[2].split(".")[0])
+            self._send(200, article_html(feed, index, self.config.paragraphs), "text/html")
+        elif url.path == "/api/v3/simple/price":
+            time.sleep(self.config.coingecko_latency)
+            ids = parse_qs(url.query).get("ids", [""])[0].split(",")
+            prices = {
+                coin_id: {"usd": int(hashlib.sha1(coin_id.encode()).hexdigest()[:6], 16) / 100}
+                for coin_id in ids if coin_id and not coin_id.startswith("nonexistent")
+            }
+            self._send(200, json.dumps(prices), "application/json")
+        else:
+            self._send(404, "not found", "text/plain")
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/api/generate":
+            self._send(404, "not found", "text/plain")
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt_tokens = len(request.get("prompt", "").split())
+
+        with self.ollama_slots:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            started = time.monotonic()
+            time.sleep(self.config.ollama_first_token)
+            prompt_done = time.monotonic()
+            for i in range(self.config.ollama_tokens):
+                self._write_chunk({"response": f"token{i} ", "done": False})
+                time.sleep(1 / self.config.ollama_tokens_per_second)
+            finished = time.monotonic()
+            self._write_chunk({
+                "response": "",
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int((prompt_done - started) * 1e9),
+                "eval_count": self.config.ollama_tokens,
+                "eval_duration": int((finished - prompt_done) * 1e9),
+            })
+            self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, message):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--articles-per-feed", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--article-latency", type=float, default=0.05)
+    parser.add_argument("--coingecko-latency", type=float, default=0.05)
+    parser.add_argument("--ollama-first-token", type=float, default=0.5)
+    parser.add_argument("--ollama-tokens", type=int, default=100)
+    parser.add_argument("--ollama-tokens-per-second", type=float, default=50)
+    parser.add_argument("--ollama-parallel", type=int, default=2)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    config = parse_args(argv)
+    FakeUpstreamHandler.config = config
+    FakeUpstreamHandler.ollama_slots = threading.BoundedSemaphore(config.ollama_parallel)
+    server = ThreadingHTTPServer(("127.0.0.1", config.port), FakeUpstreamHandler)
+    server.daemon_threads = True
+    print(f"Fake upstreams listening on http://127.0.0.1:{config.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark of the per-coin loop of get_coins_prices() against the vectorized
+PortfolioFrame engine, at 1k / 10k / 100k positions.
+
+Run from the services/ directory:
+    python -m fetch_crypto.benchmarks.bench_portfolio
+"""
+import random
+import time
+
+from fetch_crypto.main import build_results
+from fetch_crypto.models.crypto import MyCoins, PortfolioLots
+from fetch_crypto.utils.portfolio import PortfolioFrame
+
+SIZES = [1_000, 10_000, 100_000]
+DISTINCT_COINS = 250
+REPEATS = 3
+
+
+def make_portfolio(size, seed=42):
+    rng = random.Random(seed)
+    coin_ids = [f"coin-{i}" for i in range(DISTINCT_COINS)]
+    symbols = [rng.choice(coin_ids) for _ in range(size)]
+    buy_prices = [round(rng.uniform(0.01, 70_000), 2) for _ in range(size)]
+    quantities = [round(rng.uniform(0.001, 10), 3) for _ in range(size)]
+    quotes = {coin_id: {"usd": round(rng.uniform(0.01, 70_000), 2)} for coin_id in coin_ids}
+    return symbols, buy_prices, quantities, quotes
+
+
+def best_of(fn):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_loop(symbols, buy_prices, quotes):
+    # request validation + per-coin dicts, as in get_coins_prices()
+    data = MyCoins(coins=[{"symbol": s, "buy_price": p} for s, p in zip(symbols, buy_prices)])
+    return build_results(data.coins, quotes)
+
+
+def run_vectorized(symbols, buy_prices, quantities, quotes):
+    # request validation + columnar computation, as in get_portfolio_summary()
+    data = PortfolioLots(symbols=symbols, buy_prices=buy_prices, quantities=quantities)
+    return PortfolioFrame(data.symbols, data.buy_prices, data.quantities).summarize(quotes)
+
+
+def main():
+    print(f"{'positions':>10} {'loop (ms)':>12} {'vectorized (ms)':>16} {'speedup':>9}")
+    for size in SIZES:
+        symbols, buy_prices, quantities, quotes = make_portfolio(size)
+        loop = best_of(lambda: run_loop(symbols, buy_prices, quotes))
+        vectorized = best_of(lambda: run_vectorized(symbols, buy_prices, quantities, quotes))
+        print(f"{size:>10} {loop * 1000:>12.1f} {vectorized * 1000:>16.1f} {loop / vectorized:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Sustained load test of /crypto/get_coins_prices against a local CoinGecko
+stand-in with a configurable latency.
+
+fetch_crypto and the stand-in (benchmarks/fake_upstreams.py) run as real
+processes, started with the helpers of benchmarks/e2e.py. By default the
+price cache is off (PRICE_CACHE_TTL=0, PRICE_CACHE_STALE_TTL=0), so every
+request that is not coalesced with a concurrent one waits on the (slow)
+upstream, and every response is saved through the background investment
+writer. For each
+concurrency level, clients keep that many requests in flight for --duration
+seconds; the test reports the sustained requests/sec, the p50/p95/p99
+latency, the errors, and how many CoinGecko calls and history segments the
+service made meanwhile (from its /metrics).
+
+Run from the services/ directory:
+    python -m fetch_crypto.benchmarks.load_test
+    python -m fetch_crypto.benchmarks.load_test --concurrency 16,64,256 --coingecko-latency 0.5
+    python -m fetch_crypto.benchmarks.load_test --price-cache-ttl 30
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import tempfile
+import time
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.e2e import SERVICES_DIR, Processes, free_port, percentiles
+
+
+async def sustain(url, seconds, concurrency, timeout, payload):
+    """Keeps `concurrency` requests in flight for `seconds` and measures every latency."""
+    latencies = []
+    errors = 0
+    stop_at = time.perf_counter() + seconds
+    # one pooled keep-alive connection per client
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                    response.raise_for_status()
+                    response.json()
+                except (httpx.HTTPError, ValueError):
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def scrape(service):
+    """CoinGecko calls and history segments written so far, from the service's /metrics."""
+    counts = {"coingecko_calls": 0, "history_segments": 0}
+    stages = {"coingecko_call": "coingecko_calls", "history_write": "history_segments"}
+    for family in text_string_to_metric_families(httpx.get(f"{service}/metrics", timeout=10).text):
+        for sample in family.samples:
+            if sample.name == "pipeline_stage_seconds_count" and sample.labels.get("stage") in stages:
+                counts[stages[sample.labels["stage"]]] = int(sample.value)
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,16,64,256", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per concurrency level")
+    parser.add_argument("--portfolio-size", type=int, default=20)
+    parser.add_argument("--coingecko-latency", type=float, default=0.2)
+    parser.add_argument("--price-cache-ttl", type=float, default=0)
+    parser.add_argument("--timeout", type=float, default=30, help="client timeout per request")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the service")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    coins = [{"symbol": f"coin-{i}", "buy_price": 10.0 + i} for i in range(args.portfolio_size - 1)]
+    coins.append({"symbol": "nonexistentcoin", "buy_price": 1.0})
+
+    with tempfile.TemporaryDirectory(prefix="fetch-crypto-load-") as workdir:
+        with Processes(workdir, args.verbose) as procs:
+            upstream_port = free_port()
+            upstream = f"http://127.0.0.1:{upstream_port}"
+            procs.start(
+                "fake_upstreams",
+                ["-m", "benchmarks.fake_upstreams", "--port", str(upstream_port),
+                 "--coingecko-latency", str(args.coingecko_latency)],
+                SERVICES_DIR, {}, f"{upstream}/feeds/0.xml",
+            )
+            # the service saves its history under its working directory
+            service = procs.uvicorn(
+                "fetch_crypto", "fetch_crypto.main:app", workdir,
+                {"COINGECKO_PRICE_URL": f"{upstream}/api/v3/simple/price", "COINGECKO_CALLS_PER_MINUTE": "6000000",
+                 "PRICE_CACHE_TTL": str(args.price_cache_ttl), "PRICE_CACHE_STALE_TTL": str(args.price_cache_ttl)},
+                SERVICES_DIR,
+            )
+            print(f"CoinGecko latency {args.coingecko_latency * 1000:.0f} ms, {args.portfolio_size} coins per request, "
+                  f"price cache TTL {args.price_cache_ttl:g}s, {args.duration:g}s per level")
+            print(f"{'concurrency':>11} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                  f"{'p99 ms':>8} {'upstream':>9} {'segments':>9}")
+            for concurrency in levels:
+                before = scrape(service)
+                result = asyncio.run(sustain(
+                    f"{service}/crypto/get_coins_prices", args.duration, concurrency, args.timeout, {"coins": coins},
+                ))
+                after = scrape(service)
+                latency = result["latency_ms"]
+                print(
+                    f"{concurrency:>11} {result['requests']:>9} {result['errors']:>7} {result['throughput_rps']:>8.1f} "
+                    f"{latency.get('p50', 0):>8.1f} {latency.get('p95', 0):>8.1f} {latency.get('p99', 0):>8.1f} "
+                    f"{after['coingecko_calls'] - before['coingecko_calls']:>9} "
+                    f"{after['history_segments'] - before['history_segments']:>9}",
+                    flush=True,
+                )
+        # counted once the service has stopped and flushed its writer
+        history = Path(workdir) / "received_data" / "history"
+        print(f"History segments on disk: {len(list(history.iterdir())) if history.exists() else 0}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,101 @@
-from fetch_crypto.models.crypto import MyCoins, Coin
-from fetch_crypto.utils.storage import save_investments
-from fastapi import FastAPI
-import requests
+from contextlib import asynccontextmanager
+import asyncio
+from fetch_crypto.models.crypto import MyCoins, Coin, PortfolioLots
+from fetch_crypto.utils.storage import InvestmentWriter
+from fetch_crypto.utils.history import HistoryStore
+from fetch_crypto.utils.price_cache import PriceCache
+from fetch_crypto.utils.coingecko import CoinGeckoRejected, CoinGeckoUnavailable, fetch_simple_prices, close_client
+from fetch_crypto.utils.portfolio import PortfolioFrame
+from fetch_crypto.utils.metrics import WRITE_QUEUE, render_metrics
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+
+# shared by all requests, see PriceCache for the TTL / stale-while-revalidate settings
+price_cache = PriceCache(fetch_simple_prices)
+
+# saves the snapshots of get_coins_prices() off the request path
+investment_writer = InvestmentWriter()
+WRITE_QUEUE.set_function(investment_writer.pending)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # finish what a crashed writer or compaction left in the history store
+    await asyncio.to_thread(HistoryStore(investment_writer.filepath).recover)
+    yield
+    await close_client()
+    # write what is still queued before the process exits
+    await asyncio.to_thread(investment_writer.close)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def build_results(coins, received_data):
+    """
+    Computes the per-coin result dictionaries of get_coins_prices().
+
+    Args:
+        coins (list[Coin]): The coins of the portfolio.
+        received_data (dict): CoinGecko simple/price payload, e.g. {"bitcoin": {"usd": 66300.0}}.
+
+    Returns:
+        list: One result (or error) dictionary per coin, in input order.
+    """
+    results = []
+
+    for coin in coins:
+        if coin.symbol not in received_data:
+            results.append({
+                "symbol": coin.symbol,
+                "error": "Not found on CoinGecko"
+            })
+            continue
+
+        if received_data[coin.symbol] is None:
+            results.append({
+                "symbol": coin.symbol,
+                "error": "Price temporarily unavailable"
+            })
+            continue
+
+        current_price = received_data[coin.symbol]["usd"]
+        value_change = current_price - coin.buy_price
+        change_pct = ((current_price - coin.buy_price) / coin.buy_price) * 100
+
+        results.append({
+            "symbol": coin.symbol,
+            "current_price": current_price,
+            "buy_price": coin.buy_price,
+            "value_change": round(value_change, 2),
+            "change_pct": round(change_pct, 2)
+        })
+
+    return results
+
+
+async def get_prices(symbols):
+    """
+    The prices of the symbols from the price cache. A CoinGecko outage is
+    answered with a 503, a request CoinGecko refused with a 502.
+    """
+    try:
+        return await price_cache.get_prices(symbols)
+    except CoinGeckoUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"CoinGecko is unavailable: {e}")
+    except CoinGeckoRejected as e:
+        raise HTTPException(status_code=502, detail=f"CoinGecko refused the request: {e}")
 
-app = FastAPI()
 
 # endpoint
 @app.post("/crypto/get_coins_prices")
 
-def get_coins_prices(data: MyCoins):
+async def get_coins_prices(data: MyCoins):
     """
     Processes a portfolio of cryptocurrency investments, fetches real-time prices 
     from the CoinGecko API, calculates performance metrics, and saves results.
+    Nothing blocks the event loop: prices come over the shared async CoinGecko
+    client, and the results are handed to the background investment writer.
 
     Args:
         data (MyCoins): An object containing a list of coins, 
@@ -25,7 +109,10 @@ def get_coins_prices(data: MyCoins):
                 - buy_price (float): The user's recorded purchase price.
                 - value_change (float): Difference between current and buy price.
                 - change_pct (float): Percentage change from buy price.
-              If a symbol is not found, an error message is returned instead.
+              If a symbol is not found, or its price could not be fetched
+              (its CoinGecko batch failed after retries), an error message
+              is returned instead. When no price at all could be fetched, the
+              request fails with HTTP 503 (CoinGecko down) or 502 (request refused).
 
     Example return:
         {
@@ -46,39 +133,48 @@ def get_coins_prices(data: MyCoins):
     """
     # extract symbols from request
     symbols = [coin.symbol for coin in data.coins]
-    symbols_str = ",".join(symbols)
 
-    # fetch prices from CoinGecko
-    url = f"https://api.coingecko.com/api/v3/simple/price?ids={symbols_str}&vs_currencies=usd"
-    response = requests.get(url)
-    received_data = response.json()
+    # fetch prices from CoinGecko (through the in-process price cache)
+    received_data = await get_prices(symbols)
 
-    results = []
+    results = build_results(data.coins, received_data)
 
-    for coin in data.coins:
-        if coin.symbol not in received_data:
-            results.append({
-                "symbol": coin.symbol,
-                "error": "Not found on CoinGecko"
-            })
-            continue
+    investment_writer.submit(results)
 
-        current_price = received_data[coin.symbol]["usd"]
-        value_change = current_price - coin.buy_price
-        change_pct = ((current_price - coin.buy_price) / coin.buy_price) * 100
+    return {"results": results}
 
-        results.append({
-            "symbol": coin.symbol,
-            "current_price": current_price,
-            "buy_price": coin.buy_price,
-            "value_change": round(value_change, 2),
-            "change_pct": round(change_pct, 2)
-        })
 
-    
-    save_investments(results)
+@app.post("/crypto/get_portfolio_summary")
+async def get_portfolio_summary(data: PortfolioLots):
+    """
+    Columnar variant of get_coins_prices() for large portfolios (tens of thousands
+    of lots). Lots are joined against the fetched prices and aggregated per coin
+    in one vectorized pass, on the threadpool.
 
-    return {"results": results}
+    Args:
+        data (PortfolioLots): Parallel lists of symbols, buy prices and (optional) quantities.
+
+    Returns:
+        dict: {
+            "coins": [{"symbol", "quantity", "cost_basis", "market_value", "pnl", "pnl_pct"}, ...],
+            "totals": {"lots", "cost_basis", "market_value", "pnl", "pnl_pct"},
+            "not_found": [symbols unknown to CoinGecko],
+            "unavailable": [symbols whose price is temporarily unavailable]
+        }
+    """
+    frame = await run_in_threadpool(PortfolioFrame, data.symbols, data.buy_prices, data.quantities)
+    received_data = await get_prices(frame.symbols.tolist())
+    return await run_in_threadpool(frame.summarize, received_data)
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: CoinGecko call latency, retries and failures, price cache hits,
+    and the background writer's queue depth, write latency and failures.
+    """
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 
 if __name__ == "__main__":
@@ -90,6 +186,13 @@ if __name__ == "__main__":
         ]
     )
 
-    results = get_coins_prices(my_coins)
+    async def run_once():
+        try:
+            return await get_coins_prices(my_coins)
+        finally:
+            await close_client()
+
+    results = asyncio.run(run_once())
+    investment_writer.close()
 
     print("Saved results:", results)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 
 class Coin(BaseModel):
     symbol: str
@@ -6,3 +6,19 @@ class Coin(BaseModel):
 
 class MyCoins(BaseModel):
     coins: list[Coin]
+
+class PortfolioLots(BaseModel):
+    """Columnar portfolio for large position lists: one entry per lot in each list."""
+    symbols: list[str]
+    buy_prices: list[float]
+    quantities: list[float] | None = None
+
+    @model_validator(mode="after")
+    def check_columns(self):
+        if len(self.buy_prices) != len(self.symbols):
+            raise ValueError("symbols and buy_prices must have the same length")
+        if self.quantities is not None and len(self.quantities) != len(self.symbols):
+            raise ValueError("symbols and quantities must have the same length")
+        if any(price <= 0 for price in self.buy_prices):
+            raise ValueError("buy_prices must be positive")
+        return self
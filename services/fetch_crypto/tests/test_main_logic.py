@@ -1,7 +1,11 @@
+import asyncio
+import httpx
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock
 from fetch_crypto.main import get_coins_prices
 from fetch_crypto.models.crypto import MyCoins, Coin
+from fetch_crypto.utils.coingecko import TokenBucket, fetch_simple_prices
+from fetch_crypto.utils.price_cache import PriceCache
 
 """
 Unit Test for the main business logic.
@@ -10,9 +14,15 @@ Ensures correct computation of value_change and change_pct,
 and fallback behavior for invalid symbols.
 """
 
-@patch("fetch_crypto.main.save_investments")
-@patch("fetch_crypto.main.requests.get")
-def test_get_coins_prices_logic(mock_requests, mock_save):
+
+def mock_coingecko(handler):
+    """A CoinGecko client whose requests are answered by handler(request) -> httpx.Response."""
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@patch("fetch_crypto.main.investment_writer")
+@patch("fetch_crypto.main.price_cache", PriceCache(fetch_simple_prices))
+def test_get_coins_prices_logic(mock_writer):
     # Arrange
     coins = MyCoins(coins=[
         Coin(symbol="bitcoin", buy_price=47000),
@@ -20,13 +30,15 @@ def test_get_coins_prices_logic(mock_requests, mock_save):
     ])
     
     # Fake response from CoinGecko
-    mock_requests.return_value = MagicMock(status_code=200)
-    mock_requests.return_value.json.return_value = {
-        "bitcoin": {"usd": 66300}
-    }
+    requests = []
+
+    def fake_coingecko(request):
+        requests.append(request)
+        return httpx.Response(200, json={"bitcoin": {"usd": 66300}})
 
     # Act
-    result = get_coins_prices(coins)
+    with patch("fetch_crypto.utils.coingecko._client", mock_coingecko(fake_coingecko)):
+        result = asyncio.run(get_coins_prices(coins))
 
     # Assert
     expected = {
@@ -46,4 +58,228 @@ def test_get_coins_prices_logic(mock_requests, mock_save):
     }
 
     assert result == expected
-    mock_save.assert_called_once_with(expected["results"])
+    assert len(requests) == 1
+    # Saving is left to the background writer
+    mock_writer.submit.assert_called_once_with(expected["results"])
+
+
+@patch("fetch_crypto.utils.coingecko.asyncio.sleep", new_callable=AsyncMock)
+@patch("fetch_crypto.main.investment_writer")
+@patch("fetch_crypto.main.price_cache", PriceCache(fetch_simple_prices))
+def test_get_coins_prices_reports_a_coingecko_outage(mock_writer, mock_sleep):
+    from fastapi import HTTPException
+
+    def down(request):
+        return httpx.Response(503)
+
+    coins = MyCoins(coins=[Coin(symbol="bitcoin", buy_price=47000)])
+    with patch("fetch_crypto.utils.coingecko._client", mock_coingecko(down)), \
+         patch("fetch_crypto.utils.coingecko.rate_limiter", TokenBucket(6000, capacity=1000)), \
+         pytest.raises(HTTPException) as error:
+        asyncio.run(get_coins_prices(coins))
+
+    assert error.value.status_code == 503
+    mock_writer.submit.assert_not_called()
+
+
+@patch("fetch_crypto.main.investment_writer")
+@patch("fetch_crypto.main.price_cache", PriceCache(fetch_simple_prices))
+def test_get_coins_prices_reports_refused_batches(mock_writer):
+    from fastapi import HTTPException
+    from fetch_crypto.utils import coingecko
+
+    requests = []
+
+    def refused(request):
+        requests.append(request)
+        return httpx.Response(401)
+
+    # every batch of a large portfolio is refused
+    coins = MyCoins(coins=[Coin(symbol=f"coin-{i:03d}", buy_price=1.0) for i in range(60)])
+    with patch("fetch_crypto.utils.coingecko._client", mock_coingecko(refused)), \
+         patch("fetch_crypto.utils.coingecko.COINGECKO_MAX_URL_LENGTH", 300), \
+         patch("fetch_crypto.utils.coingecko.rate_limiter", TokenBucket(6000, capacity=1000)), \
+         pytest.raises(HTTPException) as error:
+        asyncio.run(get_coins_prices(coins))
+
+    assert len(requests) == len(coingecko.split_into_batches([c.symbol for c in coins.coins], 300)) > 1
+    assert error.value.status_code == 502
+    mock_writer.submit.assert_not_called()
+
+
+def test_price_cache_ttl_and_singleflight():
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def fake_fetch(ids):
+            calls.append(list(ids))
+            await asyncio.wait_for(release.wait(), 5)
+            return {"bitcoin": {"usd": 66300}}
+
+        cache = PriceCache(fake_fetch, ttl=60, stale_ttl=60)
+
+        # Two concurrent requests for the same ids -> a single upstream fetch
+        first = asyncio.create_task(cache.get_prices(["bitcoin", "nonexistent"]))
+        await asyncio.sleep(0.1)
+        second = asyncio.create_task(cache.get_prices(["bitcoin", "nonexistent"]))
+        await asyncio.sleep(0.1)
+        release.set()
+        results = await asyncio.gather(first, second)
+
+        assert calls == [["bitcoin", "nonexistent"]]
+        assert results == [{"bitcoin": {"usd": 66300}}] * 2
+
+        # Within the TTL (unknown coins included) nothing is fetched again
+        assert await cache.get_prices(["bitcoin", "nonexistent"]) == {"bitcoin": {"usd": 66300}}
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_price_cache_serves_stale_while_revalidating():
+    prices = iter([100, 200])
+
+    async def scenario():
+        refreshed = asyncio.Event()
+
+        async def fake_fetch(ids):
+            price = next(prices)
+            if price == 200:
+                refreshed.set()
+            return {"bitcoin": {"usd": price}}
+
+        cache = PriceCache(fake_fetch, ttl=0, stale_ttl=60)
+        assert await cache.get_prices(["bitcoin"]) == {"bitcoin": {"usd": 100}}
+
+        # Expired but still within stale_ttl: the old price is served and refreshed in the background
+        assert await cache.get_prices(["bitcoin"]) == {"bitcoin": {"usd": 100}}
+        await asyncio.wait_for(refreshed.wait(), 5)
+
+    asyncio.run(scenario())
+
+
+def test_price_cache_is_bounded_and_forgets_unknown_ids():
+    calls = []
+
+    async def scenario():
+        async def fake_fetch(ids):
+            calls.append(list(ids))
+            return {coin_id: {"usd": 1.0} for coin_id in ids if not coin_id.startswith("unknown")}
+
+        cache = PriceCache(fake_fetch, ttl=60, stale_ttl=60, not_found_ttl=0, max_entries=2)
+        await cache.get_prices(["bitcoin"])
+        await cache.get_prices(["ethereum"])
+        await cache.get_prices(["bitcoin"])  # bitcoin is now the most recently used
+        await cache.get_prices(["solana"])
+        assert list(cache._entries) == ["bitcoin", "solana"]
+
+        # Unknown ids are cached for not_found_ttl only
+        assert await cache.get_prices(["unknown-1"]) == {}
+        await asyncio.sleep(0.01)
+        assert await cache.get_prices(["unknown-1"]) == {}
+        assert calls[-2:] == [["unknown-1"], ["unknown-1"]]
+        assert len(cache._entries) == 2
+
+    asyncio.run(scenario())
+
+
+def test_price_cache_waiters_share_the_fetch_error():
+    async def scenario():
+        async def failing_fetch(ids):
+            await asyncio.sleep(0.05)
+            raise RuntimeError("CoinGecko down")
+
+        cache = PriceCache(failing_fetch, ttl=60, stale_ttl=60)
+        results = await asyncio.gather(
+            cache.get_prices(["bitcoin"]), cache.get_prices(["bitcoin"]), return_exceptions=True
+        )
+
+        assert [str(r) for r in results] == ["CoinGecko down"] * 2
+        assert cache.upstream_calls == 1
+        # Nothing is left in flight: the next request fetches again
+        assert cache._inflight == {}
+
+    asyncio.run(scenario())
+
+
+@patch("fetch_crypto.utils.coingecko.asyncio.sleep", new_callable=AsyncMock)
+def test_fetch_simple_prices_batches_and_retries_per_batch(mock_sleep):
+    from urllib.parse import urlparse, parse_qs
+    from fetch_crypto.utils import coingecko
+    from fetch_crypto.utils.metrics import METRICS_REGISTRY
+
+    ids = [f"coin-{i:03d}" for i in range(300)]
+    batches = coingecko.split_into_batches(ids, max_url_length=500)
+
+    # Every id is kept once, in order, and every URL fits the limit
+    assert [coin_id for batch in batches for coin_id in batch] == ids
+    assert all(len(coingecko._price_url(batch)) <= 500 for batch in batches)
+    assert len(batches) > 1
+
+    throttled = {batches[1][0]: 1}
+
+    requests = []
+
+    def fake_coingecko(request):
+        requests.append(request)
+        batch_ids = parse_qs(urlparse(str(request.url)).query)["ids"][0].split(",")
+        # The second batch is throttled once, then succeeds
+        if throttled.get(batch_ids[0]):
+            throttled[batch_ids[0]] -= 1
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        return httpx.Response(200, json={coin_id: {"usd": 1.0} for coin_id in batch_ids})
+
+    def retries():
+        return METRICS_REGISTRY.get_sample_value("pipeline_retries_total", {"stage": "coingecko_call"}) or 0
+
+    retries_before = retries()
+
+    with patch("fetch_crypto.utils.coingecko.COINGECKO_MAX_URL_LENGTH", 500), \
+         patch("fetch_crypto.utils.coingecko.rate_limiter", coingecko.TokenBucket(6000, capacity=1000)), \
+         patch("fetch_crypto.utils.coingecko._client", mock_coingecko(fake_coingecko)):
+        prices = asyncio.run(coingecko.fetch_simple_prices(ids))
+
+    assert set(prices) == set(ids)
+    assert len(requests) == len(batches) + 1
+    mock_sleep.assert_called_once_with(1.0)
+    # The throttled attempt is counted as a retry on /metrics
+    assert retries() == retries_before + 1
+
+
+def test_portfolio_frame_matches_loop_and_aggregates_lots():
+    from fetch_crypto.main import build_results
+    from fetch_crypto.utils.portfolio import PortfolioFrame
+
+    quotes = {"bitcoin": {"usd": 66300}, "ethereum": {"usd": 3000}}
+    coins = [
+        Coin(symbol="bitcoin", buy_price=47000),
+        Coin(symbol="ethereum", buy_price=3100),
+        Coin(symbol="bitcoin", buy_price=60000),
+    ]
+
+    # Per-lot figures agree with the per-coin loop
+    lots = PortfolioFrame.from_coins(coins).compute(quotes)["lots"]
+    expected = build_results(coins, quotes)
+    assert [round(v, 2) for v in lots["value_change"].tolist()] == [r["value_change"] for r in expected]
+    assert [round(v, 2) for v in lots["change_pct"].tolist()] == [r["change_pct"] for r in expected]
+
+    # Lots of the same coin are aggregated, weighted by quantity
+    frame = PortfolioFrame(["bitcoin", "bitcoin", "ethereum", "unknown"], [47000, 60000, 3100, 1], [1, 0.5, 2, 3])
+    summary = frame.summarize(quotes)
+
+    bitcoin = next(c for c in summary["coins"] if c["symbol"] == "bitcoin")
+    assert bitcoin["quantity"] == 1.5
+    assert bitcoin["cost_basis"] == 77000.0
+    assert bitcoin["market_value"] == 99450.0
+    assert bitcoin["pnl"] == 22450.0
+    assert summary["not_found"] == ["unknown"]
+    assert summary["totals"]["lots"] == 4
+    assert summary["totals"]["pnl"] == 22450.0 - 200.0
+
+    # A coin whose batch failed is unavailable, not unknown
+    summary = frame.summarize({**quotes, "ethereum": None})
+    assert summary["not_found"] == ["unknown"]
+    assert summary["unavailable"] == ["ethereum"]
+    assert [c["symbol"] for c in summary["coins"]] == ["bitcoin"]
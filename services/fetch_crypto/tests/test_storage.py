@@ -0,0 +1,167 @@
+from datetime import datetime, timezone
+import threading
+from unittest.mock import patch
+from fetch_crypto.utils.storage import InvestmentWriter, load_investments, save_investments
+
+"""
+Unit Test for the append-only history store behind save_investments/load_investments.
+Ensures snapshots are kept, and that time-range and per-symbol queries
+return only the requested rows.
+"""
+
+def test_save_appends_snapshots_and_load_queries_ranges(tmp_path):
+    store = tmp_path / "history"
+    day = lambda d: datetime(2025, 7, d, 15, 0, tzinfo=timezone.utc)
+
+    for d, btc in [(1, 60000.0), (2, 61000.0), (3, 62000.0)]:
+        save_investments([
+            {"symbol": "bitcoin", "current_price": btc, "buy_price": 47000, "value_change": btc - 47000, "change_pct": 1.0},
+            {"symbol": "ethereum", "current_price": 3000.0, "buy_price": 3100, "value_change": -100.0, "change_pct": -3.23},
+            {"symbol": "nonexistent", "error": "Not found on CoinGecko"},
+        ], filepath=store, timestamp=day(d))
+
+    # Default: the latest snapshot only (errors are not stored)
+    latest = load_investments(store)
+    assert [(r["symbol"], r["current_price"]) for r in latest] == [("bitcoin", 62000.0), ("ethereum", 3000.0)]
+    assert latest[0]["timestamp"] == "2025-07-03T15:00:00+00:00"
+
+    # Time range + symbol filter
+    rows = load_investments(store, start=day(1), end="2025-07-02T23:59:59+00:00", symbols=["bitcoin"])
+    assert [r["current_price"] for r in rows] == [60000.0, 61000.0]
+    assert {r["symbol"] for r in rows} == {"bitcoin"}
+
+    # No leftovers from the atomic segment writes
+    assert not [p for p in store.iterdir() if p.name.startswith(".")]
+
+
+def test_small_appends_are_compacted(tmp_path):
+    from fetch_crypto.utils.history import HistoryStore
+
+    store = HistoryStore(tmp_path / "history")
+    minute = lambda m: datetime(2025, 7, 1, 15, m, tzinfo=timezone.utc)
+    for m in range(20):
+        store.append([
+            {"symbol": "bitcoin", "current_price": 100.0 + m, "buy_price": 90.0, "value_change": 10.0 + m, "change_pct": 1.0},
+            {"symbol": "ethereum", "current_price": 10.0 + m, "buy_price": 9.0, "value_change": 1.0 + m, "change_pct": 2.0},
+        ], timestamp=minute(m))
+
+    # The 16th append merged the first 16 segments; the 4 later ones are still separate
+    segments = store._segments()
+    assert len(segments) == 5
+    assert [HistoryStore._rows(path) for _, _, path in segments] == [32, 2, 2, 2, 2]
+    assert store.compact(min_segments=2) == 5
+    assert len(store._segments()) == 1
+
+    # Nothing is lost, duplicated or reordered, and no hidden leftovers remain
+    rows = load_investments(store.root, start=minute(0), end=minute(59))
+    assert [(r["timestamp"], r["symbol"], r["current_price"]) for r in rows] == [
+        (minute(m).isoformat(), symbol, price + m) for m in range(20) for symbol, price in [("bitcoin", 100.0), ("ethereum", 10.0)]
+    ]
+    assert [r["symbol"] for r in load_investments(store.root, symbols=["ethereum"], start=minute(19), end=minute(19))] == ["ethereum"]
+    assert not [p for p in store.root.iterdir() if p.name.startswith(".")]
+
+
+def test_interrupted_compaction_loses_and_duplicates_nothing(tmp_path):
+    import shutil
+    from fetch_crypto.utils.history import HistoryStore
+
+    store = HistoryStore(tmp_path / "history")
+    minute = lambda m: datetime(2025, 7, 1, 15, m, tzinfo=timezone.utc)
+    row = lambda price: {"symbol": "bitcoin", "current_price": price, "buy_price": 90.0, "value_change": 0.0, "change_pct": 0.0}
+    for m in range(3):
+        store.append([row(100.0 + m)], timestamp=minute(m))
+    prices = lambda: [r["current_price"] for r in load_investments(store.root, start=minute(0), end=minute(59))]
+
+    # Crash after the merged segment was published, before the merged ones were deleted
+    with patch("fetch_crypto.utils.history.shutil.rmtree"):
+        assert store.compact(min_segments=2) == 3
+    assert len(store._segments()) == 1 and len(list(store.root.iterdir())) == 4
+    assert prices() == [100.0, 101.0, 102.0]
+    assert store.recover() == 3
+    assert len(list(store.root.iterdir())) == 1 and prices() == [100.0, 101.0, 102.0]
+
+    # Abandoned temporary segments are deleted
+    tmp_dir = store._write_segment([0], ["bitcoin"], {name: [0.0] for name in ["current_price", "buy_price", "value_change", "change_pct"]})
+    with patch("fetch_crypto.utils.history._COMPACT_LOCK_TIMEOUT", -1):
+        assert store.recover() == 1
+    assert not tmp_dir.exists() and prices() == [100.0, 101.0, 102.0]
+    shutil.rmtree(store.root)
+    assert store.recover() == 0
+
+
+def test_latest_timestamp_with_overlapping_segments(tmp_path):
+    from fetch_crypto.utils.history import HistoryStore
+
+    store = HistoryStore(tmp_path / "history")
+    minute = lambda m: datetime(2025, 7, 1, 15, m, tzinfo=timezone.utc)
+    row = {"symbol": "bitcoin", "current_price": 1.0, "buy_price": 1.0, "value_change": 0.0, "change_pct": 0.0}
+    # one writer's batch spans minutes 0-10, another's ends at minute 5
+    store.append_snapshots([([row], minute(0)), ([row], minute(10))])
+    store.append_snapshots([([row], minute(1)), ([row], minute(5))])
+    assert store._segments()[-1][1] < store._segments()[0][1]
+    assert store.latest_timestamp() == minute(10)
+    # rows of overlapping segments come back in time order
+    rows = load_investments(store.root, start=minute(0), end=minute(59))
+    assert [r["timestamp"] for r in rows] == [minute(m).isoformat() for m in (0, 1, 5, 10)]
+
+
+def test_load_without_history_returns_empty_list(tmp_path):
+    assert load_investments(tmp_path / "missing") == []
+
+
+def test_investment_writer_buffers_across_requests(tmp_path):
+    store = tmp_path / "history"
+    minute = lambda m: datetime(2025, 7, 1, 15, m, tzinfo=timezone.utc)
+    row = lambda price: {"symbol": "bitcoin", "current_price": price, "buy_price": 47000, "value_change": 0.0, "change_pct": 0.0}
+
+    # Size threshold: snapshots of several requests go into one segment once they hold flush_rows rows
+    writer = InvestmentWriter(store, flush_rows=3, flush_interval=3600)
+    with patch("fetch_crypto.utils.storage.HistoryStore.append_snapshots", side_effect=lambda batch: 0) as append:
+        for m in range(5):
+            assert writer.submit([row(float(m))], minute(m))
+        # Snapshots without prices are not queued at all
+        assert writer.submit([{"symbol": "nonexistent", "error": "Not found on CoinGecko"}])
+        writer.flush()
+    assert [len(call.args[0]) for call in append.call_args_list] == [3, 2]
+    assert writer.stats()["submitted"] == 5
+    writer.close()
+
+    # Time threshold: a lone snapshot is written flush_interval after it was buffered
+    written = threading.Event()
+    writer = InvestmentWriter(store, flush_rows=1000, flush_interval=0.05)
+    with patch("fetch_crypto.utils.storage.HistoryStore.append_snapshots", side_effect=lambda batch: written.set() or 0):
+        writer.submit([row(1.0)], minute(0))
+        assert written.wait(5)
+    writer.close()
+
+    # A full queue drops new snapshots instead of blocking the caller
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_append(batch):
+        writing.set()
+        release.wait(5)
+        return 0
+
+    writer = InvestmentWriter(store, max_queue=2, flush_rows=1)
+    with patch("fetch_crypto.utils.storage.HistoryStore.append_snapshots", side_effect=slow_append) as append:
+        assert writer.submit([row(1.0)], minute(0))
+        assert writing.wait(5)
+        assert writer.submit([row(2.0)], minute(1))
+        assert writer.submit([row(3.0)], minute(2))
+        assert not writer.submit([row(4.0)], minute(3))
+        release.set()
+        writer.flush()
+    assert append.call_count == 3
+    assert writer.stats()["dropped"] == 1
+    writer.close()
+
+    # close() writes what is buffered; every snapshot keeps its own timestamp
+    writer = InvestmentWriter(store, flush_interval=3600)
+    for m in (4, 5):
+        writer.submit([row(10.0 + m)], minute(m))
+    writer.close()
+    rows = load_investments(store, start=minute(0), end=minute(59))
+    assert [(r["timestamp"], r["current_price"]) for r in rows] == [
+        (minute(4).isoformat(), 14.0), (minute(5).isoformat(), 15.0),
+    ]
+    assert writer.stats()["segments"] == 1
@@ -0,0 +1,210 @@
+from urllib.parse import quote
+import asyncio
+import os
+import random
+import time
+import httpx
+from fetch_crypto.utils.metrics import STAGE_SECONDS, RETRIES, FAILURES
+
+COINGECKO_PRICE_URL = os.getenv("COINGECKO_PRICE_URL", "https://api.coingecko.com/api/v3/simple/price")
+
+# Keep request URLs well under the common 2048-character limit
+COINGECKO_MAX_URL_LENGTH = int(os.getenv("COINGECKO_MAX_URL_LENGTH", "2000"))
+# Number of batches fetched in parallel
+COINGECKO_MAX_CONCURRENCY = int(os.getenv("COINGECKO_MAX_CONCURRENCY", "4"))
+# Request budget of the API plan (the public API allows roughly 30 calls per minute)
+COINGECKO_CALLS_PER_MINUTE = float(os.getenv("COINGECKO_CALLS_PER_MINUTE", "30"))
+COINGECKO_RETRIES = int(os.getenv("COINGECKO_RETRIES", "3"))
+# Seconds per attempt to read the answer (and to wait for a pooled connection), and to connect
+COINGECKO_TIMEOUT = float(os.getenv("COINGECKO_TIMEOUT", "10"))
+COINGECKO_CONNECT_TIMEOUT = float(os.getenv("COINGECKO_CONNECT_TIMEOUT", "5"))
+# Connection pool of the shared CoinGecko client
+COINGECKO_MAX_CONNECTIONS = int(os.getenv("COINGECKO_MAX_CONNECTIONS", "20"))
+COINGECKO_MAX_KEEPALIVE = int(os.getenv("COINGECKO_MAX_KEEPALIVE", "10"))
+
+
+class CoinGeckoUnavailable(RuntimeError):
+    """CoinGecko kept failing (429, 5xx or network errors) after the retries."""
+
+
+class CoinGeckoRejected(RuntimeError):
+    """CoinGecko refused the request with a 4xx other than 429 (not retried)."""
+
+
+class TokenBucket:
+    """
+    Token bucket of the event loop: allows `rate_per_minute` calls per minute
+    on average, with bursts of up to `capacity` calls.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        """Waits until a token is available."""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+rate_limiter = TokenBucket(COINGECKO_CALLS_PER_MINUTE)
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the shared CoinGecko client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(COINGECKO_TIMEOUT, connect=COINGECKO_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=COINGECKO_MAX_CONNECTIONS, max_keepalive_connections=COINGECKO_MAX_KEEPALIVE
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """Closes the shared client and its connection pool (called from the app lifespan)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _price_url(ids):
+    return f"{COINGECKO_PRICE_URL}?ids={quote(','.join(ids), safe=',')}&vs_currencies=usd"
+
+
+def split_into_batches(ids, max_url_length=None):
+    """
+    Splits coin ids into batches whose simple/price URL stays under max_url_length.
+
+    Args:
+        ids (list[str]): CoinGecko coin ids.
+        max_url_length (int, optional): Maximum length of a request URL.
+                                        Defaults to COINGECKO_MAX_URL_LENGTH.
+
+    Returns:
+        list[list[str]]: Batches of ids, in input order.
+    """
+    max_url_length = max_url_length or COINGECKO_MAX_URL_LENGTH
+    base_length = len(_price_url([]))
+    batches = []
+    current, length = [], base_length
+
+    for coin_id in dict.fromkeys(ids):
+        id_length = len(quote(coin_id, safe="")) + (1 if current else 0)
+        if current and length + id_length > max_url_length:
+            batches.append(current)
+            current, length = [], base_length
+            id_length -= 1
+        current.append(coin_id)
+        length += id_length
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    # exponential backoff with jitter: ~1s, 2s, 4s...
+    return (2 ** attempt) * (0.5 + random.random() / 2)
+
+
+async def fetch_batch(ids, retries=COINGECKO_RETRIES):
+    """
+    Fetches the prices of one batch, retrying on 429/5xx and network errors.
+    Every attempt takes a token from the shared rate limiter.
+
+    Returns:
+        dict: The simple/price payload for the batch.
+
+    Raises:
+        CoinGeckoUnavailable: When the last attempt failed too.
+        CoinGeckoRejected: When CoinGecko answered with a 4xx other than 429.
+    """
+    url = _price_url(ids)
+    for attempt in range(retries + 1):
+        if attempt:
+            RETRIES.labels("coingecko_call").inc()
+        await rate_limiter.acquire()
+        response = None
+        try:
+            with STAGE_SECONDS.labels("coingecko_call").time():
+                response = await get_client().get(url)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response.json()
+            error = f"HTTP {response.status_code}"
+        except httpx.HTTPStatusError as e:
+            FAILURES.labels("coingecko_call").inc()
+            raise CoinGeckoRejected(f"CoinGecko batch of {len(ids)} ids was refused: HTTP {e.response.status_code}") from e
+        except httpx.HTTPError as e:
+            error = repr(e)
+
+        if attempt == retries:
+            FAILURES.labels("coingecko_call").inc()
+            raise CoinGeckoUnavailable(f"CoinGecko batch of {len(ids)} ids failed after {retries + 1} attempts: {error}")
+        delay = _retry_delay(response, attempt)
+        print(f"CoinGecko batch of {len(ids)} ids failed ({error}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+async def fetch_simple_prices(ids):
+    """
+    Fetches the current USD prices of the given coin ids from CoinGecko.
+    Large id lists are split into URL-length-safe batches fetched concurrently
+    (at most COINGECKO_MAX_CONCURRENCY at a time) over the shared client; a
+    batch that still fails after its retries only loses its own coins.
+
+    Args:
+        ids (list[str]): CoinGecko coin ids (e.g., ["bitcoin", "ethereum"]).
+
+    Returns:
+        dict: The simple/price payload, e.g. {"bitcoin": {"usd": 66300.0}}.
+              Unknown ids are missing from the payload; ids of batches that
+              failed after their retries map to None.
+
+    Raises:
+        CoinGeckoUnavailable, CoinGeckoRejected: The error of the first batch, when every batch failed.
+    """
+    batches = split_into_batches(ids)
+    if not batches:
+        return {}
+    if len(batches) == 1:
+        return await fetch_batch(batches[0])
+
+    semaphore = asyncio.Semaphore(COINGECKO_MAX_CONCURRENCY)
+
+    async def fetch(batch):
+        async with semaphore:
+            return await fetch_batch(batch)
+
+    outcomes = await asyncio.gather(*(fetch(batch) for batch in batches), return_exceptions=True)
+
+    prices = {}
+    failures = []
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, Exception):
+            failures.append(outcome)
+            prices.update(dict.fromkeys(batch))
+            print(f"Skipping {len(batch)} coins: {outcome}")
+        else:
+            prices.update(outcome)
+
+    if len(failures) == len(batches):
+        raise failures[0]
+    return prices
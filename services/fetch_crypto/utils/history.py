@@ -0,0 +1,332 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+
+# Numeric columns of a snapshot row, stored as one .npy file each
+FLOAT_COLUMNS = ["current_price", "buy_price", "value_change", "change_pct"]
+
+# Segments of fewer rows are "small": once HISTORY_COMPACT_SEGMENTS of them follow
+# the last large segment, an append merges them into one
+HISTORY_SMALL_SEGMENT_ROWS = int(os.getenv("HISTORY_SMALL_SEGMENT_ROWS", "10000"))
+HISTORY_COMPACT_SEGMENTS = int(os.getenv("HISTORY_COMPACT_SEGMENTS", "16"))
+# A compaction lock or temporary segment older than this is left over from a crashed process
+_COMPACT_LOCK_TIMEOUT = 600
+# Written into a merged segment: the names of the segments it replaces
+_REPLACES_FILE = "replaces.json"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(value):
+    """Converts a datetime (naive = UTC) or ISO-8601 string to microseconds since the epoch."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_micros(micros):
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+class HistoryStore:
+    """
+    Append-only time-series store for price / P&L snapshots.
+
+    Every append writes one immutable segment directory with one binary .npy
+    column per field (timestamps as int64 microseconds, symbols as int32 codes
+    into the segment's symbols.json, prices as float64). Segments are written
+    to a hidden temporary directory and renamed into place, so readers never
+    see a half-written segment. Segment names carry their first and last
+    timestamp, which serves as the timestamp index: a time-range query opens
+    only the overlapping segments, memory-maps their columns and slices them
+    with a binary search on the (sorted) timestamp column.
+
+    Frequent small appends are compacted: the run of small segments after
+    the last large one is merged into a single segment (see compact()), so
+    the number of segments grows with the data, not with the appends. A
+    merged segment lists the segments it replaces, which readers skip until
+    they are deleted; recover() finishes what a crashed process left behind.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _segments(self, start=None, end=None):
+        if not self.root.exists():
+            return []
+        segments, replaced = [], set()
+        for path in self.root.iterdir():
+            if path.name.startswith(".") or not path.is_dir():
+                continue
+            replaced.update(self._replaces(path))
+            first, last, _ = path.name.split("-", 2)
+            first, last = int(first), int(last)
+            if (start is not None and last < start) or (end is not None and first > end):
+                continue
+            segments.append((first, last, path))
+        return sorted(segment for segment in segments if segment[2].name not in replaced)
+
+    @staticmethod
+    def _replaces(path):
+        """Names of the segments a merged segment replaces (none for an appended one)."""
+        try:
+            with open(path / _REPLACES_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def append(self, rows, timestamp=None):
+        """
+        Appends rows as a new segment.
+
+        Args:
+            rows (list[dict]): Rows with "symbol" and the FLOAT_COLUMNS fields.
+            timestamp (datetime, optional): Snapshot time of all rows. Defaults to now (UTC).
+
+        Returns:
+            int: Number of rows written.
+        """
+        return self.append_snapshots([(rows, timestamp)])
+
+    def append_snapshots(self, snapshots):
+        """
+        Appends several snapshots as one segment, e.g. the snapshots a writer
+        has queued up, so a burst of them costs one segment write.
+
+        Args:
+            snapshots (list[tuple]): (rows, timestamp) pairs, as taken by append().
+
+        Returns:
+            int: Number of rows written.
+        """
+        now = datetime.now(timezone.utc)
+        stamped = sorted(
+            ((to_micros(timestamp or now), rows) for rows, timestamp in snapshots if rows), key=lambda s: s[0]
+        )
+        rows = [row for _, snapshot in stamped for row in snapshot]
+        if not rows:
+            return 0
+        timestamps = np.concatenate([np.full(len(snapshot), ts, dtype=np.int64) for ts, snapshot in stamped])
+
+        self._publish(self._write_segment(timestamps, [row["symbol"] for row in rows],
+                                          {name: [row[name] for row in rows] for name in FLOAT_COLUMNS}))
+        try:
+            self.compact()
+        except OSError as e:
+            print(f"History compaction of {self.root} failed: {e}")
+        return len(rows)
+
+    def _write_segment(self, timestamps, symbol_names, floats, replaces=()):
+        """
+        Writes a segment to a hidden temporary directory and returns it (see _publish).
+        replaces: names of the segments the new one merges.
+        """
+        symbols = sorted(set(symbol_names))
+        codes = {symbol: i for i, symbol in enumerate(symbols)}
+        columns = {
+            "timestamp": np.asarray(timestamps, dtype=np.int64),
+            "symbol": np.array([codes[symbol] for symbol in symbol_names], dtype=np.int32),
+        }
+        for name in FLOAT_COLUMNS:
+            columns[name] = np.asarray(floats[name], dtype=np.float64)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.root / f".tmp-{uuid.uuid4().hex[:8]}"
+        tmp_dir.mkdir()
+        try:
+            for name, values in columns.items():
+                with open(tmp_dir / f"{name}.npy", "wb") as f:
+                    np.save(f, values)
+                    f.flush()
+                    os.fsync(f.fileno())
+            with open(tmp_dir / "symbols.json", "w", encoding="utf-8") as f:
+                json.dump(symbols, f)
+            if replaces:
+                with open(tmp_dir / _REPLACES_FILE, "w", encoding="utf-8") as f:
+                    json.dump(list(replaces), f)
+                    f.flush()
+                    os.fsync(f.fileno())
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return tmp_dir
+
+    def _publish(self, tmp_dir):
+        # atomic publish of the whole segment
+        timestamps = np.load(tmp_dir / "timestamp.npy", mmap_mode="r")
+        first, last = int(timestamps[0]), int(timestamps[-1])
+        del timestamps
+        try:
+            os.rename(tmp_dir, self.root / f"{first:020d}-{last:020d}-{uuid.uuid4().hex[:8]}")
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def _rows(path):
+        return len(np.load(path / "timestamp.npy", mmap_mode="r"))
+
+    def compact(self, small_rows=HISTORY_SMALL_SEGMENT_ROWS, min_segments=HISTORY_COMPACT_SEGMENTS):
+        """
+        Merges the run of small segments (fewer than small_rows rows) that follows
+        the last large segment into one segment, once there are min_segments of them.
+        Only one process compacts a store at a time. The merged segment is renamed
+        into place first and lists the segments it replaces, which readers skip from
+        then on and which are deleted afterwards: readers see every row exactly once,
+        and a crash at any point loses no rows (see recover()).
+
+        Returns:
+            int: Number of segments merged (0 when nothing was done).
+        """
+        run = []
+        for _, _, path in reversed(self._segments()):
+            if self._rows(path) >= small_rows:
+                break
+            run.append(path)
+        if len(run) < max(2, min_segments):
+            return 0
+        run.reverse()
+
+        lock = self.root / ".compact.lock"
+        try:
+            lock.mkdir()
+        except FileExistsError:
+            if time.time() - lock.stat().st_mtime < _COMPACT_LOCK_TIMEOUT:
+                return 0  # another process is compacting
+            lock.rmdir()
+            return self.compact(small_rows, min_segments)
+        try:
+            parts = {name: [] for name in ["timestamp", "symbol"] + FLOAT_COLUMNS}
+            for path in run:
+                with open(path / "symbols.json", "r", encoding="utf-8") as f:
+                    dictionary = np.array(json.load(f), dtype=str)
+                parts["symbol"].append(dictionary[np.load(path / "symbol.npy")])
+                for name in ["timestamp"] + FLOAT_COLUMNS:
+                    parts[name].append(np.load(path / f"{name}.npy"))
+            merged = {name: np.concatenate(chunks) for name, chunks in parts.items()}
+            # segments of several processes may overlap in time
+            order = np.argsort(merged["timestamp"], kind="stable")
+            tmp_dir = self._write_segment(
+                merged["timestamp"][order], merged["symbol"][order].tolist(),
+                {name: merged[name][order] for name in FLOAT_COLUMNS}, replaces=[path.name for path in run],
+            )
+            self._publish(tmp_dir)
+            for path in run:
+                shutil.rmtree(path, ignore_errors=True)
+        finally:
+            lock.rmdir()
+        return len(run)
+
+    def recover(self):
+        """
+        Cleans up after a process that crashed while writing or compacting:
+        deletes the segments a published merged segment replaces and the
+        abandoned temporary segments. Meant to run at startup.
+
+        Returns:
+            int: Number of directories deleted.
+        """
+        if not self.root.exists():
+            return 0
+        replaced = set()
+        for path in self.root.iterdir():
+            if not path.name.startswith(".") and path.is_dir():
+                replaced.update(self._replaces(path))
+
+        recovered = 0
+        for path in list(self.root.iterdir()):
+            if not path.is_dir():
+                continue
+            abandoned = path.name.startswith(".tmp-") and time.time() - path.stat().st_mtime > _COMPACT_LOCK_TIMEOUT
+            if path.name in replaced or abandoned:
+                shutil.rmtree(path, ignore_errors=True)
+                recovered += 1
+        if recovered:
+            print(f"History store {self.root}: removed {recovered} leftover directories")
+        return recovered
+
+    def query(self, start=None, end=None, symbols=None):
+        """
+        Reads the rows within [start, end] (optionally only the given symbols).
+
+        Args:
+            start, end (datetime | str, optional): Time range bounds, inclusive.
+            symbols (list[str], optional): Symbols to keep.
+
+        Returns:
+            dict: Column name -> NumPy array ("timestamp" in microseconds,
+                  "symbol" as strings), rows in time order.
+        """
+        start = to_micros(start) if start is not None else None
+        end = to_micros(end) if end is not None else None
+        wanted = set(symbols) if symbols is not None else None
+
+        # a compaction may merge the listed segments away while they are read: list again
+        for attempt in range(3):
+            parts = {name: [] for name in ["timestamp", "symbol"] + FLOAT_COLUMNS}
+            try:
+                for _, _, path in self._segments(start, end):
+                    timestamps = np.load(path / "timestamp.npy", mmap_mode="r")
+                    lo = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+                    hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="right"))
+                    if lo >= hi:
+                        continue
+
+                    with open(path / "symbols.json", "r", encoding="utf-8") as f:
+                        dictionary = np.array(json.load(f), dtype=str)
+                    codes = np.asarray(np.load(path / "symbol.npy", mmap_mode="r")[lo:hi])
+                    mask = None
+                    if wanted is not None:
+                        wanted_codes = [i for i, s in enumerate(dictionary.tolist()) if s in wanted]
+                        mask = np.isin(codes, wanted_codes)
+                        if not mask.any():
+                            continue
+
+                    def take(values):
+                        values = np.asarray(values[lo:hi])
+                        return values[mask] if mask is not None else values
+
+                    parts["timestamp"].append(take(timestamps))
+                    parts["symbol"].append(dictionary[codes[mask] if mask is not None else codes])
+                    for name in FLOAT_COLUMNS:
+                        parts[name].append(take(np.load(path / f"{name}.npy", mmap_mode="r")))
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+
+        empty = {"timestamp": np.int64, "symbol": str}
+        columns = {
+            name: np.concatenate(chunks) if chunks else np.array([], dtype=empty.get(name, np.float64))
+            for name, chunks in parts.items()
+        }
+        if len(parts["timestamp"]) > 1:
+            # segments of several processes may overlap in time
+            order = np.argsort(columns["timestamp"], kind="stable")
+            columns = {name: values[order] for name, values in columns.items()}
+        return columns
+
+    def latest_timestamp(self):
+        # segments of several processes may overlap in time: the last listed one need not end last
+        segments = self._segments()
+        return from_micros(max(last for _, last, _ in segments)) if segments else None
+
+
+def columns_to_records(columns):
+    """Converts query() columns to a list of JSON-ready dictionaries."""
+    timestamps = [from_micros(int(ts)).isoformat() for ts in columns["timestamp"].tolist()]
+    records = []
+    for i, symbol in enumerate(columns["symbol"].tolist()):
+        record = {"timestamp": timestamps[i], "symbol": symbol}
+        for name in FLOAT_COLUMNS:
+            record[name] = float(columns[name][i])
+        records.append(record)
+    return records
@@ -0,0 +1,26 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Prometheus metrics of the fetch_crypto service, exposed at /metrics
+METRICS_REGISTRY = CollectorRegistry()
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Latency of a pipeline stage", ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60), registry=METRICS_REGISTRY,
+)
+RETRIES = Counter("pipeline_retries_total", "Retried pipeline stage calls", ["stage"], registry=METRICS_REGISTRY)
+FAILURES = Counter("pipeline_failures_total", "Failed pipeline stage calls", ["stage"], registry=METRICS_REGISTRY)
+CACHE_HITS = Counter("pipeline_cache_hits_total", "Cache hits", ["cache"], registry=METRICS_REGISTRY)
+CACHE_MISSES = Counter("pipeline_cache_misses_total", "Cache misses", ["cache"], registry=METRICS_REGISTRY)
+WRITE_QUEUE = Gauge(
+    "history_write_queue_depth", "Investment snapshots waiting for the background writer", registry=METRICS_REGISTRY,
+)
+
+
+def render_metrics():
+    """
+    Renders the metrics in the Prometheus text format.
+
+    Returns:
+        tuple: (body bytes, content type).
+    """
+    return generate_latest(METRICS_REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class PortfolioFrame:
+    """
+    Columnar portfolio: one row per lot (the same coin may be bought many
+    times at different prices), held as parallel NumPy arrays.
+
+    All P&L figures are computed in one vectorized pass by joining the lots
+    against a price vector of the distinct symbols, instead of building and
+    validating one object per lot.
+    """
+
+    def __init__(self, symbols, buy_prices, quantities=None):
+        """
+        Args:
+            symbols (list[str]): CoinGecko coin id of every lot (e.g., "bitcoin").
+            buy_prices (list[float]): Purchase price of every lot.
+            quantities (list[float], optional): Amount bought in every lot. Defaults to 1 per lot.
+        """
+        symbols = np.asarray(symbols, dtype=str)
+        self.buy_prices = np.asarray(buy_prices, dtype=np.float64)
+        self.quantities = (
+            np.ones(len(symbols)) if quantities is None else np.asarray(quantities, dtype=np.float64)
+        )
+        if not (len(symbols) == len(self.buy_prices) == len(self.quantities)):
+            raise ValueError("symbols, buy_prices and quantities must have the same length")
+
+        # distinct symbols, and for every lot the index of its symbol
+        self.symbols, self.codes = np.unique(symbols, return_inverse=True)
+
+    @classmethod
+    def from_coins(cls, coins):
+        """Builds a frame from a list of Coin models (one lot per coin)."""
+        return cls([c.symbol for c in coins], [c.buy_price for c in coins])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def price_vector(self, quotes):
+        """
+        Current USD price of every distinct symbol, NaN where CoinGecko has no price.
+
+        Args:
+            quotes (dict): CoinGecko simple/price payload, e.g. {"bitcoin": {"usd": 66300.0}}.
+                A None quote marks a coin whose batch failed.
+        """
+        return np.array(
+            [(quotes.get(symbol) or {}).get("usd", np.nan) for symbol in self.symbols.tolist()],
+            dtype=np.float64,
+        )
+
+    def compute(self, quotes):
+        """
+        Computes per-lot and per-coin performance against the given prices.
+
+        Returns:
+            dict: {
+                "lots": per-lot arrays "current_price", "value_change", "change_pct"
+                        (NaN for coins without a price),
+                "coins": per-coin arrays "symbol", "quantity", "cost_basis",
+                         "market_value", "pnl", "pnl_pct",
+                "not_found": list of symbols unknown to CoinGecko,
+                "unavailable": list of symbols whose price could not be fetched
+            }
+        """
+        prices = self.price_vector(quotes)
+        current = prices[self.codes]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value_change = current - self.buy_prices
+            change_pct = value_change / self.buy_prices * 100
+
+            n = len(self.symbols)
+            quantity = np.bincount(self.codes, weights=self.quantities, minlength=n)
+            cost_basis = np.bincount(self.codes, weights=self.buy_prices * self.quantities, minlength=n)
+            market_value = quantity * prices
+            pnl = market_value - cost_basis
+            pnl_pct = pnl / cost_basis * 100
+
+        found = ~np.isnan(prices)
+        # a None quote is a failed batch, not an unknown coin
+        failed = np.array([symbol in quotes for symbol in self.symbols.tolist()], dtype=bool) & ~found
+        return {
+            "lots": {
+                "current_price": current,
+                "value_change": value_change,
+                "change_pct": change_pct,
+            },
+            "coins": {
+                "symbol": self.symbols[found],
+                "quantity": quantity[found],
+                "cost_basis": cost_basis[found],
+                "market_value": market_value[found],
+                "pnl": pnl[found],
+                "pnl_pct": pnl_pct[found],
+            },
+            "not_found": self.symbols[~found & ~failed].tolist(),
+            "unavailable": self.symbols[failed].tolist(),
+        }
+
+    def summarize(self, quotes):
+        """
+        JSON-ready portfolio summary: per-coin aggregates and totals, rounded to 2 decimals.
+        """
+        computed = self.compute(quotes)
+        coins = computed["coins"]
+
+        total_cost = float(coins["cost_basis"].sum())
+        total_value = float(coins["market_value"].sum())
+        total_pnl = total_value - total_cost
+
+        rounded = {key: np.round(values, 2).tolist() for key, values in coins.items() if key != "symbol"}
+        return {
+            "coins": [
+                dict(symbol=symbol, **{key: values[i] for key, values in rounded.items()})
+                for i, symbol in enumerate(coins["symbol"].tolist())
+            ],
+            "totals": {
+                "lots": len(self),
+                "cost_basis": round(total_cost, 2),
+                "market_value": round(total_value, 2),
+                "pnl": round(total_pnl, 2),
+                "pnl_pct": round(total_pnl / total_cost * 100, 2) if total_cost else 0.0,
+            },
+            "not_found": computed["not_found"],
+            "unavailable": computed["unavailable"],
+        }
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+import asyncio
+import os
+import time
+from fetch_crypto.utils.metrics import CACHE_HITS, CACHE_MISSES
+
+# Prices younger than this are served straight from the cache
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "30"))
+# Prices younger than this (but older than the TTL) are served while a background refresh runs
+PRICE_CACHE_STALE_TTL = float(os.getenv("PRICE_CACHE_STALE_TTL", "300"))
+# Ids unknown to CoinGecko are remembered this long (and never served stale)
+PRICE_CACHE_NOT_FOUND_TTL = float(os.getenv("PRICE_CACHE_NOT_FOUND_TTL", "60"))
+# Above this many coins, the least recently used ones are evicted
+PRICE_CACHE_MAX_ENTRIES = int(os.getenv("PRICE_CACHE_MAX_ENTRIES", "10000"))
+
+# Cached marker for ids that CoinGecko does not know
+_NOT_FOUND = {}
+
+
+class PriceCache:
+    """
+    In-process cache of CoinGecko prices, keyed per coin id.
+
+    - Fresh prices (younger than ttl) are returned without an upstream call.
+    - Stale prices (younger than stale_ttl) are returned immediately and
+      refreshed in a background task (stale-while-revalidate).
+    - Concurrent requests for the same missing ids share a single upstream
+      fetch ("singleflight"): the first caller fetches, the others await it.
+      The fetch runs on as its own task when the first caller is cancelled.
+
+    Coins that CoinGecko does not know (missing from the payload) are cached
+    too, for not_found_ttl, so they don't trigger an upstream call on every
+    request. Coins the fetcher reports as None (their batch failed) are not
+    cached. Above max_entries coins, the least recently used are evicted, so
+    clients asking for arbitrary ids cannot grow the cache without bound.
+
+    The cache belongs to one event loop; nothing in it blocks the loop.
+    """
+
+    def __init__(self, fetcher, ttl=PRICE_CACHE_TTL, stale_ttl=PRICE_CACHE_STALE_TTL,
+                 not_found_ttl=PRICE_CACHE_NOT_FOUND_TTL, max_entries=PRICE_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            fetcher (callable): Coroutine function that takes a list of coin ids and
+                                returns the CoinGecko simple/price payload, e.g. {"bitcoin": {"usd": 66300.0}}.
+            ttl (float): Seconds a price is considered fresh.
+            stale_ttl (float): Seconds a price may still be served while it is refreshed.
+            not_found_ttl (float): Seconds an id unknown to CoinGecko is remembered.
+            max_entries (int): Coins kept at most.
+        """
+        self._fetcher = fetcher
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.not_found_ttl = not_found_ttl
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._tasks = set()
+        self.upstream_calls = 0
+
+    def _spawn(self, coroutine):
+        # the loop only keeps weak references to tasks
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def get_prices(self, ids):
+        """
+        Returns the simple/price payload for the given ids, using the cache where possible.
+        Ids unknown to CoinGecko are missing from the result, as in the upstream response;
+        ids whose price could not be fetched right now map to None.
+        """
+        now = time.monotonic()
+        quotes = {}
+        waiting = {}
+        to_fetch = []
+        to_refresh = []
+
+        loop = asyncio.get_running_loop()
+        for coin_id in dict.fromkeys(ids):
+            entry = self._entries.get(coin_id)
+            age = now - entry[1] if entry else None
+            ttl, stale_ttl = self.ttl, self.stale_ttl
+            if entry and entry[0] is _NOT_FOUND:
+                ttl = stale_ttl = self.not_found_ttl
+            if entry:
+                self._entries.move_to_end(coin_id)
+
+            if entry and age <= ttl:
+                quotes[coin_id] = entry[0]
+            elif entry and age <= stale_ttl:
+                quotes[coin_id] = entry[0]
+                if coin_id not in self._inflight:
+                    to_refresh.append(coin_id)
+            elif coin_id in self._inflight:
+                waiting[coin_id] = self._inflight[coin_id]
+            else:
+                to_fetch.append(coin_id)
+
+        for coin_id in to_fetch + to_refresh:
+            self._inflight[coin_id] = loop.create_future()
+
+        # stale prices are served from the cache too; waiting on another request's fetch is a miss
+        CACHE_HITS.labels("price").inc(len(quotes))
+        CACHE_MISSES.labels("price").inc(len(to_fetch) + len(waiting))
+
+        if to_refresh:
+            self._spawn(self._refresh(to_refresh))
+
+        if to_fetch:
+            quotes.update(await asyncio.shield(self._spawn(self._fetch(to_fetch))))
+
+        for coin_id, future in waiting.items():
+            quotes[coin_id] = await asyncio.shield(future)
+
+        return {coin_id: quote for coin_id, quote in quotes.items() if quote is not _NOT_FOUND}
+
+    async def _fetch(self, ids):
+        futures = {coin_id: self._inflight[coin_id] for coin_id in ids}
+        try:
+            self.upstream_calls += 1
+            data = await self._fetcher(ids)
+        except BaseException as e:
+            for coin_id in ids:
+                self._inflight.pop(coin_id, None)
+            for future in futures.values():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception()  # raised to the waiters; no "never retrieved" warning without any
+            raise
+
+        fetched_at = time.monotonic()
+        quotes = {coin_id: data.get(coin_id, _NOT_FOUND) for coin_id in ids}
+        for coin_id, quote in quotes.items():
+            if quote is not None:
+                self._entries[coin_id] = (quote, fetched_at)
+                self._entries.move_to_end(coin_id)
+            self._inflight.pop(coin_id, None)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        for coin_id, future in futures.items():
+            future.set_result(quotes[coin_id])
+        return quotes
+
+    async def _refresh(self, ids):
+        try:
+            await self._fetch(ids)
+        except Exception as e:
+            print(f"Background price refresh failed for {ids}: {e}")
+
+    def clear(self):
+        self._entries.clear()
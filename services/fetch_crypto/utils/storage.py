@@ -1,33 +1,54 @@
-import json
-from pathlib import Path
+from datetime import datetime, timezone
+import os
+import queue
+import threading
+import time
+from fetch_crypto.utils.history import HistoryStore, columns_to_records
+from fetch_crypto.utils.metrics import STAGE_SECONDS, FAILURES
 
+# Snapshots waiting for the background writer; when it is this far behind, new ones are dropped
+INVESTMENT_WRITE_QUEUE_SIZE = int(os.getenv("INVESTMENT_WRITE_QUEUE_SIZE", "10000"))
+# The writer buffers snapshots across requests and writes them as one history segment
+# once they hold INVESTMENT_FLUSH_ROWS rows, or INVESTMENT_FLUSH_INTERVAL seconds after the oldest
+INVESTMENT_FLUSH_ROWS = int(os.getenv("INVESTMENT_FLUSH_ROWS", "5000"))
+INVESTMENT_FLUSH_INTERVAL = float(os.getenv("INVESTMENT_FLUSH_INTERVAL", "5"))
 
-def load_investments(filepath="received_data/my_coins.json"):
+
+def load_investments(filepath="received_data/history", start=None, end=None, symbols=None):
     """
-    Loads previously saved cryptocurrency investment data from a JSON file.
-    If the file does not exist, an empty list is returned instead.
+    Loads saved cryptocurrency investment snapshots from the history store.
+    Only the segments and rows inside the requested range are read.
+    If nothing has been saved yet, an empty list is returned instead.
 
     Args:
-        filepath (str, optional): Path to the JSON file containing investment data.
-                                  Defaults to 'received_data/my_coins.json'.
+        filepath (str, optional): Directory of the history store.
+                                  Defaults to 'received_data/history'.
+        start (datetime | str, optional): Start of the time range (inclusive).
+        end (datetime | str, optional): End of the time range (inclusive).
+                                        If neither start nor end is given,
+                                        only the most recent snapshot is returned.
+        symbols (list[str], optional): Only return rows of these coins.
 
     Returns:
-        list: A list of investment records if the file exists and is valid JSON.
-              Returns an empty list if the file does not exist.
+        list: A list of investment records, each with a "timestamp" (ISO-8601, UTC)
+              plus the saved "symbol", "current_price", "buy_price",
+              "value_change" and "change_pct".
     """
-    path = Path(filepath)
+    store = HistoryStore(filepath)
+
+    if start is None and end is None:
+        latest = store.latest_timestamp()
+        if latest is None:
+            return []
+        start = end = latest
 
-    if not path.exists():
-        return []
-    
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return columns_to_records(store.query(start, end, symbols))
 
 
-def save_investments(coin_list, filepath="received_data/my_coins.json"):
+def save_investments(coin_list, filepath="received_data/history", timestamp=None):
     """
-    Saves a list of cryptocurrency investment records to a JSON file.
-    If a previous file exists, it is deleted and replaced with the new content.
+    Appends a snapshot of cryptocurrency investment records to the history store.
+    Previous snapshots are kept; entries without a price (errors) are skipped.
 
     Args:
         coin_list (list): A list of dictionaries, each representing a coin investment.
@@ -42,20 +63,137 @@ def save_investments(coin_list, filepath="received_data/my_coins.json"):
                               },
                               ...
                           ]
-        filepath (str, optional): The path to the JSON file to save the data into.
-                                  Defaults to 'received_data/my_coins.json'.
+        filepath (str, optional): Directory of the history store.
+                                  Defaults to 'received_data/history'.
+        timestamp (datetime, optional): Snapshot time. Defaults to now (UTC).
     """
-    path = Path(filepath)
-    
-    # create directory if needed
-    path.parent.mkdir(parents=True, exist_ok=True)
-
-    # delete old file if it exists
-    if path.exists():
-        path.unlink()
-
-    # save new data
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(coin_list, f, indent=4, ensure_ascii=False)
-    
-    print(f"Overwritten: {filepath}")
\ No newline at end of file
+    rows = [coin for coin in coin_list if "current_price" in coin]
+    written = HistoryStore(filepath).append(rows, timestamp)
+
+    print(f"Appended {written} rows to: {filepath}")
+
+
+class InvestmentWriter:
+    """
+    Saves investment snapshots from a background thread, so the request path
+    only enqueues them. The writer buffers the snapshots of many requests and
+    writes them as one history segment (HistoryStore.append_snapshots, each
+    snapshot with the time it was submitted) once the buffer holds
+    `flush_rows` rows or its oldest snapshot is `flush_interval` seconds old,
+    so the number of segments follows the data, not the request rate.
+
+    The queue is bounded: when the disk cannot keep up, new snapshots are
+    dropped (and counted) rather than held in memory or blocking requests.
+    """
+
+    def __init__(self, filepath="received_data/history", max_queue=INVESTMENT_WRITE_QUEUE_SIZE,
+                 flush_rows=INVESTMENT_FLUSH_ROWS, flush_interval=INVESTMENT_FLUSH_INTERVAL):
+        self.filepath = filepath
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._buffered = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.segments = 0
+        self.failed = 0
+
+    def submit(self, coin_list, timestamp=None) -> bool:
+        """
+        Queues a snapshot, as passed to save_investments(); never blocks.
+        Starts the writer thread on first use.
+
+        Returns:
+            bool: False when the snapshot was dropped because the queue is full.
+        """
+        rows = [coin for coin in coin_list if "current_price" in coin]
+        if not rows:
+            return True
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((rows, timestamp or datetime.now(timezone.utc)))
+        except queue.Full:
+            self.dropped += 1
+            FAILURES.labels("history_write").inc()
+            return False
+        self.submitted += 1
+        return True
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="investment-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        buffer, rows, oldest = [], 0, None
+        while True:
+            timeout = None if not buffer else max(0.0, oldest + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()  # the oldest buffered snapshot is due
+            if isinstance(item, tuple) and item:
+                if not buffer:
+                    oldest = time.monotonic()
+                buffer.append(item)
+                rows += len(item[0])
+                self._buffered = len(buffer)
+                if rows < self.flush_rows:
+                    continue
+            # a full or due buffer, a flush() (an Event) or close() (None)
+            if buffer:
+                self._write(buffer)
+                buffer, rows = [], 0
+                self._buffered = 0
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _write(self, batch):
+        try:
+            with STAGE_SECONDS.labels("history_write").time():
+                self.written += HistoryStore(self.filepath).append_snapshots(batch)
+            self.segments += 1
+        except Exception as e:
+            self.failed += len(batch)
+            FAILURES.labels("history_write").inc(len(batch))
+            print(f"Failed to save {len(batch)} investment snapshots to {self.filepath}: {e}")
+
+    def pending(self) -> int:
+        """Snapshots queued or buffered, not written yet."""
+        return self._queue.qsize() + self._buffered
+
+    def flush(self):
+        """Blocks until every snapshot submitted so far has been written (or failed)."""
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Writes what is queued and buffered, and stops the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join()
+        print(f"Investment writer stopped: {self.written} rows in {self.segments} segments, {self.dropped} snapshots dropped")
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "rows_written": self.written,
+            "segments": self.segments,
+        }
@@ -1,24 +1,26 @@
 import subprocess
 import asyncio
-from main import orchestrate_and_save_news
+from main import run_once
 
-# List of microservice names (matching YAML file names and Service names in Kubernetes)
-SERVICES = ["service_1", "service_2", "service_3"]
+# Microservice names (matching YAML file names and Service names in Kubernetes)
+SERVICES = ["feed-worker"]
 
 def apply_k8s_yaml(service_name: str):
     """
-    Applies the deployment and service YAML for a given microservice using kubectl.
+    Applies the StatefulSet and headless service YAML for a given microservice
+    using kubectl, and waits until all of its replicas are up.
     """
     print(f"Applying {service_name}...")
-    subprocess.run(["kubectl", "apply", "-f", f"{service_name}-deployment.yaml"])
     subprocess.run(["kubectl", "apply", "-f", f"{service_name}-service.yaml"])
+    subprocess.run(["kubectl", "apply", "-f", f"{service_name}-statefulset.yaml"])
+    subprocess.run(["kubectl", "rollout", "status", f"statefulset/{service_name}", "--timeout=300s"])
 
 def delete_k8s_yaml(service_name: str):
     """
-    Deletes the deployment and service YAML for a given microservice using kubectl.
+    Deletes the StatefulSet and service YAML for a given microservice using kubectl.
     """
     print(f"Deleting {service_name}...")
-    subprocess.run(["kubectl", "delete", "-f", f"{service_name}-deployment.yaml"])
+    subprocess.run(["kubectl", "delete", "-f", f"{service_name}-statefulset.yaml"])
     subprocess.run(["kubectl", "delete", "-f", f"{service_name}-service.yaml"])
 
 async def run_aggregator_with_services():
@@ -33,7 +35,7 @@ async def run_aggregator_with_services():
 
         # Run the main aggregation logic (includes waiting for services internally)
         print("Running aggregator logic...")
-        result = await orchestrate_and_save_news()
+        result = await run_once()
 
         print("Aggregator finished.")
         print(result)
@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import hashlib
+import json
+import os
+
+
+def content_hash(item: dict) -> str:
+    """Hash of the parts of an article that go into the analysis."""
+    payload = (item.get("title") or "") + "\n" + (item.get("content") or "")
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_id(chunk: str) -> str:
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+
+class AnalysisState:
+    """
+    Persistent per-article analysis state, kept between CronJob runs.
+
+    Articles are keyed by link and remember their content hash, the article
+    itself and the chunks that analyzed it; chunk summaries are stored once
+    per chunk. An article whose link and hash are already known is not sent
+    to the LLM again, so the work of a run scales with the new (or edited)
+    articles, while the day's report is rebuilt from all stored summaries.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.articles = {}
+        self.chunks = {}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.articles = data.get("articles", {})
+            self.chunks = data.get("chunks", {})
+        except (OSError, ValueError) as e:
+            print(f"[!] Ignoring unreadable analysis state {self.path}: {e}")
+
+    def analyzed_item(self, link: str, digest: str):
+        """The stored article analyzed under this link and content hash, or None."""
+        entry = self.articles.get(link)
+        if entry and entry["hash"] == digest and all(cid in self.chunks for cid in entry["chunks"]):
+            return entry.get("item")
+        return None
+
+    def is_analyzed(self, item: dict) -> bool:
+        return self.analyzed_item(item.get("link"), content_hash(item)) is not None
+
+    def pending(self, items: list) -> list:
+        """Returns the articles (with content) that are new or changed since they were analyzed."""
+        return [item for item in items if item.get("content") and not self.is_analyzed(item)]
+
+    def record(self, chunk: str, links: list, summary: str, items_by_link: dict):
+        """Stores the summary of one analyzed chunk and marks its articles as analyzed."""
+        cid = chunk_id(chunk)
+        self.chunks[cid] = {
+            "summary": summary,
+            "analyzed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        for link in links:
+            item = items_by_link[link]
+            entry = self.articles.get(link)
+            if not entry or entry["hash"] != content_hash(item):
+                # new or edited article: drop the chunks of the previous version
+                entry = self.articles[link] = {"hash": content_hash(item), "chunks": []}
+            entry["item"] = item
+            if cid not in entry["chunks"]:
+                entry["chunks"].append(cid)
+
+    def merge_items(self, items: list) -> list:
+        """Today's articles of this run plus those stored by earlier runs that left the feeds."""
+        merged = {item.get("link"): item for item in items}
+        for link, entry in self.articles.items():
+            if link not in merged and "item" in entry:
+                merged[link] = entry["item"]
+        return list(merged.values())
+
+    def summaries(self, items: list) -> list:
+        """Chunk summaries covering the given articles, in article order, each chunk once."""
+        seen = set()
+        result = []
+        for item in items:
+            entry = self.articles.get(item.get("link"))
+            if not entry or entry["hash"] != content_hash(item):
+                continue
+            for cid in entry["chunks"]:
+                if cid not in seen and cid in self.chunks:
+                    seen.add(cid)
+                    result.append(self.chunks[cid]["summary"])
+        return result
+
+    def prune(self, keep) -> None:
+        """Drops the articles for which keep(item) is false, and chunks no article refers to."""
+        self.articles = {
+            link: entry for link, entry in self.articles.items() if "item" in entry and keep(entry["item"])
+        }
+        referenced = {cid for entry in self.articles.values() for cid in entry["chunks"]}
+        self.chunks = {cid: chunk for cid, chunk in self.chunks.items() if cid in referenced}
+
+    def save(self):
+        """Atomically writes the state (temporary file + rename)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"articles": self.articles, "chunks": self.chunks}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
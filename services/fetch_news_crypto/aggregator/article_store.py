@@ -0,0 +1,256 @@
+from datetime import datetime, timezone, timedelta
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from analysis_state import content_hash
+import json
+import os
+import sqlite3
+
+# Articles published more than ARTICLE_DB_RETENTION_DAYS ago are dropped on ingest (0 = keep all)
+ARTICLE_DB_RETENTION_DAYS = float(os.getenv("ARTICLE_DB_RETENTION_DAYS", "90"))
+
+# Last resort formats of published dates, after ISO 8601 and RFC 822/2822
+_DATE_FORMATS = (
+    "%d %B %Y %H:%M:%S %z",
+    "%B %d, %Y %H:%M:%S",
+    "%B %d, %Y",
+    "%Y/%m/%d %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+)
+
+_UTC_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Columns of an article; any other key of an item is kept in the "extra" JSON column
+_FIELDS = ("link", "title", "content", "source", "published", "content_hash")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    link TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT '',
+    source TEXT,
+    published TEXT,
+    published_utc TEXT,
+    published_day TEXT,
+    utc_offset INTEGER,
+    content_hash TEXT,
+    extra TEXT,
+    ingested_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS articles_published ON articles(published_utc);
+CREATE INDEX IF NOT EXISTS articles_day ON articles(published_day);
+CREATE INDEX IF NOT EXISTS articles_source ON articles(source, published_utc);
+"""
+
+# Full-text index over title and content, kept in sync with the table by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, content, content='articles', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE OF title, content ON articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+    INSERT INTO articles_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+"""
+
+
+def parse_published(value):
+    """
+    Parses a feed's published date: ISO 8601, RFC 822/2822 (with a numeric
+    zone, a zone name such as GMT or EDT, or no weekday) or one of a few
+    common layouts. Dates without a zone are taken as UTC.
+
+    Returns:
+        datetime | None: A timezone-aware datetime, or None when the date cannot be parsed.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    parsed = None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            for date_format in _DATE_FORMATS:
+                try:
+                    parsed = datetime.strptime(value, date_format)
+                    break
+                except ValueError:
+                    continue
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _utc(moment: datetime) -> str:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime(_UTC_FORMAT)
+
+
+class ArticleStore:
+    """
+    Persistent, indexed store of the aggregated articles (SQLite).
+
+    Every article is kept once per link with its published date normalized
+    to UTC, plus the date and UTC offset of the publisher's own timezone, so
+    day, range and source queries are index lookups. Title and content are
+    indexed with FTS5 for keyword search when the SQLite build has it (a
+    LIKE scan otherwise).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        try:
+            self._conn.executescript(_FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError as e:  # SQLite built without FTS5
+            print(f"[!] Full-text search unavailable, falling back to LIKE: {e}")
+            self.full_text = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def _row(item: dict, ingested_at: str) -> tuple:
+        published = parse_published(item.get("published"))
+        offset = int(published.utcoffset().total_seconds() // 60) if published else None
+        extra = {key: value for key, value in item.items() if key not in _FIELDS}
+        return (
+            item.get("link"), item.get("title") or "", item.get("content") or "", item.get("source"),
+            item.get("published"), _utc(published) if published else None,
+            published.date().isoformat() if published else None, offset,
+            item.get("content_hash") or content_hash(item), json.dumps(extra, ensure_ascii=False) if extra else None, ingested_at,
+        )
+
+    @staticmethod
+    def _item(row) -> dict:
+        item = {key: row[key] for key in _FIELDS if row[key] is not None}
+        if row["extra"]:
+            item.update(json.loads(row["extra"]))
+        return item
+
+    def ingest(self, items: list, retention_days: float = ARTICLE_DB_RETENTION_DAYS) -> int:
+        """
+        Inserts or updates the articles (by link) in one transaction, and drops
+        those published before the retention period. Returns the number ingested.
+        """
+        now = datetime.now(timezone.utc)
+        rows = [self._row(item, _utc(now)) for item in items if item.get("link")]
+        with self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO articles (link, title, content, source, published, published_utc, published_day,
+                                      utc_offset, content_hash, extra, ingested_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(link) DO UPDATE SET
+                    title = excluded.title, content = excluded.content, source = excluded.source,
+                    published = excluded.published, published_utc = excluded.published_utc,
+                    published_day = excluded.published_day, utc_offset = excluded.utc_offset,
+                    content_hash = excluded.content_hash, extra = excluded.extra,
+                    ingested_at = excluded.ingested_at
+                """,
+                rows,
+            )
+            if retention_days > 0:
+                self._conn.execute(
+                    "DELETE FROM articles WHERE published_utc < ?", (_utc(now - timedelta(days=retention_days)),)
+                )
+        return len(rows)
+
+    def _select(self, clauses: list, params: list, source=None, order="published_utc, link", limit=None,
+                match=None) -> list:
+        if source is not None:
+            clauses, params = clauses + ["articles.source = ?"], params + [source]
+        sql = "SELECT articles.* FROM articles"
+        if match is not None:
+            sql += " JOIN articles_fts ON articles_fts.rowid = articles.rowid"
+            clauses, params = ["articles_fts MATCH ?"] + clauses, [match] + params
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = params + [limit]
+        return [self._item(row) for row in self._conn.execute(sql, params)]
+
+    def published_today(self, now: datetime | None = None, source: str | None = None) -> list:
+        """The articles published today in their publisher's own timezone."""
+        utc_now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+        # a publisher's "today" is within a day of the UTC date, so the day index narrows the scan
+        return self._select(
+            ["published_day BETWEEN ? AND ?", "published_day = date(?, utc_offset || ' minutes')"],
+            [
+                (utc_now - timedelta(days=1)).date().isoformat(), (utc_now + timedelta(days=1)).date().isoformat(),
+                utc_now.strftime("%Y-%m-%d %H:%M:%S"),
+            ],
+            source,
+        )
+
+    def on_day(self, day, source: str | None = None) -> list:
+        """The articles published on a date (a date or "YYYY-MM-DD") in their publisher's timezone."""
+        return self._select(["published_day = ?"], [day if isinstance(day, str) else day.isoformat()], source)
+
+    def between(self, since: datetime | None = None, until: datetime | None = None, source: str | None = None) -> list:
+        """The articles published in [since, until), optionally of one source, oldest first."""
+        clauses, params = ["published_utc IS NOT NULL"], []
+        if since is not None:
+            clauses.append("published_utc >= ?")
+            params.append(_utc(since))
+        if until is not None:
+            clauses.append("published_utc < ?")
+            params.append(_utc(until))
+        return self._select(clauses, params, source)
+
+    def search(self, query: str, limit: int = 50, since: datetime | None = None, source: str | None = None) -> list:
+        """
+        Keyword search over title and content, best matches first.
+
+        Args:
+            query (str): Words that must all occur.
+            limit (int): Maximum number of articles.
+            since (datetime, optional): Only articles published since then.
+            source (str, optional): Only articles of this source.
+        """
+        if not query.strip():
+            return []
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("articles.published_utc >= ?")
+            params.append(_utc(since))
+        if self.full_text:
+            return self._select(clauses, params, source, order="bm25(articles_fts)", limit=limit,
+                                match=_fts_query(query))
+        for word in query.split():
+            clauses.append("(articles.title LIKE ? OR articles.content LIKE ?)")
+            params.extend([f"%{word}%"] * 2)
+        return self._select(clauses, params, source, order="articles.published_utc DESC", limit=limit)
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+
+def _fts_query(query: str) -> str:
+    # every word as a quoted string, so punctuation in it is never read as FTS5 syntax
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
@@ -0,0 +1,88 @@
+"""
+Benchmark of the token-budget chunker against the previous character-based
+string-concatenation splitter, on multi-megabyte inputs.
+
+Run from the aggregator/ directory:
+    python -m benchmarks.bench_chunker
+"""
+import random
+import time
+
+from chunking import OLLAMA_NUM_CTX, OLLAMA_RESPONSE_TOKENS, chunk_token_budget, estimate_tokens
+from utils import split_text_into_chunks, PROMPT_TEMPLATE
+
+SIZES_MB = [1, 4, 16]
+WORDS = (
+    "bitcoin ethereum solana etf inflows market price rally analysts traders "
+    "exchange regulators stablecoin liquidity volatility network upgrade token "
+    "investors institutional demand halving miners fees blockchain protocol"
+).split()
+
+
+def make_text(size_mb, seed=7):
+    """Synthetic news dump: paragraphs of 2-8 sentences, articles separated by blank lines."""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    parts, size = [], 0
+    while size < target:
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 30))).capitalize() + "."
+            for _ in range(rng.randint(2, 8))
+        ]
+        paragraph = " ".join(sentences)
+        # one in fifty paragraphs is a huge unbroken block (e.g. a scraped table)
+        if rng.random() < 0.02:
+            paragraph = " ".join([paragraph] * 40)
+        parts.append(paragraph)
+        parts.append("" if rng.random() < 0.2 else None)
+        size += len(paragraph) + 1
+    return "\n".join(p for p in parts if p is not None)
+
+
+def legacy_split(text, max_length=2000):
+    """The previous implementation (character budget, += concatenation)."""
+    paragraphs = text.split("\n")
+    chunks = []
+    current_chunk = ""
+    for paragraph in paragraphs:
+        if len(current_chunk) + len(paragraph) <= max_length:
+            current_chunk += paragraph + "\n"
+        else:
+            chunks.append(current_chunk.strip())
+            current_chunk = paragraph + "\n"
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    # the same budget the aggregator packs chunks to
+    budget = chunk_token_budget(PROMPT_TEMPLATE)
+    prompt_tokens = OLLAMA_NUM_CTX - OLLAMA_RESPONSE_TOKENS - budget
+    print(f"context {OLLAMA_NUM_CTX} tokens - prompt ~{prompt_tokens} - answer {OLLAMA_RESPONSE_TOKENS} "
+          f"= chunk budget {budget} tokens\n")
+    print(f"{'input':>7} | {'legacy chunks':>13} {'oversized':>9} {'MB/s':>7} | "
+          f"{'token chunks':>12} {'max tokens':>10} {'MB/s':>7}")
+    for size_mb in SIZES_MB:
+        text = make_text(size_mb)
+        legacy, legacy_s = timed(lambda: legacy_split(text))
+        chunks, new_s = timed(lambda: split_text_into_chunks(text, max_tokens=budget))
+        oversized = sum(1 for c in legacy if len(c) > 2000)
+        biggest = max(estimate_tokens(c) for c in chunks)
+        print(f"{size_mb:>5}MB | {len(legacy):>13} {oversized:>9} {size_mb / legacy_s:>7.1f} | "
+              f"{len(chunks):>12} {biggest:>10} {size_mb / new_s:>7.1f}")
+
+    # generator input: paragraphs are consumed lazily, article by article
+    articles = (make_text(1, seed=i) for i in range(4))
+    chunks, seconds = timed(lambda: split_text_into_chunks(articles, max_tokens=budget))
+    print(f"\ngenerator of 4 x 1MB articles: {len(chunks)} chunks in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
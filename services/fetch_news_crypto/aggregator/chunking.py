@@ -0,0 +1,159 @@
+import os
+import re
+
+# Context window of the model (llama3: 8192 tokens); also sent to Ollama as num_ctx
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+# Tokens kept free in the context window for the model's answer
+OLLAMA_RESPONSE_TOKENS = int(os.getenv("OLLAMA_RESPONSE_TOKENS", "1024"))
+# Tokens repeated from the end of a chunk at the start of the next one
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+
+# Rough characters-per-token ratio of BPE tokenizers on English text
+_CHARS_PER_TOKEN = 4
+# one match per started 4-character run of a word, or per punctuation mark
+_TOKEN_RE = re.compile(r"\w{1,%d}|[^\w\s]" % _CHARS_PER_TOKEN)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token count estimate (no tokenizer dependency): every punctuation
+    mark is one token, every word one token per started 4 characters.
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+def chunk_token_budget(prompt_template: str, num_ctx: int = None, response_tokens: int = None) -> int:
+    """Tokens available for the chunk: the context window minus the prompt and the reserved answer."""
+    num_ctx = num_ctx or OLLAMA_NUM_CTX
+    response_tokens = OLLAMA_RESPONSE_TOKENS if response_tokens is None else response_tokens
+    prompt_tokens = estimate_tokens(prompt_template.replace("{chunk}", ""))
+    return max(1, num_ctx - prompt_tokens - response_tokens)
+
+
+class ChunkPacker:
+    """
+    Packs paragraphs into chunks of at most `budget` units (tokens by default,
+    or characters with measure=len) in a single linear pass.
+
+    Paragraphs that fit are packed whole. Larger paragraphs are split into
+    sentences, and sentences that are still too large into runs of words, so
+    no chunk exceeds the budget. Pieces are collected in lists and joined once
+    per chunk, never by repeated string concatenation. With overlap > 0 the
+    trailing pieces of a chunk (up to `overlap` units) are repeated at the
+    start of the next one.
+    """
+
+    def __init__(self, budget: int, overlap: int = 0, measure=estimate_tokens):
+        self.budget = max(1, budget)
+        self.overlap = min(max(0, overlap), self.budget // 2)
+        self.measure = measure
+        self._pieces = []
+        self._size = 0
+
+    def add(self, paragraph: str) -> list:
+        """Adds one paragraph and returns the chunks completed by it."""
+        paragraph = paragraph.strip()
+        if not paragraph:
+            return []
+        chunks = []
+        separator = "\n"
+        for piece, size in self._fit(paragraph):
+            cost = size + (self.measure(separator) if self._pieces else 0)
+            if self._pieces and self._size + cost > self.budget:
+                chunks.append(self._emit())
+                cost = size + (self.measure(separator) if self._pieces else 0)
+                if self._pieces and self._size + cost > self.budget:
+                    # the overlap would not leave room for this piece
+                    self._pieces, self._size = [], 0
+                    cost = size
+            self._pieces.append((separator, piece, size))
+            self._size += cost
+            separator = " "
+        return chunks
+
+    def flush(self) -> list:
+        """Returns the last, partially filled chunk (if any)."""
+        chunks = [self._emit(keep_overlap=False)] if self._pieces else []
+        return chunks
+
+    def _emit(self, keep_overlap=True) -> str:
+        chunk = "".join(
+            (separator if i else "") + piece for i, (separator, piece, _) in enumerate(self._pieces)
+        )
+        tail, tail_size = [], 0
+        if keep_overlap and self.overlap:
+            for separator, piece, size in reversed(self._pieces):
+                if tail_size + size > self.overlap:
+                    break
+                tail.append((separator, piece, size))
+                tail_size += size + self.measure(separator)
+            tail.reverse()
+        self._pieces = tail
+        self._size = sum(size for _, _, size in tail) + sum(self.measure(s) for s, _, _ in tail[1:])
+        return chunk
+
+    def _fit(self, paragraph: str):
+        """Yields (piece, size) pairs of the paragraph, each within the budget."""
+        size = self.measure(paragraph)
+        if size <= self.budget:
+            yield paragraph, size
+            return
+        for sentence in _SENTENCE_END_RE.split(paragraph):
+            size = self.measure(sentence)
+            if size <= self.budget:
+                yield sentence, size
+            else:
+                yield from self._split_words(sentence)
+
+    def _split_words(self, sentence: str):
+        words, words_size = [], 0
+        for word in sentence.split():
+            size = self.measure(word)
+            if size > self.budget:
+                # a single giant "word" (e.g. a data URL): cut it into pieces that fit
+                if words:
+                    yield " ".join(words), words_size
+                    words, words_size = [], 0
+                yield from self._cut_word(word)
+                continue
+            cost = size + (self.measure(" ") if words else 0)
+            if words and words_size + cost > self.budget:
+                yield " ".join(words), words_size
+                words, words_size, cost = [], 0, size
+            words.append(word)
+            words_size += cost
+        if words:
+            yield " ".join(words), words_size
+
+    def _cut_word(self, word: str):
+        # the longest prefix that fits, found by a binary search on its measured size,
+        # so pieces stay within the budget whatever the text's characters per token
+        start = 0
+        while start < len(word):
+            low, high = 1, len(word) - start
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self.measure(word[start:start + middle]) <= self.budget:
+                    low = middle
+                else:
+                    high = middle - 1
+            part = word[start:start + low]
+            yield part, self.measure(part)
+            start += low
+
+
+def iter_paragraphs(source):
+    """Yields the paragraphs of a string, or of every string produced by an iterable/generator."""
+    if isinstance(source, str):
+        source = (source,)
+    for text in source:
+        yield from text.split("\n")
+
+
+def iter_chunks(source, budget: int, overlap: int = 0, measure=estimate_tokens):
+    """Lazily packs the paragraphs of `source` (a string or an iterable of strings) into chunks."""
+    packer = ChunkPacker(budget, overlap, measure)
+    for paragraph in iter_paragraphs(source):
+        yield from packer.add(paragraph)
+    yield from packer.flush()
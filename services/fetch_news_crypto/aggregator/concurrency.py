@@ -0,0 +1,202 @@
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+# Bounds and starting point of the adaptive Ollama concurrency limit
+OLLAMA_MIN_CONCURRENCY = int(os.getenv("OLLAMA_MIN_CONCURRENCY", "1"))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "8"))
+OLLAMA_INITIAL_CONCURRENCY = int(os.getenv("OLLAMA_INITIAL_CONCURRENCY", "1"))
+# A request is "degraded" once its latency per token exceeds the baseline by this factor
+OLLAMA_LATENCY_TOLERANCE = float(os.getenv("OLLAMA_LATENCY_TOLERANCE", "2.0"))
+# Multiplicative decrease applied on errors and degraded latency
+OLLAMA_BACKOFF = float(os.getenv("OLLAMA_BACKOFF", "0.5"))
+
+# How fast the baselines follow worse samples taken at the minimum limit
+# (they follow better samples at once)
+_BASELINE_DRIFT = 0.2
+
+
+class Slot:
+    """One admitted request; feeds its outcome back to the limiter when it ends."""
+
+    def __init__(self, cost, epoch, saturated):
+        self.cost = cost
+        self.epoch = epoch
+        self.saturated = saturated
+        self.started = time.monotonic()
+        self.tokens = None
+        self.eval_seconds = None
+        self.error = False
+        self.cached = False
+
+    def report(self, tokens=None, eval_seconds=None, error=False, cached=False):
+        """
+        Records what the request produced.
+
+        Args:
+            tokens (int, optional): Generated tokens (Ollama eval_count).
+            eval_seconds (float, optional): Generation time (Ollama eval_duration).
+            error (bool): The request failed.
+            cached (bool): The answer came from a cache; the sample says nothing about the upstream.
+        """
+        self.tokens = tokens
+        self.eval_seconds = eval_seconds
+        self.error = error
+        self.cached = cached
+
+
+class AdaptiveLimiter:
+    """
+    Adaptive (AIMD) concurrency limit for an upstream whose capacity is unknown.
+
+    - Additive increase: every healthy request that completed while the limit
+      was fully used raises the limit by 1/limit, i.e. by about one per round.
+    - Multiplicative decrease: an error, or a request whose latency per token
+      (or generation speed) degraded beyond `tolerance` times the baseline,
+      multiplies the limit by `backoff`. Requests admitted before a decrease
+      cannot trigger another one, so one overload only backs off once.
+
+    Waiting requests are admitted shortest-first (by their `cost`, e.g. the
+    chunk's token count), which minimizes the total time chunks spend waiting
+    and yields latency samples early in a run. Requests queued in the same
+    event-loop iteration (e.g. by asyncio.gather) are ordered together.
+    """
+
+    def __init__(self, min_limit=OLLAMA_MIN_CONCURRENCY, max_limit=OLLAMA_MAX_CONCURRENCY,
+                 initial_limit=OLLAMA_INITIAL_CONCURRENCY, tolerance=OLLAMA_LATENCY_TOLERANCE,
+                 backoff=OLLAMA_BACKOFF):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.tolerance = tolerance
+        self.backoff = backoff
+
+        self._waiters = []
+        self._order = itertools.count()
+        self._dispatch_loop = None
+        self._in_flight = 0
+        self._epoch = 0
+
+        self._latency_baseline = None
+        self._speed_baseline = None
+        self.completed = 0
+        self.errors = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 0):
+        """Waits for a free slot (shortest cost first) and holds it for the duration of the block."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (cost, next(self._order), future))
+        self._schedule_dispatch(loop)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # admitted just before the cancellation: give the slot back
+                self._in_flight -= 1
+                self._schedule_dispatch(loop)
+            raise
+
+        slot = Slot(cost, self._epoch, saturated=self._in_flight >= self.limit)
+        try:
+            yield slot
+        except Exception:
+            slot.error = True
+            raise
+        finally:
+            self._in_flight -= 1
+            self._record(slot)
+            self._schedule_dispatch(loop)
+
+    def _schedule_dispatch(self, loop):
+        # deferred, so that every request queued in this loop iteration competes by cost
+        if self._dispatch_loop is not loop:
+            self._dispatch_loop = loop
+            loop.call_soon(self._dispatch)
+
+    def _dispatch(self):
+        self._dispatch_loop = None
+        while self._waiters and self._in_flight < self.limit:
+            *_, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # cancelled while waiting
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _record(self, slot):
+        if slot.cached:
+            return
+        self.completed += 1
+        latency = time.monotonic() - slot.started
+
+        if slot.error:
+            self.errors += 1
+            self._decrease(slot)
+            return
+
+        per_token = latency / max(1.0, slot.cost + (slot.tokens or 0))
+        speed = slot.tokens / slot.eval_seconds if slot.tokens and slot.eval_seconds else None
+
+        degraded = (
+            self._latency_baseline is not None and per_token > self._latency_baseline * self.tolerance
+        ) or (
+            speed is not None and self._speed_baseline is not None
+            and speed * self.tolerance < self._speed_baseline
+        )
+        # worse samples only move the baselines when concurrency cannot be the
+        # cause (the upstream itself got slower), otherwise the baselines would
+        # creep along with a slowly growing overload
+        unloaded = self.limit <= self.min_limit
+        self._latency_baseline = self._follow(self._latency_baseline, per_token, unloaded, lower_is_better=True)
+        if speed is not None:
+            self._speed_baseline = self._follow(self._speed_baseline, speed, unloaded, lower_is_better=False)
+
+        if degraded:
+            self._decrease(slot)
+        elif slot.saturated:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    @staticmethod
+    def _follow(baseline, sample, unloaded, lower_is_better):
+        if baseline is None or (sample < baseline) == lower_is_better:
+            return sample
+        if unloaded:
+            return baseline + (sample - baseline) * _BASELINE_DRIFT
+        return baseline
+
+    def _decrease(self, slot):
+        if slot.epoch != self._epoch:
+            return
+        self._epoch += 1
+        self.decreases += 1
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "errors": self.errors,
+            "decreases": self.decreases,
+            "latency_per_token_baseline": self._latency_baseline,
+            "tokens_per_second_baseline": self._speed_baseline,
+        }
+
+
+ollama_limiter = AdaptiveLimiter()
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import re
+import zlib
+import numpy as np
+
+# MinHash / LSH settings
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "5"))
+# Minimum estimated Jaccard similarity for two articles to count as near-duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+
+def _normalize(text: str) -> list:
+    return _WORD_RE.findall(text.lower())
+
+
+class NearDuplicateIndex:
+    """
+    Online duplicate detector for news articles.
+
+    Every article is checked against the representatives seen so far, first by
+    an exact hash of its normalized text and then by MinHash signatures over
+    word shingles, bucketed with LSH so each lookup only compares against a
+    handful of candidates (linear in the number of articles overall).
+    The first article of a cluster is its representative; later duplicates
+    are recorded on it under "duplicates".
+    """
+
+    def __init__(self, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS,
+                 shingle_size=DEDUP_SHINGLE_SIZE, threshold=DEDUP_THRESHOLD, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        self._exact = {}
+        self._buckets = {}
+        self._signatures = []
+        self._representatives = []
+
+    def signature(self, words: list) -> np.ndarray:
+        size = self.shingle_size
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        # (a * x + b) mod p for every permutation and shingle, then the minimum per permutation
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=1)
+
+    def add(self, item: dict):
+        """
+        Adds an article. Returns None if it is new (it becomes a representative),
+        or the representative it was merged into if it is a duplicate.
+        """
+        words = _normalize(item.get("content", ""))
+        if not words:
+            return None
+
+        digest = hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+        if digest in self._exact:
+            return self._merge(self._exact[digest], item)
+
+        signature = self.signature(words)
+        band_keys = [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+        candidates = set()
+        for key in band_keys:
+            candidates.update(self._buckets.get(key, ()))
+        for index in sorted(candidates):
+            if np.mean(self._signatures[index] == signature) >= self.threshold:
+                return self._merge(index, item)
+
+        index = len(self._representatives)
+        self._representatives.append(item)
+        self._signatures.append(signature)
+        self._exact[digest] = index
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(index)
+        return None
+
+    def _merge(self, index: int, item: dict) -> dict:
+        representative = self._representatives[index]
+        representative.setdefault("duplicates", []).append({
+            "title": item.get("title", ""),
+            "link": item.get("link", ""),
+            "source": item.get("source", ""),
+        })
+        return representative
+
+
+def deduplicate_news(items: list) -> list:
+    """Returns one representative per cluster of duplicate articles, in input order."""
+    index = NearDuplicateIndex()
+    unique = [item for item in items if index.add(item) is None]
+    removed = len(items) - len(unique)
+    if removed:
+        print(f"[dedup] Dropped {removed} duplicate articles out of {len(items)}")
+    return unique
@@ -0,0 +1,94 @@
+import httpx
+import os
+import weakref
+
+# Connection pool settings shared by every upstream client
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the optional "h2" package (pip install httpx[http2])
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0") == "1"
+
+# Default timeouts per upstream
+UPSTREAM_TIMEOUTS = {
+    "services": httpx.Timeout(180.0, connect=10.0),
+    "ollama": httpx.Timeout(600.0, connect=60.0),
+}
+
+_clients = {}
+_stats = {}
+
+
+class PoolStats:
+    """Counts requests per upstream and whether they went over a new or a reused connection."""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self._seen_streams = weakref.WeakSet()
+
+    async def on_response(self, response: httpx.Response):
+        self.requests += 1
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        if stream in self._seen_streams:
+            self.reused_connections += 1
+        else:
+            self._seen_streams.add(stream)
+            self.new_connections += 1
+
+    def as_dict(self) -> dict:
+        tracked = self.new_connections + self.reused_connections
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_ratio": round(self.reused_connections / tracked, 3) if tracked else 0.0,
+        }
+
+
+def _create_client(name: str) -> httpx.AsyncClient:
+    stats = _stats.setdefault(name, PoolStats())
+    kwargs = dict(
+        timeout=UPSTREAM_TIMEOUTS.get(name, httpx.Timeout(60.0)),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        event_hooks={"response": [stats.on_response]},
+    )
+    if HTTP2_ENABLED:
+        try:
+            return httpx.AsyncClient(http2=True, **kwargs)
+        except ImportError as e:
+            print(f"[!] HTTP/2 requested but unavailable, falling back to HTTP/1.1: {e}")
+    return httpx.AsyncClient(**kwargs)
+
+
+def open_clients():
+    """Creates the long-lived client of every known upstream (called from the app lifespan)."""
+    for name in UPSTREAM_TIMEOUTS:
+        get_client(name)
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Returns the shared client of an upstream, creating it on first use."""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _create_client(name)
+        _clients[name] = client
+    return client
+
+
+async def close_clients():
+    """Closes every shared client and its connection pool."""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def pool_stats() -> dict:
+    return {name: stats.as_dict() for name, stats in _stats.items()}
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+
+# Two-tier cache for LLM analyses
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "received_data/llm_cache")
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+LLM_CACHE_MAX_AGE = float(os.getenv("LLM_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+
+# Disk eviction runs once every this many writes
+_EVICT_EVERY = 32
+
+
+def cache_key(model: str, template: str, chunk: str, options: dict) -> str:
+    """Hash of everything that determines the LLM output for a chunk."""
+    payload = json.dumps(
+        {"model": model, "template": template, "chunk": chunk, "options": options or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    LLM analysis cache with an in-memory LRU tier in front of an on-disk tier
+    (one JSON file per key). Disk entries older than max_age are dropped and
+    the oldest entries are evicted once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory=LLM_CACHE_DIR, memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+                 max_bytes=LLM_CACHE_MAX_BYTES, max_age=LLM_CACHE_MAX_AGE):
+        self.directory = Path(directory)
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._memory = OrderedDict()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _file(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return self._memory[key]
+
+        path = self._file(key)
+        try:
+            if time.time() - path.stat().st_mtime <= self.max_age:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)["result"]
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+            path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[llm_cache] Failed to read {path}: {e}")
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: str):
+        self._remember(key, value)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self._file(key)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"result": value, "created_at": time.time()}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[llm_cache] Failed to write {key}: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % _EVICT_EVERY == 1:
+            self.evict()
+
+    def evict(self):
+        """Drops expired disk entries, then the oldest ones until the size bound holds."""
+        if not self.directory.exists():
+            return
+        now = time.time()
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+analysis_cache = AnalysisCache()
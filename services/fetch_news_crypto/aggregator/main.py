@@ -1,101 +1,654 @@
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse, Response
+from contextlib import asynccontextmanager
 import httpx
 import asyncio
 import json
+import time
+import uuid
 from pathlib import Path
-from utils import split_text_into_chunks, analyze_with_ollama
+from utils import (analyze_with_ollama, stream_analysis, ArticleChunker, chunk_articles, is_analysis_error,
+                   last_call_stats, portfolio_prompt)
+from mentions import MentionExtractor, MentionIndex, load_coins, load_portfolio
+from analysis_state import AnalysisState
+from article_store import ArticleStore, parse_published
+from chunking import estimate_tokens
+from concurrency import ollama_limiter
+from http_clients import open_clients, close_clients, get_client, pool_stats
+from dedup import NearDuplicateIndex, deduplicate_news
+from llm_cache import analysis_cache
+from metrics import STAGE_SECONDS, RETRIES, FAILURES, SHORT_CIRCUITS, HEDGES, render_metrics
+from resilience import (RETRY_BASE_DELAY, CircuitOpenError, Deadline, backoff_delay, hedged, fetch_deadline,
+                        service_breakers)
 import os
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 
-# List of microservices that provide crypto news
-SERVICES = [
-    os.getenv("SERVICE_1_URL", "http://service1:8000/fetch_news"),
-    os.getenv("SERVICE_2_URL", "http://service2:8000/fetch_news"),
-    os.getenv("SERVICE_3_URL", "http://service3:8000/fetch_news")
-]
+# The feed-worker replicas that provide crypto news, each for its share of the feeds:
+# FEED_WORKER_URLS (comma-separated /fetch_news URLs), or else every replica whose host
+# name FEED_WORKER_HOST_TEMPLATE.format(i=i) resolves, for i in range(FEED_WORKER_MAX_REPLICAS)
+SERVICES = [url.strip() for url in os.getenv("FEED_WORKER_URLS", "").split(",") if url.strip()]
+FEED_WORKER_HOST_TEMPLATE = os.getenv("FEED_WORKER_HOST_TEMPLATE", "feed-worker-{i}.feed-worker")
+FEED_WORKER_MAX_REPLICAS = int(os.getenv("FEED_WORKER_MAX_REPLICAS", "16"))
+FEED_WORKER_PORT = int(os.getenv("FEED_WORKER_PORT", "8000"))
+
+# Read the services' NDJSON stream (/fetch_news/stream) instead of waiting for the full JSON body
+STREAM_NEWS = os.getenv("STREAM_NEWS", "0") == "1"
+
+# Only entries published in the last NEWS_WINDOW_HOURS are downloaded by the services.
+# 24h always covers "today" in the publisher's own timezone, which is_published_today() checks exactly.
+NEWS_WINDOW_HOURS = float(os.getenv("NEWS_WINDOW_HOURS", "24"))
+
+# Metadata first: the services are listed with these fields, NEWS_PAGE_SIZE items per
+# page, and the full content is only requested for the articles that will be analyzed,
+# NEWS_CONTENT_BATCH links per request
+NEWS_META_FIELDS = "title,link,published,source,partial,content_hash"
+NEWS_PAGE_SIZE = int(os.getenv("NEWS_PAGE_SIZE", "200"))
+NEWS_CONTENT_BATCH = int(os.getenv("NEWS_CONTENT_BATCH", "25"))
+
+# Resilience of the calls to the services (see resilience.py): a replica is tried
+# UPSTREAM_RETRIES times with exponential backoff behind its circuit breaker, all
+# fetches of a run share a budget of RUN_FETCH_BUDGET seconds (0 = unbounded), and a
+# request still unanswered after UPSTREAM_HEDGE_DELAY seconds is sent again (0 = never)
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "5"))
+RUN_FETCH_BUDGET = float(os.getenv("RUN_FETCH_BUDGET", "300"))
+UPSTREAM_HEDGE_DELAY = float(os.getenv("UPSTREAM_HEDGE_DELAY", "0"))
+
+# "all": every new article is analyzed with the generic prompt. "portfolio": only the
+# articles that mention a held coin (see mentions.py) are analyzed, grouped per coin
+# with a prompt about that coin
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "all")
+
+# Per-article analysis state kept in received_data/ between runs (one per analysis mode)
+ANALYSIS_STATE_FILE = os.getenv(
+    "ANALYSIS_STATE_FILE", "analysis_state.json" if ANALYSIS_MODE == "all" else f"analysis_state_{ANALYSIS_MODE}.json"
+)
+# Indexed store of every aggregated article (SQLite), in received_data/; the day's
+# report and crypto_news.json are read back from it
+ARTICLE_DB_FILE = os.getenv("ARTICLE_DB_FILE", "articles.db")
 
 # URL and model name for Ollama LLM service
 OLLAMA_URL = os.getenv("OLLAMA_API", "http://ollama:11434") + "/api/generate"
 OLLAMA_MODEL = "llama3"
 
-# Semaphore to limit concurrent analysis requests
-semaphore = asyncio.Semaphore(1)
+# Concurrent analysis requests are limited by concurrency.ollama_limiter, which
+# adapts the limit to the observed Ollama latency and errors (OLLAMA_*_CONCURRENCY)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one long-lived, pooled client per upstream for the lifetime of the app
+    open_clients()
+    yield
+    await close_clients()
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/pool_stats")
+def get_pool_stats():
+    """Connection pool statistics of the shared upstream clients."""
+    return pool_stats()
+
+
+@app.get("/llm_cache_stats")
+def get_llm_cache_stats():
+    """Hit/miss counters of the LLM analysis cache."""
+    return analysis_cache.stats()
 
-app = FastAPI()
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: stage latencies, retries, failures, cache hits and LLM speed."""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/circuit_breakers")
+def get_circuit_breakers():
+    """State of the circuit breaker of every feed-worker replica."""
+    return service_breakers.stats()
+
+
+@app.get("/ollama_limiter")
+def get_ollama_limiter():
+    """Current adaptive concurrency limit and queue depth of the Ollama calls."""
+    return ollama_limiter.stats()
 
 def is_published_today(published_str: str) -> bool:
-    try:
-        # example: "Mon, 28 Jul 2025 20:23:43 +0100"
-        published_dt = datetime.strptime(published_str, "%a, %d %b %Y %H:%M:%S %z")
-        today = datetime.now(published_dt.tzinfo).date()
-        return published_dt.date() == today
-    except Exception as e:
-        print(f"[!] Failed to parse published date: {published_str} | {e}")
+    """Whether a feed's published date (see parse_published) is today in the publisher's timezone."""
+    # example: "Mon, 28 Jul 2025 20:23:43 +0100"
+    published_dt = parse_published(published_str)
+    if published_dt is None:
+        print(f"[!] Failed to parse published date: {published_str}")
         return False
+    return published_dt.date() == datetime.now(published_dt.tzinfo).date()
 
 
-async def fetch_with_retry(url: str, retries: int = 5, delay: float = 5.0):
-    """Try to fetch data from a service with retries on failure."""
+def news_window() -> dict:
+    """Query parameters with the publication window the services should apply before downloading."""
+    since = datetime.now(timezone.utc) - timedelta(hours=NEWS_WINDOW_HOURS)
+    return {"since": since.isoformat()}
+
+
+async def discover_services() -> list:
+    """The /fetch_news URLs of the feed-worker replicas (see SERVICES)."""
+    if SERVICES:
+        return SERVICES
+    loop = asyncio.get_running_loop()
+    hosts = [FEED_WORKER_HOST_TEMPLATE.format(i=i) for i in range(FEED_WORKER_MAX_REPLICAS)]
+    resolved = await asyncio.gather(
+        *[loop.getaddrinfo(host, FEED_WORKER_PORT) for host in hosts], return_exceptions=True
+    )
+    services = [
+        f"http://{host}:{FEED_WORKER_PORT}/fetch_news"
+        for host, result in zip(hosts, resolved) if not isinstance(result, BaseException)
+    ]
+    print(f"Discovered {len(services)} feed-worker replicas")
+    return services
+
+def record_error(breaker, error: Exception):
+    """Feeds a failed attempt to the breaker; a 4xx other than 429 still proves the host is alive."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status < 500 and status != 429:
+            breaker.record_success()
+            return
+    breaker.record_failure()
+
+def attempt_timeout(client: httpx.AsyncClient, deadline: Deadline) -> httpx.Timeout:
+    """The client's timeouts, shortened to what is left of the run's fetch budget."""
+    return httpx.Timeout(deadline.cap(client.timeout.read), connect=deadline.cap(client.timeout.connect))
+
+async def fetch_with_retry(url: str, retries: int = UPSTREAM_RETRIES, delay: float = RETRY_BASE_DELAY,
+                           params: dict | None = None):
+    """
+    Try to fetch data from a service, retrying failures with exponential backoff
+    (delay is the base wait). Gives up with no items as soon as the service's
+    circuit breaker is open or the run's fetch budget would be exceeded.
+    """
+    breaker = service_breakers.get(url)
+    deadline = fetch_deadline.get()
+    client = get_client("services")
     for attempt in range(1, retries + 1):
+        if attempt > 1:
+            RETRIES.labels("upstream_fetch").inc()
         try:
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                response = await client.get(url)
+            breaker.check()
+            timeout = attempt_timeout(client, deadline)
+            with STAGE_SECONDS.labels("upstream_fetch").time():
+                response = await hedged(
+                    lambda: client.get(url, params=params, timeout=timeout), UPSTREAM_HEDGE_DELAY,
+                    on_hedge=HEDGES.labels("upstream_fetch").inc,
+                )
                 response.raise_for_status()
-                return response.json()
+                data = response.json()
+            breaker.record_success()
+            return data
 
+        except CircuitOpenError as e:
+            SHORT_CIRCUITS.labels("upstream_fetch").inc()
+            print(f"[{url}] {e}, not fetching.")
+            break
         except httpx.HTTPStatusError as e:
+            record_error(breaker, e)
             print(f"[{url}] Attempt {attempt} failed: HTTP {e.response.status_code} - {e}")
         except Exception as e:
+            # a timeout cut short by the run's budget says nothing about the service
+            if not deadline.expired:
+                record_error(breaker, e)
             print(f"[{url}] Attempt {attempt} failed: {repr(e)}")
-        if attempt < retries:
-            await asyncio.sleep(delay)
+        wait = backoff_delay(attempt, delay)
+        if attempt == retries or wait >= deadline.remaining():
+            break
+        await asyncio.sleep(wait)
+
+    FAILURES.labels("upstream_fetch").inc()
+    print(f"[{url}] Gave up after {attempt} attempts.")
+    return {"items": []}
+
+async def fetch_listing(url: str, params: dict) -> list:
+    """Every page of a service's /fetch_news listing, following next_cursor."""
+    items = []
+    while True:
+        data = await fetch_with_retry(url, params=params)
+        items.extend(data.get("items", []))
+        cursor = data.get("next_cursor")
+        if not cursor:
+            return items
+        params = {**params, "cursor": cursor}
+
+async def fetch_contents(url: str, links: list, run: str) -> dict:
+    """The full articles behind some links of one service, by link, from the scrape of the run's listing."""
+    batches = [links[i:i + NEWS_CONTENT_BATCH] for i in range(0, len(links), NEWS_CONTENT_BATCH)]
+    responses = await asyncio.gather(
+        *[fetch_with_retry(url, params={"link": batch, "run": run}) for batch in batches]
+    )
+    return {item.get("link"): item for data in responses for item in data.get("items", [])}
+
+async def fetch_todays_news(state: AnalysisState) -> tuple:
+    """
+    Lists today's articles of every service by their metadata, and returns
+    (listed, today_news): the articles already analyzed under the same
+    content hash are taken from the state, only the others are downloaded
+    in full. A service that ignores the projection sends full articles,
+    which are used as they are.
+
+    Every request carries the same run id, so a service that is not polling
+    scrapes its feeds once for the whole run instead of once per request.
+    """
+    services = await discover_services()
+    run = uuid.uuid4().hex
+    params = {**news_window(), "fields": NEWS_META_FIELDS, "limit": NEWS_PAGE_SIZE, "run": run}
+    listings = await asyncio.gather(*[fetch_listing(url, params) for url in services])
+
+    stored, downloads = {}, {url: [] for url in services}
+    for url, listing in zip(services, listings):
+        for meta in listing:
+            if "content" in meta or not is_published_today(meta.get("published", "")):
+                continue
+            item = state.analyzed_item(meta.get("link"), meta.get("content_hash"))
+            if item is not None:
+                stored[meta.get("link")] = item
+            else:
+                downloads[url].append(meta.get("link"))
+
+    contents = await asyncio.gather(
+        *[fetch_contents(url, links, run) for url, links in downloads.items() if links]
+    )
+    downloaded = {link: item for batch in contents for link, item in batch.items()}
+
+    # analyzed articles first, so a new copy of one of them is the duplicate
+    today_news = list(stored.values())
+    for listing in listings:
+        for meta in listing:
+            if "content" in meta:
+                if is_published_today(meta.get("published", "")):
+                    today_news.append(meta)
+            elif meta.get("link") in downloaded:
+                today_news.append(downloaded.pop(meta.get("link")))
+    return [meta for listing in listings for meta in listing], today_news
+
+async def stream_with_retry(url: str, queue: asyncio.Queue, retries: int = UPSTREAM_RETRIES,
+                            delay: float = RETRY_BASE_DELAY, params: dict | None = None):
+    """
+    Reads a service's NDJSON stream and puts every article on the queue as soon
+    as its line arrives. On failure the stream is retried with exponential
+    backoff; articles already delivered by a previous attempt are skipped.
+    Like fetch_with_retry(), it stops at an open circuit breaker and at the end
+    of the run's fetch budget.
+    """
+    stream_url = url.rstrip("/") + "/stream"
+    breaker = service_breakers.get(url)
+    deadline = fetch_deadline.get()
+    client = get_client("services")
+    delivered = set()
+    for attempt in range(1, retries + 1):
+        if attempt > 1:
+            RETRIES.labels("upstream_stream").inc()
+        started = time.monotonic()
+        try:
+            breaker.check()
+            async with asyncio.timeout(deadline.cap(None)):
+                async with client.stream("GET", stream_url, params=params,
+                                         timeout=attempt_timeout(client, deadline)) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        item = json.loads(line)
+                        key = item.get("link") or line
+                        if key in delivered:
+                            continue
+                        delivered.add(key)
+                        await queue.put(item)
+            STAGE_SECONDS.labels("upstream_stream").observe(time.monotonic() - started)
+            breaker.record_success()
+            return
+
+        except CircuitOpenError as e:
+            SHORT_CIRCUITS.labels("upstream_stream").inc()
+            print(f"[{stream_url}] {e}, not streaming.")
+            break
+        except httpx.HTTPStatusError as e:
+            record_error(breaker, e)
+            print(f"[{stream_url}] Attempt {attempt} failed: HTTP {e.response.status_code} - {e}")
+        except Exception as e:
+            # a timeout cut short by the run's budget says nothing about the service
+            if not deadline.expired:
+                record_error(breaker, e)
+            print(f"[{stream_url}] Attempt {attempt} failed: {repr(e)}")
+        wait = backoff_delay(attempt, delay)
+        if attempt == retries or wait >= deadline.remaining():
+            break
+        await asyncio.sleep(wait)
+
+    FAILURES.labels("upstream_stream").inc()
+    print(f"[{stream_url}] Gave up after {attempt} attempts.")
+
+async def analyze_limited(chunk: str, prompt_template: str | None = None):
+    # prompt_template=None: the default analysis prompt
+    args = (chunk,) if prompt_template is None else (chunk, prompt_template)
+    # shorter chunks are admitted first
+    async with ollama_limiter.slot(estimate_tokens(chunk)) as slot:
+        result = await analyze_with_ollama(*args)
+        slot.report(**(last_call_stats.get() or {}))
+        return result
+
+async def analyze_limited_stream(chunk: str, on_token, prompt_template: str | None = None):
+    """Like analyze_limited(), but passes every piece of the answer to on_token as it is generated."""
+    args = (chunk,) if prompt_template is None else (chunk, prompt_template)
+    async with ollama_limiter.slot(estimate_tokens(chunk)) as slot:
+        pieces = []
+        async for piece in stream_analysis(*args):
+            pieces.append(piece)
+            on_token(piece)
+        stats = last_call_stats.get() or {}
+        slot.report(**stats)
+        return pieces[-1] if stats.get("error") else "".join(pieces).strip()
+
+class AnalysisRun:
+    """
+    Analyzes the chunks of one run and appends every summary to
+    crypto_news_analysis.txt as soon as its chunk completes (after the
+    summaries kept from earlier runs), so the file fills up during the run;
+    save_report() rewrites it in article order at the end.
+
+    With on_event(event, data), the answer is also forwarded as it is
+    generated: "token" events with the chunk number and the text, and a
+    "chunk_done" event with the chunk's full summary.
+    """
+
+    def __init__(self, path: Path, prior_summaries: list, on_event=None):
+        self.path = path / "crypto_news_analysis.txt"
+        self.prior_summaries = prior_summaries
+        self.on_event = on_event
+        self._file = None
+        self._written = 0
+        self._started = 0
+
+    def _write(self, summary: str):
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8")
+            for prior in self.prior_summaries:
+                self._write(prior)
+        self._written += 1
+        self._file.write(f"\n--- Chunk {self._written} ---\n{summary}\n")
+        self._file.flush()
+
+    async def analyze(self, chunk: str, prompt_template: str | None = None) -> str:
+        self._started += 1
+        number = self._started
+        if self.on_event is None:
+            summary = await analyze_limited(chunk, prompt_template)
         else:
-            print(f"[{url}] Failed after {retries} attempts.")
-            return {"items": []}
+            summary = await analyze_limited_stream(
+                chunk, lambda piece: self.on_event("token", {"chunk": number, "text": piece}), prompt_template
+            )
+        self._write(summary)
+        if self.on_event is not None:
+            self.on_event("chunk_done", {"chunk": number, "summary": summary, "error": is_analysis_error(summary)})
+        return summary
 
-async def analyze_limited(chunk: str):
-    async with semaphore:
-        return await analyze_with_ollama(chunk)
+    def close(self):
+        if self._file is not None:
+            self._file.close()
 
-async def orchestrate_and_save_news():
-    all_news = []
+def save_report(path: Path, state: AnalysisState, today_news: list, chunks: list, results: list) -> dict:
+    """
+    Records this run's analyses in the state, ingests the articles into the
+    article store and rewrites the day's report from it: crypto_news.json
+    holds every article of the day (also those stored by earlier runs) and
+    crypto_news_analysis.txt every chunk summary covering them.
+    """
+    items_by_link = {item.get("link"): item for item in today_news}
+    errors = [summary for summary in results if is_analysis_error(summary)]
+    # an article is only marked as analyzed when all of its chunks succeeded
+    failed = {link for (_, links), summary in zip(chunks, results) if is_analysis_error(summary) for link in links}
+    for (chunk, links), summary in zip(chunks, results):
+        links = [link for link in links if link not in failed]
+        if links and not is_analysis_error(summary):
+            state.record(chunk, links, summary, items_by_link)
 
-    # Fetch from services with retry
-    fetch_tasks = [fetch_with_retry(url) for url in SERVICES]
-    responses = await asyncio.gather(*fetch_tasks)
+    state.save()
 
-    for data in responses:
-        all_news.extend(data.get("items", []))
+    with ArticleStore(path / ARTICLE_DB_FILE) as store:
+        # the state's articles too, so those that left the feeds stay in the day's report
+        store.ingest(state.merge_items(today_news))
+        day_news = store.published_today()
+    summaries = state.summaries(day_news) + errors
 
-    # Filter today's news only
-    today_news = [item for item in all_news if is_published_today(item.get("published", ""))]
+    with open(path / "crypto_news.json", "w", encoding="utf-8") as f:
+        json.dump(day_news, f, ensure_ascii=False, indent=4)
 
-    if not today_news:
+    with open(path / "crypto_news_analysis.txt", "w", encoding="utf-8") as f:
+        for i, summary in enumerate(summaries):
+            f.write(f"\n--- Chunk {i+1} ---\n{summary}\n")
+
+    return {"day_count": len(day_news), "summary_chunks": summaries}
+
+def portfolio_index() -> tuple:
+    """The held coins and an empty coin-mention index, for ANALYSIS_MODE=portfolio."""
+    held = load_portfolio()
+    # held coins missing from the coin list are still found by their id
+    coins = {**{coin: {} for coin in held}, **load_coins()}
+    return held, MentionIndex(MentionExtractor(coins))
+
+def plan_analysis(new_items: list) -> tuple:
+    """
+    The chunks to analyze for ANALYSIS_MODE, as (chunks, prompt templates,
+    articles sent): every new article with the default prompt (template None),
+    or only those that mention held coins, chunked per coin with its prompt.
+    """
+    if ANALYSIS_MODE != "portfolio":
+        chunks = chunk_articles(new_items)
+        return chunks, [None] * len(chunks), new_items
+    held, index = portfolio_index()
+    chunks, templates, selected = [], [], []
+    for coin, items in index.group_by_coin(new_items, held).items():
+        template = portfolio_prompt(index.extractor.label(coin))
+        coin_chunks = chunk_articles(items, prompt_template=template)
+        chunks += coin_chunks
+        templates += [template] * len(coin_chunks)
+        selected += items
+    print(f"Portfolio mode: {len(selected)} of {len(new_items)} new articles mention held coins")
+    return chunks, templates, selected
+
+def load_state(path: Path) -> AnalysisState:
+    """Loads the analysis state, keeping only articles that are still from today."""
+    state = AnalysisState(path / ANALYSIS_STATE_FILE)
+    state.prune(lambda item: is_published_today(item.get("published", "")))
+    return state
+
+async def orchestrate_and_save_news(stream: bool = STREAM_NEWS, on_event=None):
+    """
+    Fetches, deduplicates and analyzes today's news and saves the day's report.
+    on_event(event, data) optionally receives the analysis as it is generated
+    (see AnalysisRun).
+    """
+    # one budget for every upstream fetch of the run, so a dead replica cannot stall it
+    fetch_deadline.set(Deadline(RUN_FETCH_BUDGET))
+    if stream:
+        return await orchestrate_streaming_news(on_event)
+
+    path = Path("received_data")
+    path.mkdir(parents=True, exist_ok=True)
+    state = load_state(path)
+
+    # Today's articles, limited to the publication window and downloaded only when not analyzed yet
+    all_news, today_news = await fetch_todays_news(state)
+
+    # Keep one article per cluster of syndicated / duplicate stories
+    today_news = deduplicate_news(today_news)
+
+    if not today_news and not state.articles:
         print("No news published today.")
         return {"message": "No news published today.", "count": 0}
 
-    # Save the news to a JSON file
+    # Analyze only the articles that are new or changed since an earlier run
+    new_items = state.pending(today_news)
+    chunks, templates, pending = plan_analysis(new_items)
+    run = AnalysisRun(path, state.summaries(state.merge_items([])), on_event)
+    try:
+        results = await asyncio.gather(*[
+            run.analyze(chunk, template) for (chunk, _), template in zip(chunks, templates)
+        ])
+    finally:
+        run.close()
+
+    report = save_report(path, state, today_news, chunks, results)
+
+    return {
+        "message": f"Saved {report['day_count']} news items and analyzed {len(chunks)} new chunks",
+        "count": len(all_news),
+        "unique_count": len(today_news),
+        "analyzed_count": len(pending),
+        "reused_count": len(today_news) - len(new_items),
+        "skipped_count": len(new_items) - len(pending),
+        "summary_chunks": report["summary_chunks"]
+    }
+
+async def orchestrate_streaming_news(on_event=None):
+    """
+    Streaming variant of orchestrate_and_save_news(): articles are date-filtered
+    and chunked as they arrive from the services, and every chunk is sent to the
+    LLM as soon as it is full, while slower feeds are still downloading.
+    """
+    queue = asyncio.Queue()
+    all_news = []
+    today_news = []
+    pending = []
+    skipped = 0
+    duplicates = NearDuplicateIndex()
+    # one chunker per prompt: a single one, or one per held coin in portfolio mode
+    chunkers = {None: (ArticleChunker(), None)}
+    held, mention_index = portfolio_index() if ANALYSIS_MODE == "portfolio" else ([], None)
+    chunks = []
+    analysis_tasks = []
+
     path = Path("received_data")
     path.mkdir(parents=True, exist_ok=True)
-    with open(path / "crypto_news.json", "w", encoding="utf-8") as f:
-        json.dump(today_news, f, ensure_ascii=False, indent=4)
+    state = load_state(path)
+    run = AnalysisRun(path, state.summaries(state.merge_items([])), on_event)
 
-    # Analyze news content
-    full_text = "\n\n".join([item.get("content", "") for item in all_news if item.get("content")])
-    chunks = split_text_into_chunks(full_text)
-    analysis_tasks = [analyze_limited(chunk) for chunk in chunks]
-    results = await asyncio.gather(*analysis_tasks)
+    def submit(new_chunks, template=None):
+        for chunk, links in new_chunks:
+            chunks.append((chunk, links))
+            analysis_tasks.append(asyncio.create_task(run.analyze(chunk, template)))
 
-    with open(path / "crypto_news_analysis.txt", "w", encoding="utf-8") as f:
-        for i, summary in enumerate(results):
-            f.write(f"\n--- Chunk {i+1} ---\n{summary}\n")
+    def chunker_for(item):
+        """The (chunker, prompt template) of an article, or None when portfolio mode leaves it out."""
+        if mention_index is None:
+            return chunkers[None]
+        mention_index.add(item)
+        coin = mention_index.primary_coin(item.get("link"), held)
+        if coin is None:
+            return None
+        if coin not in chunkers:
+            template = portfolio_prompt(mention_index.extractor.label(coin))
+            chunkers[coin] = (ArticleChunker(prompt_template=template), template)
+        return chunkers[coin]
+
+    async def produce():
+        window = news_window()
+        services = await discover_services()
+        await asyncio.gather(*[stream_with_retry(url, queue, params=window) for url in services])
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+
+    while (item := await queue.get()) is not None:
+        all_news.append(item)
+        if not is_published_today(item.get("published", "")):
+            continue
+        if duplicates.add(item) is not None:
+            continue
+        today_news.append(item)
+        if item.get("content") and not state.is_analyzed(item):
+            target = chunker_for(item)
+            if target is None:
+                skipped += 1
+                continue
+            chunker, template = target
+            pending.append(item)
+            submit(chunker.add(item), template)
+
+    await producer
+
+    if not today_news and not state.articles:
+        print("No news published today.")
+        return {"message": "No news published today.", "count": 0}
+
+    for chunker, template in chunkers.values():
+        submit(chunker.flush(), template)
+    try:
+        results = await asyncio.gather(*analysis_tasks)
+    finally:
+        run.close()
+
+    report = save_report(path, state, today_news, chunks, results)
 
     return {
-        "message": f"Saved {len(all_news)} news items and analyzed {len(chunks)} chunks",
+        "message": f"Saved {report['day_count']} news items and analyzed {len(chunks)} new chunks",
         "count": len(all_news),
-        "summary_chunks": results
+        "unique_count": len(today_news),
+        "analyzed_count": len(pending),
+        "reused_count": len(today_news) - len(pending) - skipped,
+        "skipped_count": skipped,
+        "summary_chunks": report["summary_chunks"]
     }
 
+def sse_event(event: str, data: dict) -> str:
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Pipeline runs started by /analysis/stream (kept referenced until they finish)
+_background_runs = set()
+
+@app.get("/analysis/stream")
+async def stream_news_analysis(stream: bool = STREAM_NEWS):
+    """
+    Runs the pipeline and streams the LLM analysis as server-sent events while
+    it is generated: "token" events ({"chunk", "text"}) per generated piece,
+    "chunk_done" ({"chunk", "summary", "error"}) per completed chunk, and a
+    final "done" event with the run's counts (or "error").
+
+    The run continues and saves its report even if the client disconnects.
+    """
+    queue = asyncio.Queue()
+
+    def on_event(event, data):
+        queue.put_nowait((event, data))
+
+    async def run():
+        try:
+            result = await orchestrate_and_save_news(stream=stream, on_event=on_event)
+            on_event("done", {key: value for key, value in result.items() if key != "summary_chunks"})
+        except Exception as e:
+            print(f"[!] Analysis stream failed: {repr(e)}")
+            on_event("error", {"message": repr(e)})
+        finally:
+            queue.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    _background_runs.add(task)
+    task.add_done_callback(_background_runs.discard)
+
+    async def events():
+        while (message := await queue.get()) is not None:
+            yield sse_event(*message)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def run_once():
+    """Runs the pipeline outside the app (CLI / CronJob) and closes the shared clients afterwards."""
+    try:
+        return await orchestrate_and_save_news()
+    finally:
+        await close_clients()
+
 if __name__ == "__main__":
-    asyncio.run(orchestrate_and_save_news())
+    asyncio.run(run_once())
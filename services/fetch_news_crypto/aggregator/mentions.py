@@ -0,0 +1,181 @@
+from collections import Counter, deque
+from pathlib import Path
+import json
+import os
+
+# CoinGecko ids (the ids fetch_crypto prices coins by) with their name, ticker and
+# optional aliases. Names, aliases and ids are matched case-insensitively, except for
+# coins marked "common_word" (e.g. Maker, Stellar), whose names only match as written;
+# tickers, and names written like the ticker (BNB, XRP), only match in upper case ("SOL", "$SOL").
+COINS_FILE = os.getenv("COINS_FILE", str(Path(__file__).with_name("coins.json")))
+
+# The coins held in the portfolio: PORTFOLIO_COINS (comma-separated CoinGecko ids), or
+# else the "coins" of PORTFOLIO_FILE, a JSON body as posted to fetch_crypto's
+# /crypto/get_coins_prices ({"coins": [{"symbol": "bitcoin", "buy_price": 47000}, ...]})
+PORTFOLIO_COINS = [coin.strip() for coin in os.getenv("PORTFOLIO_COINS", "").split(",") if coin.strip()]
+PORTFOLIO_FILE = os.getenv("PORTFOLIO_FILE", "")
+
+
+def load_coins(path=COINS_FILE) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_portfolio(path=PORTFOLIO_FILE) -> list:
+    """The CoinGecko ids of the held coins, in portfolio order."""
+    if PORTFOLIO_COINS:
+        return PORTFOLIO_COINS
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        coins = json.load(f).get("coins", [])
+    return list(dict.fromkeys(coin["symbol"] for coin in coins))
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton: finds every occurrence of any number of patterns
+    in a single pass over the text, in time linear in the text length plus
+    the number of matches.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern: str, value):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._out[state].append((len(pattern), value))
+
+    def build(self):
+        """Computes the failure links; call once after the last add()."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, target in self._goto[state].items():
+                queue.append(target)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[target] = self._goto[fail].get(char, 0)
+                self._out[target] = self._out[target] + self._out[self._fail[target]]
+        return self
+
+    def iter(self, text: str):
+        """Yields (start, end, value) of every match."""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, value in self._out[state]:
+                yield index + 1 - length, index + 1, value
+
+
+class MentionExtractor:
+    """Finds the coins an article mentions, with one automaton pass over its text."""
+
+    def __init__(self, coins: dict = None):
+        coins = load_coins() if coins is None else coins
+        self.coins = coins
+        self._automaton = AhoCorasick()
+        # lower-cased pattern -> (coin id, the spellings that count; None: any case)
+        patterns = {}
+
+        def accept(pattern, coin_id, spelling):
+            owner, spellings = patterns.setdefault(pattern.lower(), (coin_id, set()))
+            if owner == coin_id:
+                spellings.add(spelling)
+
+        for coin_id, coin in coins.items():
+            symbol = coin.get("symbol")
+            names = [coin.get("name", "")] + coin.get("aliases", [])
+            exact = bool(coin.get("common_word"))
+            if not exact:
+                names += [coin_id, coin_id.replace("-", " ")]
+            for name in filter(None, names):
+                # a name written like the ticker (BNB, XRP) is a ticker
+                accept(name, coin_id, name if exact or name == symbol else None)
+            if symbol:
+                accept(symbol, coin_id, symbol.upper())
+        for pattern, (coin_id, spellings) in patterns.items():
+            self._automaton.add(pattern, (coin_id, frozenset(spellings)))
+        self._automaton.build()
+
+    def label(self, coin_id: str) -> str:
+        """The coin's display name, e.g. "Solana (SOL)"."""
+        coin = self.coins.get(coin_id, {})
+        name = coin.get("name") or coin_id
+        return f"{name} ({coin['symbol']})" if coin.get("symbol") else name
+
+    def mentions(self, text: str) -> Counter:
+        """How many times the text mentions every coin."""
+        lowered = text.lower()
+        if len(lowered) != len(text):  # a few characters lower-case to several
+            lowered = "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+        matches = []
+        for start, end, (coin_id, spellings) in self._automaton.iter(lowered):
+            if start > 0 and lowered[start - 1].isalnum():
+                continue
+            if end < len(lowered) and lowered[end].isalnum():
+                continue
+            if None not in spellings and text[start:end] not in spellings:
+                continue
+            matches.append((start, -end, coin_id))
+        # overlapping matches: the longest wins ("Bitcoin Cash" is not also "Bitcoin")
+        counts = Counter()
+        covered = 0
+        for start, negative_end, coin_id in sorted(matches):
+            if start >= covered:
+                counts[coin_id] += 1
+                covered = -negative_end
+        return counts
+
+    def article_mentions(self, item: dict) -> Counter:
+        return self.mentions((item.get("title") or "") + "\n" + (item.get("content") or ""))
+
+
+class MentionIndex:
+    """Inverted index of coin mentions: coin id -> links of the articles that mention it."""
+
+    def __init__(self, extractor: MentionExtractor):
+        self.extractor = extractor
+        self.articles = {}
+        self.counts = {}
+
+    def add(self, item: dict) -> Counter:
+        link = item.get("link")
+        counts = self.extractor.article_mentions(item)
+        self.counts[link] = counts
+        for coin_id in counts:
+            self.articles.setdefault(coin_id, []).append(link)
+        return counts
+
+    def primary_coin(self, link: str, held: list):
+        """The held coin an article mentions most (the first in portfolio order on ties), or None."""
+        counts = self.counts.get(link) or {}
+        mentioned = [coin for coin in held if counts.get(coin)]
+        return max(mentioned, key=lambda coin: counts[coin]) if mentioned else None
+
+    def group_by_coin(self, items: list, held: list) -> dict:
+        """
+        Groups the articles that mention held coins by coin, in portfolio order.
+        Every article goes to the held coin it mentions most, so none is sent
+        to the LLM twice; articles that mention no held coin are left out.
+        """
+        groups = {coin: [] for coin in held}
+        for item in items:
+            if item.get("link") not in self.counts:
+                self.add(item)
+            coin = self.primary_coin(item.get("link"), held)
+            if coin is not None:
+                groups[coin].append(item)
+        return {coin: group for coin, group in groups.items() if group}
@@ -0,0 +1,51 @@
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Prometheus metrics of the aggregator, exposed at /metrics
+METRICS_REGISTRY = CollectorRegistry()
+
+# Ollama calls take minutes on CPU nodes, so the buckets go up to the 600s client timeout
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Latency of a pipeline stage", ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600), registry=METRICS_REGISTRY,
+)
+RETRIES = Counter("pipeline_retries_total", "Retried pipeline stage calls", ["stage"], registry=METRICS_REGISTRY)
+FAILURES = Counter("pipeline_failures_total", "Failed pipeline stage calls", ["stage"], registry=METRICS_REGISTRY)
+CACHE_HITS = Counter("pipeline_cache_hits_total", "Cache hits", ["cache"], registry=METRICS_REGISTRY)
+CACHE_MISSES = Counter("pipeline_cache_misses_total", "Cache misses", ["cache"], registry=METRICS_REGISTRY)
+SHORT_CIRCUITS = Counter(
+    "pipeline_short_circuits_total", "Calls refused by an open circuit breaker", ["stage"], registry=METRICS_REGISTRY
+)
+HEDGES = Counter("pipeline_hedged_requests_total", "Hedged (duplicate) requests sent", ["stage"], registry=METRICS_REGISTRY)
+
+# Derived from the eval_count / eval_duration / prompt_eval_duration fields of
+# Ollama's final streaming line
+LLM_TOKENS_PER_SECOND = Histogram(
+    "ollama_tokens_per_second", "Generation speed of an Ollama call",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200), registry=METRICS_REGISTRY,
+)
+LLM_PROMPT_EVAL_SECONDS = Histogram(
+    "ollama_prompt_eval_seconds", "Prompt evaluation time of an Ollama call",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300), registry=METRICS_REGISTRY,
+)
+LLM_TOKENS = Counter("ollama_eval_tokens_total", "Tokens generated by Ollama", registry=METRICS_REGISTRY)
+LLM_PROMPT_TOKENS = Counter("ollama_prompt_tokens_total", "Prompt tokens evaluated by Ollama", registry=METRICS_REGISTRY)
+
+
+def observe_ollama_stats(data: dict):
+    """Records the statistics of Ollama's final ("done") streaming line."""
+    eval_count = data.get("eval_count")
+    eval_seconds = (data.get("eval_duration") or 0) / 1e9
+    prompt_seconds = (data.get("prompt_eval_duration") or 0) / 1e9
+    if eval_count:
+        LLM_TOKENS.inc(eval_count)
+        if eval_seconds:
+            LLM_TOKENS_PER_SECOND.observe(eval_count / eval_seconds)
+    if data.get("prompt_eval_count"):
+        LLM_PROMPT_TOKENS.inc(data["prompt_eval_count"])
+    if prompt_seconds:
+        LLM_PROMPT_EVAL_SECONDS.observe(prompt_seconds)
+
+
+def render_metrics():
+    """The metrics in the Prometheus text format, with its content type."""
+    return generate_latest(METRICS_REGISTRY), CONTENT_TYPE_LATEST
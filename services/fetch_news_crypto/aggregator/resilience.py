@@ -0,0 +1,23 @@
+from contextvars import ContextVar
+import os
+from common.resilience import (  # noqa: F401 (re-exported for the aggregator's modules)
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    CircuitOpenError,
+    CircuitBreaker,
+    BreakerRegistry,
+    Deadline,
+    backoff_delay,
+    hedged,
+)
+
+# A feed-worker replica's breaker opens after BREAKER_FAILURE_THRESHOLD consecutive
+# failures and lets a trial call through BREAKER_RESET_TIMEOUT seconds later
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "60"))
+
+# The budget of the current run's upstream fetches (see main.orchestrate_and_save_news)
+fetch_deadline: ContextVar[Deadline] = ContextVar("fetch_deadline", default=Deadline())
+
+# Breakers of the feed-worker replicas
+service_breakers = BreakerRegistry(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
@@ -1,83 +1,57 @@
-import json
 from pathlib import Path
+import argparse
 import asyncio
-import httpx
 import os
 
-OLLAMA_API = os.getenv("OLLAMA_API", "http://localhost:11434")
-semaphore = asyncio.Semaphore(3)
-print("Using OLLAMA_API:", OLLAMA_API)
-
+# this script runs next to a local Ollama by default (set before utils reads it)
+OLLAMA_API = os.environ.setdefault("OLLAMA_API", "http://localhost:11434")
 
-def split_text_into_chunks(text, max_length=4000):
-    paragraphs = text.split("\n")
-    chunks = []
-    current_chunk = ""
-
-    for paragraph in paragraphs:
-        if len(current_chunk) + len(paragraph) <= max_length:
-            current_chunk += paragraph + "\n"
-        else:
-            chunks.append(current_chunk.strip())
-            current_chunk = paragraph + "\n"
-
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-
-    return chunks
-
-
-async def analyze_with_ollama(chunk: str):
-    prompt = (
-        "Analyze the following crypto news and suggest if there are any interesting coins "
-        "to consider investing in, based on trends, project potential, and current events:\n\n"
-        f"{chunk}"
-    )
-
-    timeout = httpx.Timeout(600.0, connect=60.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        try:
-            response = await client.post(
-                f"{OLLAMA_API}/api/generate",
-                json={"model": "llama3", "prompt": prompt, "stream": True},
-            )
-
-            response.raise_for_status()
-            result = ""
-            async for line in response.aiter_lines():
-                if line.strip():
-                    try:
-                        data = json.loads(line)
-                        result += data.get("response", "")
-                    except json.JSONDecodeError as e:
-                        result += f"\n[Decode error]: {e}"
-            return result.strip()
-
-        except httpx.HTTPStatusError as e:
-            return f"HTTP error: {e.response.status_code} - {e.response.text}"
-        except httpx.RequestError as e:
-            return f"Request error: {str(e)}"
-        except Exception as e:
-            return f"Unexpected error: {str(e)}"
+# the shared analysis path goes through the LLM cache, so re-running over
+# unchanged articles is answered from the cache
+from utils import split_text_into_chunks, analyze_with_ollama, last_call_stats
+from article_store import ArticleStore
+from http_clients import close_clients
+from chunking import estimate_tokens
+from concurrency import ollama_limiter
 
+print("Using OLLAMA_API:", OLLAMA_API)
 
-async def analyze_limited(chunk: str):
-    async with semaphore:
-        return await analyze_with_ollama(chunk)
+# The aggregator's article store (see main.ARTICLE_DB_FILE)
+ARTICLE_DB = Path("received_data") / os.getenv("ARTICLE_DB_FILE", "articles.db")
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "200"))
 
 
-async def analyze_existing_news_file():
-    path = Path("received_data/crypto_news.json")
-    if not path.exists():
-        print(f"[ERROR] File not found: {path}")
+async def analyze_limited(chunk: str):
+    async with ollama_limiter.slot(estimate_tokens(chunk)) as slot:
+        result = await analyze_with_ollama(chunk)
+        slot.report(**(last_call_stats.get() or {}))
+        return result
+
+
+def load_stored_news(day=None, source=None, query=None) -> list:
+    """
+    Reads articles back from the article store: those matching a keyword
+    query, else those published on a day ("YYYY-MM-DD"), else today's;
+    optionally of one source only.
+    """
+    with ArticleStore(ARTICLE_DB) as store:
+        if query:
+            return store.search(query, limit=SEARCH_LIMIT, source=source)
+        if day:
+            return store.on_day(day, source=source)
+        return store.published_today(source=source)
+
+
+async def analyze_existing_news_file(day=None, source=None, query=None):
+    if not ARTICLE_DB.exists():
+        print(f"[ERROR] File not found: {ARTICLE_DB}")
         return
 
-    with open(path, "r", encoding="utf-8") as f:
-        all_news = json.load(f)
+    all_news = load_stored_news(day, source, query)
 
     full_text = "\n\n".join([item.get("content", "") for item in all_news if item.get("content")])
     if not full_text.strip():
-        print("[WARN] No content found in crypto_news.json.")
+        print(f"[WARN] No stored content found in {ARTICLE_DB}.")
         return
 
     chunks = split_text_into_chunks(full_text)
@@ -90,7 +64,20 @@ async def analyze_existing_news_file():
         f.write(final_analysis)
 
     print(f"[INFO] Analysis saved to {output_path}")
+    print(f"[INFO] Ollama concurrency: {ollama_limiter.stats()}")
+
+
+async def run_once(day=None, source=None, query=None):
+    try:
+        await analyze_existing_news_file(day, source, query)
+    finally:
+        await close_clients()
 
 
 if __name__ == "__main__":
-    asyncio.run(analyze_existing_news_file())
+    parser = argparse.ArgumentParser(description="Analyze articles of the aggregator's article store again.")
+    parser.add_argument("--day", help="publication day (YYYY-MM-DD), today by default")
+    parser.add_argument("--source", help="only the articles of this feed")
+    parser.add_argument("--query", help="only the articles matching these keywords")
+    args = parser.parse_args()
+    asyncio.run(run_once(args.day, args.source, args.query))
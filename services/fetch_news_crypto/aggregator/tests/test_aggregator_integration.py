@@ -6,7 +6,7 @@ from unittest.mock import patch
 
 @pytest.mark.integration
 @pytest.mark.asyncio
-async def test_orchestrate_and_save_news_integration():
+async def test_orchestrate_and_save_news_integration(tmp_path):
     """
     Integration test for the full orchestrator.
     - Executes orchestrate_and_save_news without mocking.
@@ -16,14 +16,16 @@ async def test_orchestrate_and_save_news_integration():
     news_file = "received_data/crypto_news.json"
     summary_file = "received_data/crypto_news_analysis.txt"
 
-    # Patch split_text_into_chunks to return only the first 2 chunks
-    original_splitter = main.split_text_into_chunks
+    # Patch chunk_articles to return only the first 2 chunks
+    original_chunker = main.chunk_articles
 
-    def limited_chunker(text: str, max_length: int = 2000):
-        chunks = original_splitter(text, max_length)
+    def limited_chunker(items):
+        chunks = original_chunker(items, max_length=2000)
         return chunks[:2]
 
-    with patch("main.split_text_into_chunks", side_effect=limited_chunker):
+    # Start from an empty analysis state, so earlier runs don't add summaries
+    with patch("main.chunk_articles", side_effect=limited_chunker), \
+         patch("main.ANALYSIS_STATE_FILE", str(tmp_path / "analysis_state.json")):
         result = await main.orchestrate_and_save_news()
 
         # Validate result structure
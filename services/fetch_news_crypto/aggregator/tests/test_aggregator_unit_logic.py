@@ -1,15 +1,19 @@
 import pytest  
 from unittest.mock import AsyncMock, patch  
 import main  
+import utils
 from datetime import datetime
 
+# Three feed-worker replicas
+WORKERS = [f"http://feed-worker-{i}.feed-worker:8000/fetch_news" for i in range(3)]
+
 # Test the function that splits large text into smaller chunks
 def test_split_text_into_chunks():
     # Prepare a long test string by repeating multiple lines
     text = "Line 1.\nLine 2.\nLine 3.\n" * 100
 
     # Call the function with a maximum chunk size of 1000 characters
-    chunks = main.split_text_into_chunks(text, max_length=1000)
+    chunks = utils.split_text_into_chunks(text, max_length=1000)
 
     # Assert the returned result is a list
     assert isinstance(chunks, list)
@@ -69,6 +73,7 @@ async def test_orchestrate_with_mocked_services_and_llm(tmp_path):
     # Patch the external dependencies used inside orchestrate_and_save_news
     with patch("main.fetch_with_retry", new_callable=AsyncMock) as mock_fetch, \
          patch("main.analyze_with_ollama", new_callable=AsyncMock) as mock_llm, \
+         patch("main.SERVICES", WORKERS), \
          patch("main.Path", return_value=tmp_path):
 
         # Simulate that each fetch returns the fake response
@@ -91,8 +96,578 @@ async def test_orchestrate_with_mocked_services_and_llm(tmp_path):
         assert "summary_chunks" in result
 
         # Check values are of the correct type and match expectations
-        assert result["count"] == 6  # 2 items * 3 services = 6
+        assert result["count"] == 6  # 2 items * 3 replicas = 6
         assert isinstance(result["message"], str)
         assert isinstance(result["summary_chunks"], list)
         assert len(result["summary_chunks"]) == 1
         assert result["summary_chunks"][0] == "LLM Summary"
+
+        # The services are asked for the publication window, and only today's news is analyzed
+        assert "since" in mock_fetch.await_args.kwargs["params"]
+        assert "BTC is up" not in mock_llm.await_args.args[0]
+
+
+# The aggregator keeps one pooled client per upstream instead of one per call
+@pytest.mark.asyncio
+async def test_shared_client_is_reused_until_closed():
+    import http_clients
+
+    first = http_clients.get_client("services")
+    second = http_clients.get_client("services")
+    assert first is second
+
+    await http_clients.close_clients()
+    assert first.is_closed
+
+    # A new client is created lazily after shutdown
+    third = http_clients.get_client("services")
+    assert third is not first
+    await http_clients.close_clients()
+
+    stats = http_clients.pool_stats()
+    assert set(stats["services"]) == {"requests", "new_connections", "reused_connections", "reuse_ratio"}
+
+
+# Streaming mode: NDJSON lines from the services go straight into filtering and chunking
+@pytest.mark.asyncio
+async def test_orchestrate_streaming_news_reads_ndjson(tmp_path):
+    import httpx
+    import json
+
+    today_str = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0000")
+    lines = [
+        {"title": "Bitcoin", "content": "BTC is up", "link": "http://a", "published": today_str, "source": "url"},
+        {"title": "Old", "content": "Old news", "link": "http://b", "published": "yesterday", "source": "url"},
+    ]
+
+    def handler(request):
+        assert request.url.path == "/fetch_news/stream"
+        body = "".join(json.dumps(line) + "\n" for line in lines)
+        return httpx.Response(200, text=body, headers={"Content-Type": "application/x-ndjson"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    with patch("main.get_client", return_value=client), \
+         patch("main.analyze_with_ollama", new_callable=AsyncMock) as mock_llm, \
+         patch("main.SERVICES", WORKERS), \
+         patch("main.Path", return_value=tmp_path):
+
+        mock_llm.return_value = "LLM Summary"
+        result = await main.orchestrate_and_save_news(stream=True)
+
+    await client.aclose()
+
+    # 2 lines * 3 replicas; only today's articles are chunked and analyzed
+    assert result["count"] == 6
+    assert result["summary_chunks"] == ["LLM Summary"]
+    analyzed = mock_llm.await_args.args[0]
+    assert "BTC is up" in analyzed
+    assert "Old news" not in analyzed
+
+
+# Syndicated copies of a story are collapsed before they reach the LLM
+def test_deduplicate_news_exact_and_near_duplicates():
+    from dedup import deduplicate_news
+
+    story = " ".join(f"Bitcoin ETF inflows reached record level number {i} this week." for i in range(40))
+    other = " ".join(f"Ethereum developers scheduled upgrade milestone {i} for next month." for i in range(40))
+    items = [
+        {"title": "A", "content": story, "link": "http://cointelegraph/a", "source": "cointelegraph"},
+        {"title": "B", "content": story.upper(), "link": "http://decrypt/b", "source": "decrypt"},
+        {"title": "C", "content": story + " Reported by u.today.", "link": "http://utoday/c", "source": "u.today"},
+        {"title": "D", "content": other, "link": "http://decrypt/d", "source": "decrypt"},
+        {"title": "E", "content": "", "link": "http://decrypt/e", "source": "decrypt"},
+    ]
+
+    unique = deduplicate_news(items)
+
+    assert [item["title"] for item in unique] == ["A", "D", "E"]
+    assert [d["source"] for d in unique[0]["duplicates"]] == ["decrypt", "u.today"]
+    assert "duplicates" not in unique[1]
+
+
+# Identical chunks are answered from the LLM cache instead of calling Ollama again
+@pytest.mark.asyncio
+async def test_analyze_with_ollama_uses_cache(tmp_path):
+    import httpx
+    import json
+    import utils
+    from llm_cache import AnalysisCache
+
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        body = json.dumps({"response": "Consider BTC."}) + "\n" + json.dumps({"response": "", "done": True}) + "\n"
+        return httpx.Response(200, text=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    cache = AnalysisCache(tmp_path / "llm_cache")
+
+    with patch("utils.get_client", return_value=client), patch("utils.analysis_cache", cache):
+        first = await utils.analyze_with_ollama("Bitcoin is rising.")
+        second = await utils.analyze_with_ollama("Bitcoin is rising.")
+
+        # A fresh memory tier still finds the result on disk
+        cache._memory.clear()
+        third = await utils.analyze_with_ollama("Bitcoin is rising.")
+
+    await client.aclose()
+
+    assert first == second == third == "Consider BTC."
+    assert len(calls) == 1
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+# Chunks respect the token budget even for oversized paragraphs, and generators are accepted
+def test_token_budget_chunker():
+    from chunking import estimate_tokens, iter_chunks
+
+    sentence = "Bitcoin miners sold part of their reserves after the halving."
+    giant = " ".join([sentence] * 200)  # one paragraph far above the budget
+    paragraphs = (f"Paragraph {i}: {sentence}" if i != 3 else giant for i in range(10))
+
+    chunks = list(iter_chunks(paragraphs, budget=200))
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    assert chunks[0].startswith("Paragraph 0:")
+    assert chunks[-1].endswith("Paragraph 9: " + sentence)
+
+    overlapping = list(iter_chunks(giant, budget=100, overlap=20))
+    assert all(estimate_tokens(chunk) <= 100 for chunk in overlapping)
+    # the last sentence of a chunk is repeated at the start of the next one
+    assert overlapping[1].startswith(sentence)
+
+    # the legacy character mode still caps chunk length
+    assert all(len(chunk) <= 1000 for chunk in utils.split_text_into_chunks(giant, max_length=1000))
+
+    # a giant punctuation-heavy "word" (one token per character) is cut by its measured size
+    symbols = "€$!?" * 500
+    pieces = list(iter_chunks(symbols, budget=100))
+    assert "".join(pieces) == symbols
+    assert all(estimate_tokens(piece) <= 100 for piece in pieces)
+
+
+# The adaptive limiter admits short chunks first, grows while healthy and backs off on errors
+@pytest.mark.asyncio
+async def test_adaptive_limiter_shortest_first_and_aimd():
+    import asyncio
+    from concurrency import AdaptiveLimiter
+
+    # a huge tolerance keeps scheduler jitter from counting as degraded latency
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=4, initial_limit=1, tolerance=1e6)
+    order = []
+
+    async def job(cost, fail=False):
+        async with limiter.slot(cost) as slot:
+            order.append(cost)
+            await asyncio.sleep(0)
+            slot.report(tokens=10, eval_seconds=1.0, error=fail)
+
+    depth = []
+
+    async def watch():
+        await asyncio.sleep(0)
+        depth.append(limiter.stats()["queue_depth"])
+
+    await asyncio.gather(job(300), job(100), job(200), watch())
+
+    assert order == [100, 200, 300]
+    assert depth[0] >= 2
+    # every request ran at a fully used limit: 1 -> 2 -> 2.5 -> 2.9
+    assert limiter.limit == 2
+
+    await job(50, fail=True)
+    stats = limiter.stats()
+    assert stats["limit"] == 1
+    assert stats["errors"] == 1
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+# A second run only sends new or edited articles to the LLM and merges the day's report
+@pytest.mark.asyncio
+async def test_incremental_analysis_across_runs(tmp_path):
+    import json
+
+    today_str = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0000")
+
+    def article(link, content):
+        return {"title": link, "content": content, "link": link, "published": today_str, "source": "url"}
+
+    first_run = {"items": [article("http://a", "Solana network upgrade went live.")]}
+    second_run = {"items": [
+        article("http://a", "Solana network upgrade went live."),
+        article("http://b", "Cardano staking rewards were cut in half."),
+    ]}
+    third_run = {"items": [article("http://b", "Cardano staking rewards were restored.")]}
+
+    async def summarize(chunk):
+        return "Summary of: " + chunk
+
+    with patch("main.fetch_with_retry", new_callable=AsyncMock) as mock_fetch, \
+         patch("main.analyze_with_ollama", side_effect=summarize) as mock_llm, \
+         patch("main.SERVICES", ["http://service1"]), \
+         patch("main.Path", return_value=tmp_path):
+
+        mock_fetch.return_value = first_run
+        await main.orchestrate_and_save_news()
+        assert mock_llm.await_count == 1
+
+        mock_fetch.return_value = second_run
+        result = await main.orchestrate_and_save_news()
+        assert mock_llm.await_count == 2
+        assert "Solana" not in mock_llm.await_args.args[0]
+        assert result["analyzed_count"] == 1 and result["reused_count"] == 1
+        assert len(result["summary_chunks"]) == 2
+
+        # An edited article is analyzed again; one that left the feed stays in the report
+        mock_fetch.return_value = third_run
+        result = await main.orchestrate_and_save_news()
+        assert mock_llm.await_count == 3
+        assert "restored" in mock_llm.await_args.args[0]
+
+    with open(tmp_path / "crypto_news.json", encoding="utf-8") as f:
+        assert sorted(item["link"] for item in json.load(f)) == ["http://a", "http://b"]
+    report = (tmp_path / "crypto_news_analysis.txt").read_text(encoding="utf-8")
+    assert "Solana" in report and "restored" in report and "cut in half" not in report
+
+
+# The SSE endpoint forwards the LLM answer token by token, tagged with its chunk
+def test_analysis_stream_sse(tmp_path):
+    import json
+    from fastapi.testclient import TestClient
+
+    today_str = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0000")
+    fake_response = {"items": [
+        {"title": "Bitcoin", "content": "BTC is up", "link": "http://a", "published": today_str, "source": "url"},
+    ]}
+
+    async def fake_stream(chunk):
+        for piece in ["Consider ", "BTC."]:
+            yield piece
+
+    with patch("main.fetch_with_retry", new_callable=AsyncMock) as mock_fetch, \
+         patch("main.stream_analysis", side_effect=fake_stream), \
+         patch("main.SERVICES", WORKERS[:1]), \
+         patch("main.Path", return_value=tmp_path):
+
+        mock_fetch.return_value = fake_response
+        with TestClient(main.app).stream("GET", "/analysis/stream", params={"stream": False}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            body = "".join(response.iter_text())
+
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+
+    assert events[0] == ("token", {"chunk": 1, "text": "Consider "})
+    assert events[1] == ("token", {"chunk": 1, "text": "BTC."})
+    assert events[2] == ("chunk_done", {"chunk": 1, "summary": "Consider BTC.", "error": False})
+    assert events[3][0] == "done" and events[3][1]["analyzed_count"] == 1
+    assert "Consider BTC." in (tmp_path / "crypto_news_analysis.txt").read_text(encoding="utf-8")
+
+
+# /metrics exposes stage latencies and the LLM speed from Ollama's final streaming line
+@pytest.mark.asyncio
+async def test_metrics_include_ollama_speed(tmp_path):
+    import httpx
+    import json
+    import utils
+    from llm_cache import AnalysisCache
+    from fastapi.testclient import TestClient
+
+    def handler(request):
+        done = {"response": "", "done": True, "eval_count": 50, "eval_duration": 2_000_000_000,
+                "prompt_eval_count": 400, "prompt_eval_duration": 500_000_000}
+        body = json.dumps({"response": "Consider SOL."}) + "\n" + json.dumps(done) + "\n"
+        return httpx.Response(200, text=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("utils.get_client", return_value=client), \
+         patch("utils.analysis_cache", AnalysisCache(tmp_path / "llm_cache")):
+        assert await utils.analyze_with_ollama("Solana is rising.") == "Consider SOL."
+    await client.aclose()
+
+    assert utils.last_call_stats.get() == {"tokens": 50, "eval_seconds": 2.0}
+
+    body = TestClient(main.app).get("/metrics").text
+    assert 'pipeline_stage_seconds_count{stage="ollama_call"}' in body
+    # 50 tokens in 2s fall into the 30 tokens/s bucket
+    assert 'ollama_tokens_per_second_bucket{le="30.0"}' in body
+    assert "ollama_prompt_eval_seconds_sum" in body
+    assert 'pipeline_cache_misses_total{cache="llm"}' in body
+
+
+# The services are listed by metadata (paginated); only articles not analyzed yet are downloaded in full
+@pytest.mark.asyncio
+async def test_metadata_first_fetch_downloads_only_new_articles(tmp_path):
+    import hashlib
+
+    today_str = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0000")
+    articles = {
+        "http://a": {"title": "A", "content": "Solana network upgrade went live.", "link": "http://a",
+                     "published": today_str, "source": "url"},
+        "http://b": {"title": "B", "content": "Cardano staking rewards were cut in half.", "link": "http://b",
+                     "published": today_str, "source": "url"},
+    }
+    listed = ["http://a"]
+
+    def meta(item):
+        digest = hashlib.sha1((item["title"] + "\n" + item["content"]).encode("utf-8")).hexdigest()
+        return {"title": item["title"], "link": item["link"], "published": item["published"],
+                "source": item["source"], "content_hash": digest}
+
+    async def fake_fetch(url, params=None):
+        if "link" in params:
+            return {"items": [articles[link] for link in params["link"]]}
+        # one article per page
+        links = listed[listed.index(params["cursor"]) + 1:] if "cursor" in params else listed
+        return {"items": [meta(articles[links[0]])], "next_cursor": links[0] if len(links) > 1 else None}
+
+    async def summarize(chunk):
+        return "Summary of: " + chunk
+
+    with patch("main.fetch_with_retry", side_effect=fake_fetch) as mock_fetch, \
+         patch("main.analyze_with_ollama", side_effect=summarize), \
+         patch("main.SERVICES", ["http://service1"]), \
+         patch("main.Path", return_value=tmp_path):
+
+        await main.orchestrate_and_save_news()
+        listed.append("http://b")
+        mock_fetch.reset_mock()
+        result = await main.orchestrate_and_save_news()
+
+    calls = [call.kwargs["params"] for call in mock_fetch.call_args_list]
+    # two listing pages of metadata, then the content of the new article only
+    assert [("fields" in params, params.get("cursor")) for params in calls[:2]] == [(True, None), (True, "http://a")]
+    assert calls[2:] == [{"link": ["http://b"], "run": calls[0]["run"]}]
+    # every request of the run carries its id, so a service without a poller scrapes once
+    assert calls[0]["run"] and calls[1]["run"] == calls[0]["run"]
+    assert result["analyzed_count"] == 1 and result["reused_count"] == 1
+
+
+# Without FEED_WORKER_URLS, every feed-worker replica whose host name resolves is queried
+@pytest.mark.asyncio
+async def test_feed_worker_replicas_are_discovered():
+    import asyncio
+    import socket
+
+    async def getaddrinfo(host, port, *args, **kwargs):
+        if host.startswith("feed-worker-1."):  # a pod being replaced
+            raise socket.gaierror("Name or service not known")
+        if host.startswith("feed-worker-3."):  # any other lookup error is not a replica either
+            raise UnicodeError("label too long")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", port))]
+
+    loop = asyncio.get_running_loop()
+    with patch("main.SERVICES", []), \
+         patch("main.FEED_WORKER_MAX_REPLICAS", 4), \
+         patch.object(loop, "getaddrinfo", side_effect=getaddrinfo):
+        services = await main.discover_services()
+
+    assert services == [WORKERS[0], WORKERS[2]]
+
+
+# A dead replica opens its circuit breaker: the retries stop early and later calls fail fast
+@pytest.mark.asyncio
+async def test_fetch_with_retry_circuit_breaker_and_budget():
+    import httpx
+    import time
+    from resilience import BreakerRegistry, Deadline, fetch_deadline
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.host)
+        return httpx.Response(503, text="unavailable")
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    breakers = BreakerRegistry(failure_threshold=3, reset_timeout=60)
+
+    with patch("main.get_client", return_value=client), patch("main.service_breakers", breakers):
+        assert await main.fetch_with_retry(WORKERS[0], retries=5, delay=0) == {"items": []}
+        assert await main.fetch_with_retry(WORKERS[0], retries=5, delay=0) == {"items": []}
+        assert len(calls) == 3
+        assert breakers.get(WORKERS[0]).state == "open"
+
+        # a backoff longer than the rest of the run's budget is not waited for
+        token = fetch_deadline.set(Deadline(1.0))
+        try:
+            started = time.monotonic()
+            assert await main.fetch_with_retry(WORKERS[1], retries=5, delay=30) == {"items": []}
+        finally:
+            fetch_deadline.reset(token)
+        assert time.monotonic() - started < 1.0
+        assert len(calls) == 4
+
+    await client.aclose()
+
+
+# A request left unanswered for UPSTREAM_HEDGE_DELAY is sent again and the first answer wins
+@pytest.mark.asyncio
+async def test_fetch_with_retry_hedges_slow_requests():
+    import asyncio
+    import httpx
+    import time
+    from resilience import BreakerRegistry
+
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:  # the first replica connection stalls
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"items": [{"link": "http://a"}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    with patch("main.get_client", return_value=client), \
+         patch("main.service_breakers", BreakerRegistry()), \
+         patch("main.UPSTREAM_HEDGE_DELAY", 0.05):
+        started = time.monotonic()
+        data = await main.fetch_with_retry(WORKERS[0])
+
+    await client.aclose()
+
+    assert data == {"items": [{"link": "http://a"}]}
+    assert len(calls) == 2
+    assert time.monotonic() - started < 1.0
+
+
+# Published dates in the formats feeds actually use are all understood
+def test_parse_published_formats():
+    from datetime import timezone, timedelta
+    from article_store import parse_published
+
+    expected = datetime(2025, 7, 28, 19, 23, 43, tzinfo=timezone.utc)
+    for value in [
+        "Mon, 28 Jul 2025 20:23:43 +0100",
+        "Mon, 28 Jul 2025 19:23:43 GMT",
+        "28 Jul 2025 15:23:43 EDT",
+        "2025-07-28T19:23:43Z",
+        "2025-07-28T20:23:43+01:00",
+        "2025-07-28 19:23:43",
+        "July 28, 2025 19:23:43",
+    ]:
+        assert parse_published(value) == expected, value
+    # the publisher's own offset is kept, "today" is judged in it
+    assert parse_published("Mon, 28 Jul 2025 20:23:43 +0100").utcoffset() == timedelta(hours=1)
+    assert parse_published("yesterday") is None and parse_published("") is None
+
+    now = datetime.now(timezone.utc)
+    assert main.is_published_today(now.isoformat())
+    assert main.is_published_today(now.strftime("%a, %d %b %Y %H:%M:%S GMT"))
+    assert not main.is_published_today((now - timedelta(days=2)).isoformat())
+
+
+# The article store answers day, range, source and keyword queries from its indexes
+def test_article_store_queries(tmp_path):
+    from datetime import timezone, timedelta
+    from article_store import ArticleStore
+
+    now = datetime(2025, 7, 28, 23, 30, tzinfo=timezone.utc)
+    items = [
+        {"title": "Bitcoin ETF", "content": "Record inflows into spot bitcoin funds.", "link": "http://a",
+         "published": "Mon, 28 Jul 2025 22:00:00 +0000", "source": "cointelegraph", "duplicates": [{"link": "x"}]},
+        # the 29th for its publisher at +0100, where it is already the 29th too
+        {"title": "Ether upgrade", "content": "Ethereum developers set the upgrade date.", "link": "http://b",
+         "published": "2025-07-29T00:15:00+01:00", "source": "decrypt"},
+        {"title": "Solana outage", "content": "The Solana network halted block production.", "link": "http://c",
+         "published": "Sun, 27 Jul 2025 10:00:00 GMT", "source": "decrypt"},
+        {"title": "No date", "content": "Bitcoin miners sold coins.", "link": "http://d", "published": "soon"},
+    ]
+
+    with ArticleStore(tmp_path / "articles.db") as store:
+        assert store.ingest(items, retention_days=0) == 4
+        # an edited article replaces its earlier version
+        store.ingest([{**items[0], "content": "Record inflows into spot bitcoin ETFs."}], retention_days=0)
+        assert store.count() == 4
+
+        today = store.published_today(now=now)
+        assert [item["link"] for item in today] == ["http://a", "http://b"]
+        assert store.published_today(now=now - timedelta(hours=1)) == today[:1]
+        assert today[0]["duplicates"] == [{"link": "x"}] and today[0]["content"].endswith("ETFs.")
+        assert len(today[0]["content_hash"]) == 40
+
+        assert [item["link"] for item in store.on_day("2025-07-29")] == ["http://b"]
+        assert [item["link"] for item in store.between(since=now - timedelta(days=2))] == ["http://c", "http://a", "http://b"]
+        assert [item["link"] for item in store.between(source="decrypt")] == ["http://c", "http://b"]
+
+        assert {item["link"] for item in store.search("bitcoin")} == {"http://a", "http://d"}
+        assert [item["link"] for item in store.search("solana network")] == ["http://c"]
+        assert store.search("bitcoin", source="decrypt") == []
+        assert store.search('ethereum "upgrade" date?')[0]["link"] == "http://b"
+
+    # the store persists between runs
+    with ArticleStore(tmp_path / "articles.db") as store:
+        assert store.count() == 4
+
+
+# Coin mentions are found by name, id and upper-case ticker, in one automaton pass
+def test_coin_mention_extractor():
+    from mentions import AhoCorasick, MentionExtractor
+
+    automaton = AhoCorasick()
+    for pattern in ["he", "she", "his", "hers"]:
+        automaton.add(pattern, pattern)
+    automaton.build()
+    assert sorted(automaton.iter("ushers")) == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+    extractor = MentionExtractor()
+    counts = extractor.mentions(
+        "Bitcoin and $ETH rallied while ethereum fees fell. Solana (SOL) was flat, a sol-ution for "
+        "some; the market maker and Maker governance disagreed. Bitcoin Cash moved too."
+    )
+    assert counts == {"bitcoin": 1, "ethereum": 2, "solana": 2, "maker": 1, "bitcoin-cash": 1}
+    assert extractor.label("solana") == "Solana (SOL)"
+
+    # a common-word name and its ticker both count: "Dai" as written, "DAI" in upper case
+    assert extractor.mentions("DAI fell") == {"dai": 1}
+    assert extractor.mentions("Dai and dai") == {"dai": 1}
+    assert extractor.mentions("$PEPE pumps while SUI holds") == {"pepe": 1, "sui": 1}
+    # a name written like its ticker only matches in upper case
+    assert extractor.mentions("bnb rallied, xrp up") == {}
+    assert extractor.mentions("BNB rallied, XRP up, Ripple too") == {"binancecoin": 1, "ripple": 2}
+
+
+# Portfolio mode only sends the articles about held coins, grouped per coin with its own prompt
+@pytest.mark.asyncio
+async def test_portfolio_mode_analyzes_held_coins_per_coin(tmp_path):
+    today_str = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0000")
+
+    def article(link, content):
+        return {"title": link, "content": content, "link": link, "published": today_str, "source": "url"}
+
+    fake_response = {"items": [
+        article("http://sol", "Solana validators shipped an upgrade. SOL rose 5%."),
+        article("http://btc", "Bitcoin miners sold coins after the halving."),
+        article("http://both", "BTC and Bitcoin ETFs drew inflows; Solana lagged."),
+        article("http://eth", "Ethereum developers scheduled the next hard fork."),
+    ]}
+    calls = []
+
+    async def summarize(chunk, prompt_template=None):
+        calls.append((chunk, prompt_template))
+        return "Summary"
+
+    with patch("main.fetch_with_retry", new_callable=AsyncMock) as mock_fetch, \
+         patch("main.analyze_with_ollama", side_effect=summarize), \
+         patch("main.ANALYSIS_MODE", "portfolio"), \
+         patch("mentions.PORTFOLIO_COINS", ["solana", "bitcoin"]), \
+         patch("main.SERVICES", ["http://service1"]), \
+         patch("main.Path", return_value=tmp_path):
+
+        mock_fetch.return_value = fake_response
+        result = await main.orchestrate_and_save_news()
+
+    # one chunk per held coin; the Ethereum article never reaches the LLM
+    assert len(calls) == 2
+    (sol_chunk, sol_prompt), (btc_chunk, btc_prompt) = calls
+    assert "Solana (SOL)" in sol_prompt and "validators" in sol_chunk and "halving" not in sol_chunk
+    assert "Bitcoin (BTC)" in btc_prompt and "halving" in btc_chunk and "ETFs" in btc_chunk
+    assert all("hard fork" not in chunk for chunk, _ in calls)
+    assert result["analyzed_count"] == 3 and result["skipped_count"] == 1
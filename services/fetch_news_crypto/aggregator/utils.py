@@ -2,55 +2,211 @@ import httpx
 import traceback
 import os
 import json
+import time
+from contextvars import ContextVar
+from http_clients import get_client
+from metrics import STAGE_SECONDS, FAILURES, CACHE_HITS, CACHE_MISSES, observe_ollama_stats
+from llm_cache import analysis_cache, cache_key, LLM_CACHE_ENABLED
+from chunking import ChunkPacker, chunk_token_budget, iter_paragraphs, OLLAMA_NUM_CTX, CHUNK_OVERLAP_TOKENS
 
 OLLAMA_API = os.getenv("OLLAMA_API", "http://ollama:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+# Extra Ollama generation options as JSON, e.g. '{"temperature": 0.2, "num_ctx": 8192}'
+OLLAMA_OPTIONS = json.loads(os.getenv("OLLAMA_OPTIONS", "{}"))
+# chunks are sized for the full context window, so Ollama must not use a smaller one
+OLLAMA_OPTIONS.setdefault("num_ctx", OLLAMA_NUM_CTX)
 
-def split_text_into_chunks(text, max_length=2000):
-    paragraphs = text.split("\n")
+PROMPT_TEMPLATE = (
+    "Analyze the following crypto news and suggest if there are any interesting coins "
+    "to consider investing in, based on trends, project potential, and current events:\n\n"
+    "{chunk}"
+)
+
+# Portfolio-focused analysis (ANALYSIS_MODE=portfolio in main.py): the news about one held coin
+PORTFOLIO_PROMPT_TEMPLATE = (
+    "The following crypto news mentions {coin}, a coin held in our portfolio. Summarize what "
+    "it means for {coin}: relevant events, risks, sentiment and whether to hold, add or reduce:\n\n"
+    "{chunk}"
+)
+
+
+def portfolio_prompt(coin: str) -> str:
+    """PORTFOLIO_PROMPT_TEMPLATE for one coin (a template with {chunk} left to fill)."""
+    return PORTFOLIO_PROMPT_TEMPLATE.replace("{coin}", coin)
+
+# Outcome of the last analyze_with_ollama() call in the current task, read by
+# the concurrency limiter: tokens / eval_seconds (Ollama's eval_count and
+# eval_duration), error, or cached for answers that never reached Ollama
+last_call_stats = ContextVar("last_call_stats", default=None)
+
+
+def _packer(max_length=None, max_tokens=None, overlap_tokens=None, prompt_template=PROMPT_TEMPLATE):
+    overlap = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    if max_length is not None:
+        # character budget (overlap is then in characters too)
+        return ChunkPacker(max_length, overlap, measure=len)
+    return ChunkPacker(max_tokens or chunk_token_budget(prompt_template), overlap)
+
+
+class ArticleChunker:
+    """
+    Packs articles that arrive one at a time (e.g. streamed) into chunks, so
+    analysis can start before all the news has arrived, and remembers which
+    articles (by link) every chunk covers. Uses the same packing as
+    split_text_into_chunks(), with the budget left by prompt_template.
+    """
+
+    def __init__(self, max_length=None, max_tokens=None, overlap_tokens=None, prompt_template=PROMPT_TEMPLATE):
+        self._packer = _packer(max_length, max_tokens, overlap_tokens, prompt_template)
+        self._links = []
+
+    def add(self, item):
+        """Adds an article and returns the (chunk, links) pairs that are complete so far."""
+        link = item.get("link")
+        chunks = []
+        for paragraph in iter_paragraphs(item.get("content") or ""):
+            if not paragraph.strip():
+                continue
+            for i, chunk in enumerate(self._packer.add(paragraph)):
+                if i == 0 and link not in self._links:
+                    # the first chunk may end with the start of this paragraph
+                    links = self._links + [link]
+                else:
+                    links = self._links or [link]
+                chunks.append((chunk, links))
+                self._links = []
+            if link not in self._links:
+                self._links.append(link)
+        return chunks
+
+    def flush(self):
+        """Returns the last, partially filled chunk (if any) with its links."""
+        chunks = [(chunk, self._links) for chunk in self._packer.flush()]
+        self._links = []
+        return chunks
+
+
+def chunk_articles(items, max_length=None, max_tokens=None, overlap_tokens=None, prompt_template=PROMPT_TEMPLATE):
+    """
+    Packs the content of the given articles into chunks that fit the model's
+    context window (next to prompt_template).
+
+    Returns:
+        list[tuple[str, list[str]]]: Every chunk with the links of the articles it covers.
+    """
+    chunker = ArticleChunker(max_length, max_tokens, overlap_tokens, prompt_template)
     chunks = []
-    current_chunk = ""
+    for item in items:
+        chunks.extend(chunker.add(item))
+    return chunks + chunker.flush()
+
 
-    for paragraph in paragraphs:
-        if len(current_chunk) + len(paragraph) <= max_length:
-            current_chunk += paragraph + "\n"
-        else:
-            chunks.append(current_chunk.strip())
-            current_chunk = paragraph + "\n"
+def split_text_into_chunks(text, max_length=None, max_tokens=None, overlap_tokens=None):
+    """
+    Splits text into chunks that fit the model's context window.
 
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    Args:
+        text: A string, or any iterable / generator of strings (consumed lazily).
+        max_length (int, optional): Character budget per chunk. If not given,
+            chunks are measured in (estimated) tokens instead.
+        max_tokens (int, optional): Token budget per chunk. Defaults to the
+            model's context window minus the prompt and the reserved answer.
+        overlap_tokens (int, optional): Budget repeated from the end of a chunk
+            at the start of the next one. Defaults to CHUNK_OVERLAP_TOKENS.
 
-    return chunks
+    Returns:
+        list[str]: The chunks, none larger than the budget.
+    """
+    packer = _packer(max_length, max_tokens, overlap_tokens)
+    chunks = []
+    for paragraph in iter_paragraphs(text):
+        chunks.extend(packer.add(paragraph))
+    return chunks + packer.flush()
 
 
-async def analyze_with_ollama(chunk: str):
-    prompt = (
-        "Analyze the following crypto news and suggest if there are any interesting coins "
-        "to consider investing in, based on trends, project potential, and current events:\n\n"
-        f"{chunk}"
-    )
+# Prefixes of the error strings analyze_with_ollama() returns instead of an analysis
+ANALYSIS_ERROR_PREFIXES = ("HTTP error:", "Request error:", "Unexpected error:")
 
-    try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=60.0)) as client:
-            response = await client.post(
-                f"{OLLAMA_API}/api/generate",
-                json={"model": "llama3", "prompt": prompt, "stream": True}
-            )
 
+def is_analysis_error(result: str) -> bool:
+    return result.startswith(ANALYSIS_ERROR_PREFIXES)
+
+
+async def stream_analysis(chunk: str, prompt_template: str = PROMPT_TEMPLATE):
+    """
+    Analyzes a chunk with Ollama and yields the answer piece by piece as the
+    tokens are generated (a cached answer is yielded at once). On failure the
+    error string is yielded last and last_call_stats() reports an error.
+    """
+    prompt = prompt_template.replace("{chunk}", chunk)
+    stats = {}
+    last_call_stats.set(stats)
+
+    key = cache_key(OLLAMA_MODEL, prompt_template, chunk, OLLAMA_OPTIONS)
+    if LLM_CACHE_ENABLED:
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            CACHE_HITS.labels("llm").inc()
+            stats["cached"] = True
+            yield cached
+            return
+        CACHE_MISSES.labels("llm").inc()
+
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": True}
+    if OLLAMA_OPTIONS:
+        payload["options"] = OLLAMA_OPTIONS
+
+    started = time.monotonic()
+    try:
+        client = get_client("ollama")
+        async with client.stream(
+            "POST",
+            f"{OLLAMA_API}/api/generate",
+            json=payload
+        ) as response:
+            if response.is_error:
+                await response.aread()
             response.raise_for_status()
-            result = ""
+            pieces = []
+            decode_failed = False
             async for line in response.aiter_lines():
                 if line.strip():
                     try:
                         data = json.loads(line)
-                        result += data.get("response", "")
+                        piece = data.get("response", "")
+                        if data.get("done"):
+                            observe_ollama_stats(data)
+                            stats["tokens"] = data.get("eval_count")
+                            stats["eval_seconds"] = (data.get("eval_duration") or 0) / 1e9 or None
                     except json.JSONDecodeError as e:
-                        result += f"\n[Decode error]: {e}"
-            return result.strip()
+                        decode_failed = True
+                        piece = f"\n[Decode error]: {e}"
+                    if piece:
+                        pieces.append(piece)
+                        yield piece
+
+            STAGE_SECONDS.labels("ollama_call").observe(time.monotonic() - started)
+            # only complete, successful analyses are cached
+            if LLM_CACHE_ENABLED and not decode_failed:
+                analysis_cache.put(key, "".join(pieces).strip())
 
     except httpx.HTTPStatusError as e:
-        return f"HTTP error: {e.response.status_code} - {e.response.text}"
+        FAILURES.labels("ollama_call").inc()
+        stats["error"] = True
+        yield f"HTTP error: {e.response.status_code} - {e.response.text}"
     except httpx.RequestError as e:
-        return f"Request error: {str(e)}"
+        FAILURES.labels("ollama_call").inc()
+        stats["error"] = True
+        yield f"Request error: {str(e)}"
     except Exception as e:
-        return f"Unexpected error: {str(e)}"
+        FAILURES.labels("ollama_call").inc()
+        stats["error"] = True
+        yield f"Unexpected error: {str(e)}"
+
+
+async def analyze_with_ollama(chunk: str, prompt_template: str = PROMPT_TEMPLATE):
+    pieces = [piece async for piece in stream_analysis(chunk, prompt_template)]
+    if last_call_stats.get().get("error"):
+        # the error string replaces whatever was generated before the failure
+        return pieces[-1]
+    return "".join(pieces).strip()
@@ -0,0 +1,180 @@
+from urllib.parse import urlparse
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+
+# Resilience layer shared by the aggregator and the feed worker: circuit breakers,
+# backoff, time budgets and hedged calls. The breaker thresholds are each service's own.
+
+# Exponential backoff between retries: attempt n waits a random time in
+# [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (n - 1))] ("full jitter"),
+# so callers that failed together do not retry together
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+
+
+class CircuitOpenError(Exception):
+    """A call was refused because the upstream's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one upstream host.
+
+    - closed: calls go through; `failure_threshold` consecutive failures open it.
+    - open: calls fail fast for `reset_timeout` seconds.
+    - half_open: one trial call goes through; its success closes the breaker,
+      its failure opens it for another `reset_timeout`. A trial that never
+      reports back is replaced after `reset_timeout`.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = None
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go to the upstream now; counts the refused ones."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == "closed":
+                return True
+            if state == "half_open" and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+                self._trial_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """Like allow(), but raises CircuitOpenError when the call is refused."""
+        if not self.allow():
+            raise CircuitOpenError(f"circuit open for {self.name}")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_at is not None or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial_at = None
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per upstream host (scheme and port included), created on first use."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def clear(self):
+        with self._lock:
+            self._breakers.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+class Deadline:
+    """A time budget shared by the calls of one run (None or <= 0: unbounded)."""
+
+    def __init__(self, seconds=None):
+        self.expires_at = time.monotonic() + seconds if seconds and seconds > 0 else None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cap(self, seconds: float | None) -> float | None:
+        """A timeout of `seconds` (None: none), shortened to what is left of the budget."""
+        if self.expires_at is None:
+            return seconds
+        remaining = self.remaining()
+        return remaining if seconds is None else min(seconds, remaining)
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """The full-jitter wait after the attempt-th failed attempt (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+async def hedged(call, delay: float, hedges: int = 1, on_hedge=None):
+    """
+    Awaits call() and, when no answer came `delay` seconds after the latest
+    start, starts an identical call, up to `hedges` extra ones. The first
+    successful answer wins and the calls still running are cancelled; when
+    every call failed, the last error is raised. Only for idempotent calls.
+
+    Args:
+        call: Function returning a new awaitable per call.
+        delay (float): Seconds to wait for an answer before hedging (<= 0: never hedge).
+        hedges (int): Extra calls at most.
+        on_hedge: Called whenever an extra call is started.
+    """
+    if delay <= 0 or hedges <= 0:
+        return await call()
+    pending = {asyncio.ensure_future(call())}
+    started = 1
+    error = None
+    try:
+        while pending:
+            timeout = delay if started <= hedges else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not done:
+                pending.add(asyncio.ensure_future(call()))
+                started += 1
+                if on_hedge is not None:
+                    on_hedge()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
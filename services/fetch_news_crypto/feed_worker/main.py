@@ -0,0 +1,174 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from datetime import datetime, timezone
+from sharding import current_members, owned_feeds, WORKER_NAME
+from utils import (
+    fetch_feed_items,
+    iter_feed_items,
+    ArticleStore,
+    FeedPoller,
+    shutdown_extract_pool,
+    RunSnapshots,
+    CompressionMiddleware,
+    parse_fields,
+    project_item,
+    paginate,
+    decode_cursor,
+    breaker_stats,
+    FEEDS,
+    FETCH_DEADLINE,
+    FETCH_INCREMENTAL,
+    NEWS_POLL_INTERVAL,
+    COMPRESS_MIN_SIZE,
+    METRICS_REGISTRY,
+)
+import asyncio
+import json
+
+news_store = ArticleStore()
+
+
+def poll_owned_feeds():
+    # the replicas are looked up on every poll, so the feeds follow scaling
+    feeds = owned_feeds(FEEDS)
+    news_store.retain(lambda item: item["source"] in feeds)
+    return fetch_feed_items(feeds, known=news_store)
+
+
+poller = FeedPoller(news_store, poll_owned_feeds, NEWS_POLL_INTERVAL)
+run_snapshots = RunSnapshots()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if NEWS_POLL_INTERVAL > 0:
+        poller.start()
+    yield
+    poller.stop()
+    await asyncio.to_thread(shutdown_extract_pool)
+
+
+app = FastAPI(lifespan=lifespan)
+# gzip or zstd, negotiated through Accept-Encoding
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_SIZE, compresslevel=6)
+
+
+def stored_news(since, until, wait):
+    """
+    The poller's articles and their freshness, or None when polling is off.
+    Before the first poll has finished, waits up to `wait` seconds for it.
+    """
+    if NEWS_POLL_INTERVAL <= 0:
+        return None
+    news_store.refreshed.wait(wait)
+    items, updated_at = news_store.snapshot(since, until)
+    return items, updated_at
+
+
+def freshness(updated_at):
+    if updated_at is None:
+        return {"updated_at": None, "age_seconds": None}
+    age = (datetime.now(timezone.utc) - updated_at).total_seconds()
+    return {"updated_at": updated_at.isoformat(), "age_seconds": round(age, 3)}
+
+
+def validated_fields(fields, cursor=None):
+    """The parsed field list; a bad field list or cursor is a 400 before any scraping."""
+    try:
+        if cursor is not None:
+            decode_cursor(cursor)
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/fetch_news")
+def fetch_news(concurrent: bool = True, deadline: float = FETCH_DEADLINE, incremental: bool = FETCH_INCREMENTAL,
+               since: datetime | None = None, until: datetime | None = None,
+               fields: str | None = None, limit: int | None = Query(None, ge=1), cursor: str | None = None,
+               link: list[str] | None = Query(None), run: str | None = None):
+    """
+    The news, optionally projected to some fields (e.g. fields=title,link,published,content_hash),
+    restricted to some articles (link=...&link=...) and paginated (limit, then the returned next_cursor).
+    With polling off, the requests sharing a run id are served from the scrape of the first one.
+    """
+    names = validated_fields(fields, cursor)
+    stored = stored_news(since, until, wait=deadline)
+    if stored is not None:
+        news, updated_at = stored
+    else:
+        def scrape():
+            # since/until are applied to the feed entries before any article is downloaded
+            return fetch_feed_items(
+                owned_feeds(FEEDS), concurrent=concurrent, deadline_seconds=deadline, incremental=incremental,
+                since=since, until=until
+            )
+
+        if run:
+            news, updated_at = run_snapshots.get_or_scrape(run, scrape)
+        else:
+            news, updated_at = scrape(), datetime.now(timezone.utc)
+    if link:
+        wanted = set(link)
+        news = [item for item in news if item["link"] in wanted]
+    page, next_cursor = paginate(news, limit, cursor)
+    partial = sum(1 for item in page if item.get("partial"))
+    return {
+        "count": len(page),
+        "total": len(news),
+        "partial": partial,
+        **freshness(updated_at),
+        "next_cursor": next_cursor,
+        "items": [project_item(item, names) for item in page],
+    }
+
+
+@app.get("/fetch_news/stream")
+def fetch_news_stream(deadline: float = FETCH_DEADLINE, incremental: bool = FETCH_INCREMENTAL,
+                      since: datetime | None = None, until: datetime | None = None, fields: str | None = None):
+    """
+    Streams the news as NDJSON, one article per line: the poller's articles,
+    or, with polling off, every article as soon as it is extracted.
+    """
+    names = validated_fields(fields)
+    stored = stored_news(since, until, wait=deadline)
+    if stored is not None:
+        items, updated_at = stored
+        headers = {"X-News-Updated-At": updated_at.isoformat()} if updated_at else {}
+    else:
+        items = iter_feed_items(
+            owned_feeds(FEEDS), deadline_seconds=deadline, incremental=incremental, since=since, until=until
+        )
+        headers = {}
+
+    def ndjson_lines():
+        for item in items:
+            yield json.dumps(project_item(item, names), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson", headers=headers)
+
+
+@app.get("/shard")
+def shard():
+    """This worker's replica name, the replicas it sees and the feeds it owns."""
+    return {"worker": WORKER_NAME, "members": current_members(), "feeds": owned_feeds(FEEDS)}
+
+
+@app.get("/store_stats")
+def store_stats():
+    """Size and freshness of the poller's article store."""
+    return news_store.stats()
+
+
+@app.get("/circuit_breakers")
+def circuit_breakers():
+    """State of the circuit breaker of every article host."""
+    return breaker_stats()
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: stage latencies, failures and cache hits of this service."""
+    return Response(generate_latest(METRICS_REGISTRY), media_type=CONTENT_TYPE_LATEST)
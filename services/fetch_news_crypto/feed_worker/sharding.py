@@ -0,0 +1,83 @@
+from bisect import bisect
+import hashlib
+import os
+import socket
+
+# This worker's name, as listed among the replicas (a StatefulSet pod's hostname)
+WORKER_NAME = os.getenv("WORKER_NAME", socket.gethostname())
+# Fixed replica names (comma-separated), e.g. for docker compose
+WORKER_MEMBERS = [name.strip() for name in os.getenv("WORKER_MEMBERS", "").split(",") if name.strip()]
+# Otherwise the replicas are discovered by resolving WORKER_HOST_TEMPLATE for
+# i in range(WORKER_MAX_REPLICAS), e.g. "feed-worker-{i}.feed-worker" for the pods
+# of a StatefulSet behind a headless service; the first label is the replica's name
+WORKER_HOST_TEMPLATE = os.getenv("WORKER_HOST_TEMPLATE", "")
+WORKER_MAX_REPLICAS = int(os.getenv("WORKER_MAX_REPLICAS", "16"))
+# Points per replica on the hash ring; more points spread the feeds more evenly
+HASH_RING_VNODES = int(os.getenv("HASH_RING_VNODES", "100"))
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of keys (feed URLs) onto members (worker replicas).
+
+    Every member owns `vnodes` points on a 64-bit ring and a key belongs to
+    the member of the first point at or after the key's hash. Adding or
+    removing a member only moves the keys of the ring segments it gains or
+    loses, about 1/N of them, while every other key stays where it was.
+
+    The spread is even only on average: with a few keys per member the
+    shares can be far apart (e.g. 3 and 1 of 4 feeds on 2 members) whatever
+    the number of points, since each key lands independently.
+    """
+
+    def __init__(self, members, vnodes=HASH_RING_VNODES):
+        self.members = sorted(set(members))
+        self._points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        self._hashes = [point for point, _ in self._points]
+
+    def owner(self, key: str):
+        if not self._points:
+            return None
+        index = bisect(self._hashes, _hash(key)) % len(self._points)
+        return self._points[index][1]
+
+    def assign(self, keys) -> dict:
+        """The keys of every member, in the order given ({} for a ring without members)."""
+        assignment = {member: [] for member in self.members}
+        if not assignment:
+            return assignment
+        for key in keys:
+            assignment[self.owner(key)].append(key)
+        return assignment
+
+
+def discover_members(template=WORKER_HOST_TEMPLATE, max_replicas=WORKER_MAX_REPLICAS) -> list:
+    """The names of the replicas whose host name resolves; gaps (a pod being replaced) are skipped."""
+    members = []
+    for i in range(max_replicas):
+        host = template.format(i=i)
+        try:
+            socket.getaddrinfo(host, None)
+        except socket.gaierror:
+            continue
+        members.append(host.split(".")[0])
+    return members
+
+
+def current_members() -> list:
+    if WORKER_MEMBERS:
+        return WORKER_MEMBERS
+    if WORKER_HOST_TEMPLATE:
+        # this worker always counts, even before its own DNS record is published
+        return sorted(set(discover_members()) | {WORKER_NAME})
+    return [WORKER_NAME]
+
+
+def owned_feeds(feeds: list) -> list:
+    """The feeds this worker polls: its share of the hash ring over the current replicas."""
+    ring = HashRing(current_members())
+    return [feed for feed in feeds if ring.owner(feed) == WORKER_NAME]
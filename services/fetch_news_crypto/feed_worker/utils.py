@@ -0,0 +1,943 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from pathlib import Path
+from newspaper import Article
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from starlette.datastructures import Headers, MutableHeaders
+import lxml.html
+import multiprocessing
+import feedparser
+import requests
+import threading
+import calendar
+import hashlib
+import base64
+import json
+import re
+import time
+import zlib
+import os
+
+from common.resilience import BreakerRegistry, CircuitOpenError, backoff_delay
+
+try:
+    import zstandard
+except ImportError:  # optional: without it, responses are only gzip-compressed
+    zstandard = None
+
+# The feeds of all worker replicas (each polls its share, see sharding.py): a JSON
+# list of feed URLs in FEEDS_FILE, replaced by NEWS_FEEDS (comma-separated URLs) when
+# set, e.g. with local stand-in feeds for benchmarks
+FEEDS_FILE = os.getenv("FEEDS_FILE", str(Path(__file__).with_name("feeds.json")))
+
+
+def load_feeds(path=FEEDS_FILE):
+    if os.getenv("NEWS_FEEDS"):
+        return [url.strip() for url in os.environ["NEWS_FEEDS"].split(",") if url.strip()]
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Concurrent fetch settings
+FETCH_MAX_WORKERS = int(os.getenv("FETCH_MAX_WORKERS", "8"))
+FETCH_PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "2"))
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", "120"))
+ARTICLE_TIMEOUT = float(os.getenv("ARTICLE_TIMEOUT", "10"))
+
+# Per-host circuit breakers: after BREAKER_FAILURE_THRESHOLD consecutive failed
+# downloads (timeouts, connection errors, 5xx, 429) the host's articles are skipped
+# for BREAKER_RESET_TIMEOUT seconds, then a single trial download decides again
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "120"))
+# A download failing that way is tried ARTICLE_RETRIES times in all, with the shared
+# full-jitter backoff (RETRY_BASE_DELAY, RETRY_MAX_DELAY) and within the fetch deadline
+ARTICLE_RETRIES = int(os.getenv("ARTICLE_RETRIES", "3"))
+
+# Article extraction settings: "newspaper" (full extractor) or "fast" (lxml
+# main-content heuristic, for feeds whose RSS already carries most of the body).
+# FAST_EXTRACT_HOSTS selects the fast mode for the articles of some hosts only.
+ARTICLE_EXTRACTOR = os.getenv("ARTICLE_EXTRACTOR", "newspaper")
+FAST_EXTRACT_HOSTS = {h.strip() for h in os.getenv("FAST_EXTRACT_HOSTS", "").split(",") if h.strip()}
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may actually use: the CPU affinity, further limited by the
+    container's cgroup CPU quota (v2 cpu.max or v1 cpu.cfs_quota_us), which
+    os.cpu_count() ignores, since it reports the node's CPUs.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):  # not available on macOS / Windows
+        cpus = os.cpu_count() or 1
+    quota_files = [
+        ("/sys/fs/cgroup/cpu.max", None),
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    ]
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file, "r", encoding="utf-8") as f:
+                values = f.read().split()
+            if period_file:
+                with open(period_file, "r", encoding="utf-8") as f:
+                    values.append(f.read().strip())
+        except OSError:
+            continue
+        if len(values) >= 2 and values[0] not in ("max", "-1"):
+            cpus = min(cpus, max(1, -(-int(values[0]) // int(values[1]))))
+        break
+    return max(1, cpus)
+
+
+# Processes extracting text from the downloaded HTML (0 = extract on the download thread).
+# Each is a spawned interpreter with newspaper loaded, so the default is capped
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", str(min(4, available_cpus()))))
+
+# Incremental ingestion settings
+FETCH_INCREMENTAL = os.getenv("FETCH_INCREMENTAL", "0") == "1"
+ARTICLE_CACHE_PATH = os.getenv("ARTICLE_CACHE_PATH", "cache/article_cache.json")
+ARTICLE_CACHE_TTL = float(os.getenv("ARTICLE_CACHE_TTL", str(7 * 24 * 3600)))
+ARTICLE_CACHE_MAX_ENTRIES = int(os.getenv("ARTICLE_CACHE_MAX_ENTRIES", "5000"))
+
+# Background polling: /fetch_news answers from an in-memory store refreshed every
+# NEWS_POLL_INTERVAL seconds (0 = no poller, every request scrapes the feeds itself)
+NEWS_POLL_INTERVAL = float(os.getenv("NEWS_POLL_INTERVAL", "300"))
+NEWS_STORE_MAX_ARTICLES = int(os.getenv("NEWS_STORE_MAX_ARTICLES", "1000"))
+# Without the poller, the requests of one client run (?run=...) share a single scrape,
+# kept for NEWS_SNAPSHOT_TTL seconds; at most NEWS_SNAPSHOT_MAX_RUNS runs are kept
+NEWS_SNAPSHOT_TTL = float(os.getenv("NEWS_SNAPSHOT_TTL", "600"))
+NEWS_SNAPSHOT_MAX_RUNS = int(os.getenv("NEWS_SNAPSHOT_MAX_RUNS", "8"))
+
+# Responses smaller than this are not compressed
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1000"))
+
+# Fields a client can select with ?fields=. content_hash is computed on request:
+# the sha1 of title + "\n" + content, the key the aggregator detects edited articles by
+NEWS_FIELDS = ("title", "content", "link", "published", "source", "partial", "content_hash")
+
+# Prometheus metrics of this service, exposed at /metrics. They live in their own
+# registry, apart from those of anything else imported into the same process
+METRICS_REGISTRY = CollectorRegistry()
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Latency of a pipeline stage", ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120), registry=METRICS_REGISTRY,
+)
+FAILURES = Counter("pipeline_failures_total", "Failed pipeline stage calls", ["stage"], registry=METRICS_REGISTRY)
+RETRIES = Counter("pipeline_retries_total", "Retried pipeline stage calls", ["stage"], registry=METRICS_REGISTRY)
+CACHE_HITS = Counter("pipeline_cache_hits_total", "Cache hits", ["cache"], registry=METRICS_REGISTRY)
+CACHE_MISSES = Counter("pipeline_cache_misses_total", "Cache misses", ["cache"], registry=METRICS_REGISTRY)
+SHORT_CIRCUITS = Counter(
+    "pipeline_short_circuits_total", "Calls refused by an open circuit breaker", ["stage"], registry=METRICS_REGISTRY
+)
+
+# One semaphore per article host, so a single site is never hit by the whole pool
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+# One circuit breaker per article host
+_host_breakers = BreakerRegistry(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+
+class ArticleCache:
+    """
+    Persistent cache for incremental ingestion, stored as a single JSON file.
+
+    Holds the extracted text of every article keyed by entry.link (with a TTL
+    and LRU eviction above max_entries), and the ETag/Last-Modified validators
+    plus the last seen entries of every feed, so unchanged feeds can be
+    answered from a conditional GET (HTTP 304).
+    """
+
+    def __init__(self, filepath, ttl=ARTICLE_CACHE_TTL, max_entries=ARTICLE_CACHE_MAX_ENTRIES):
+        self.path = Path(filepath)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._articles = None
+        self._feeds = None
+
+    def _load(self):
+        if self._articles is not None:
+            return
+        self._articles, self._feeds = OrderedDict(), {}
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._articles = OrderedDict(data.get("articles", {}))
+            self._feeds = data.get("feeds", {})
+        except Exception as e:
+            print(f"Failed to load article cache {self.path}: {e}")
+
+    def get(self, link):
+        with self._lock:
+            self._load()
+            record = self._articles.get(link)
+            if record is None:
+                CACHE_MISSES.labels("article").inc()
+                return None
+            if time.time() - record["fetched_at"] > self.ttl:
+                del self._articles[link]
+                CACHE_MISSES.labels("article").inc()
+                return None
+            self._articles.move_to_end(link)
+            CACHE_HITS.labels("article").inc()
+            return record["content"]
+
+    def put(self, link, content):
+        with self._lock:
+            self._load()
+            self._articles[link] = {"content": content, "fetched_at": time.time()}
+            self._articles.move_to_end(link)
+            while len(self._articles) > self.max_entries:
+                self._articles.popitem(last=False)
+
+    def feed_validators(self, url):
+        with self._lock:
+            self._load()
+            feed = self._feeds.get(url, {})
+            return feed.get("etag"), feed.get("modified")
+
+    def feed_entries(self, url):
+        with self._lock:
+            self._load()
+            return [feedparser.FeedParserDict(e) for e in self._feeds.get(url, {}).get("entries", [])]
+
+    def update_feed(self, url, etag, modified, entries):
+        with self._lock:
+            self._load()
+            self._feeds[url] = {
+                "etag": etag if isinstance(etag, str) else None,
+                "modified": modified if isinstance(modified, str) else None,
+                "entries": [
+                    {
+                        "title": e.title,
+                        "link": e.link,
+                        "published": e.get("published", ""),
+                        "published_parsed": list(e.published_parsed) if e.get("published_parsed") else None,
+                    }
+                    for e in entries
+                ],
+            }
+
+    def save(self):
+        with self._lock:
+            if self._articles is None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"articles": self._articles, "feeds": self._feeds}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+# FEEDS and article_cache are created on first access, not at import: the
+# extraction processes import this module too and need neither of them
+_LAZY_GLOBALS = {
+    "FEEDS": load_feeds,
+    "article_cache": lambda: ArticleCache(ARTICLE_CACHE_PATH),
+}
+_lazy_globals_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name not in _LAZY_GLOBALS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lazy_globals_lock:
+        if name not in globals():
+            globals()[name] = _LAZY_GLOBALS[name]()
+        return globals()[name]
+
+
+def _published_datetime(item):
+    """The item's "published" string as an aware UTC datetime, or None."""
+    published = item.get("published") or ""
+    for parse in (parsedate_to_datetime, datetime.fromisoformat):
+        try:
+            parsed = parse(published)
+        except (TypeError, ValueError, IndexError):
+            continue
+        return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+    return None
+
+
+class ArticleStore:
+    """
+    In-memory, size-bounded store of the latest scraped articles, kept warm
+    by a FeedPoller and read by /fetch_news.
+
+    A refresh merges the scraped items by link: a partial (timed-out) item
+    never replaces a complete one, and above max_articles the oldest articles
+    (by published date, undated ones counting as new) are evicted. get()
+    serves the complete articles as the content cache of the next refresh,
+    so a poll only downloads the articles that are new in the feeds.
+    """
+
+    def __init__(self, max_articles=NEWS_STORE_MAX_ARTICLES):
+        self.max_articles = max_articles
+        self._lock = threading.Lock()
+        self._items = {}
+        self._published = {}
+        self.updated_at = None
+        self.last_error = None
+        self.refreshed = threading.Event()
+
+    def get(self, link):
+        with self._lock:
+            item = self._items.get(link)
+        if item is None or item["partial"] or not item["content"]:
+            CACHE_MISSES.labels("store").inc()
+            return None
+        CACHE_HITS.labels("store").inc()
+        return item["content"]
+
+    def update(self, items):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for item in items:
+                current = self._items.get(item["link"])
+                if item["partial"] and current is not None and not current["partial"]:
+                    continue
+                self._items[item["link"]] = item
+                self._published[item["link"]] = _published_datetime(item) or now
+            if len(self._items) > self.max_articles:
+                newest_first = sorted(self._published, key=self._published.get, reverse=True)
+                for link in newest_first[self.max_articles:]:
+                    del self._items[link]
+                    del self._published[link]
+            self.updated_at = now
+            self.last_error = None
+        self.refreshed.set()
+
+    def retain(self, keep):
+        """Drops the articles for which keep(item) is false, e.g. those of feeds moved to another worker."""
+        with self._lock:
+            for link in [link for link, item in self._items.items() if not keep(item)]:
+                del self._items[link]
+                del self._published[link]
+
+    def fail(self, error):
+        with self._lock:
+            self.last_error = str(error)
+
+    def snapshot(self, since=None, until=None):
+        """
+        Returns (items, updated_at): the stored articles, newest first,
+        optionally limited to those published inside [since, until]
+        (naive datetimes are taken as UTC, undated articles are kept).
+        """
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        if until is not None and until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+        with self._lock:
+            items = []
+            for link in sorted(self._items, key=self._published.get, reverse=True):
+                published = _published_datetime(self._items[link])
+                if published is not None:
+                    if since is not None and published < since:
+                        continue
+                    if until is not None and published > until:
+                        continue
+                items.append(self._items[link])
+            return items, self.updated_at
+
+    def stats(self):
+        with self._lock:
+            return {
+                "articles": len(self._items),
+                "max_articles": self.max_articles,
+                "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+                "last_error": self.last_error,
+            }
+
+
+class FeedPoller:
+    """
+    Daemon thread calling refresh() every `interval` seconds (measured from
+    the start of a poll) and storing its items in the ArticleStore. A failed
+    poll keeps the previous articles and is recorded as the store's last_error.
+    """
+
+    def __init__(self, store, refresh, interval=NEWS_POLL_INTERVAL):
+        self.store = store
+        self.refresh = refresh
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll_once(self):
+        try:
+            with STAGE_SECONDS.labels("poll").time():
+                items = self.refresh()
+            self.store.update(items)
+            print(f"Polled feeds: {len(items)} articles, {self.store.stats()['articles']} stored")
+        except Exception as e:
+            FAILURES.labels("poll").inc()
+            self.store.fail(e)
+            print(f"Feed poll failed: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.poll_once()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="feed-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class RunSnapshots:
+    """
+    Scrapes kept per client run when polling is off: the listing pages and
+    link lookups an aggregator run sends with the same run id are all served
+    from the scrape made for its first request, instead of each one scraping
+    every feed again. Concurrent first requests of a run share one scrape.
+    A snapshot expires ttl seconds after it was taken, and above max_runs the
+    oldest one is dropped.
+    """
+
+    def __init__(self, ttl=NEWS_SNAPSHOT_TTL, max_runs=NEWS_SNAPSHOT_MAX_RUNS):
+        self.ttl = ttl
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._scrapes = {}
+
+    def _cached(self, run):
+        with self._lock:
+            now = time.monotonic()
+            for expired in [key for key, (taken, _, _) in self._snapshots.items() if now - taken > self.ttl]:
+                del self._snapshots[expired]
+            snapshot = self._snapshots.get(run)
+        return None if snapshot is None else snapshot[1:]
+
+    def get_or_scrape(self, run, scrape):
+        """Returns (items, updated_at) of the run's snapshot, taking it with scrape() when there is none."""
+        with self._lock:
+            scrape_lock = self._scrapes.setdefault(run, threading.Lock())
+        with scrape_lock:
+            cached = self._cached(run)
+            if cached is not None:
+                CACHE_HITS.labels("run_snapshot").inc()
+                return cached
+            CACHE_MISSES.labels("run_snapshot").inc()
+            try:
+                items = scrape()
+                updated_at = datetime.now(timezone.utc)
+                with self._lock:
+                    self._snapshots[run] = (time.monotonic(), items, updated_at)
+                    while len(self._snapshots) > self.max_runs:
+                        del self._snapshots[next(iter(self._snapshots))]
+                return items, updated_at
+            finally:
+                with self._lock:
+                    self._scrapes.pop(run, None)
+
+
+def content_hash(item):
+    payload = (item.get("title") or "") + "\n" + (item.get("content") or "")
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def parse_fields(fields):
+    """Parses a comma-separated field list; None (no projection) when it is empty."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in NEWS_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(NEWS_FIELDS)})")
+    return names
+
+
+def project_item(item, fields):
+    if fields is None:
+        return item
+    return {name: content_hash(item) if name == "content_hash" else item.get(name) for name in fields}
+
+
+def _cursor_key(item):
+    published = _published_datetime(item)
+    return (published.timestamp() if published else 0.0, item.get("link") or "")
+
+
+def encode_cursor(item):
+    return base64.urlsafe_b64encode(json.dumps(_cursor_key(item)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, link = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(timestamp), str(link)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def paginate(items, limit=None, cursor=None):
+    """
+    Returns (page, next_cursor). With a limit or a cursor the items are
+    ordered newest first (by published date, then link) and the page starts
+    right after the cursor's item, so a later page is not shifted by
+    articles the poller adds in between. next_cursor is None on the last page.
+    """
+    if limit is None and cursor is None:
+        return items, None
+    ordered = sorted(items, key=_cursor_key, reverse=True)
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        ordered = [item for item in ordered if _cursor_key(item) < after]
+    if limit is None or len(ordered) <= limit:
+        return ordered, None
+    page = ordered[:limit]
+    return page, encode_cursor(page[-1])
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, body, more_body):
+        # flush every streamed part, so NDJSON lines reach the client as they are produced
+        return self._compressor.compress(body) + self._compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class _ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, body, more_body):
+        flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK if more_body else zstandard.COMPRESSOBJ_FLUSH_FINISH
+        return self._compressor.compress(body) + self._compressor.flush(flush)
+
+
+def accepted_encodings(header):
+    """The encodings of an Accept-Encoding header with their q-values."""
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name, params = name.strip().lower(), params.strip()
+        if not name:
+            continue
+        try:
+            accepted[name] = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            accepted[name] = 0.0
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the encoding negotiated through
+    Accept-Encoding: zstd (when the zstandard package is installed) or gzip,
+    zstd winning when the client weights both equally. Streamed responses are
+    compressed part by part; single-part responses smaller than minimum_size,
+    already encoded responses and server-sent events are passed through.
+    """
+
+    def __init__(self, app, minimum_size=500, compresslevel=6, zstd_level=3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.zstd_level = zstd_level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        supported = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+        candidates = [encoding for encoding in supported if accepted.get(encoding, 0) > 0]
+        if not candidates:
+            await self.app(scope, receive, send)
+            return
+        encoding = max(candidates, key=accepted.get)
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message  # held until the first body part decides
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(scope=start_message)
+                if ("content-encoding" in headers or headers.get("content-type", "").startswith("text/event-stream")
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = _ZstdEncoder(self.zstd_level) if encoding == "zstd" else _GzipEncoder(self.compresslevel)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                body = encoder.compress(body, more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+            await send({"type": "http.response.body", "body": encoder.compress(body, more_body), "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _host_semaphore(url):
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(FETCH_PER_HOST_LIMIT)
+        return _host_semaphores[host]
+
+
+def breaker_stats():
+    return _host_breakers.stats()
+
+
+def _is_article_error(error):
+    # a 4xx other than 429 is about the article, the host itself answered
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.HTTPError) and response is not None \
+        and response.status_code < 500 and response.status_code != 429
+
+
+_BOILERPLATE_XPATH = (
+    "//script|//style|//noscript|//nav|//header|//footer|//aside|//form|//iframe|//figure"
+)
+_CONTENT_XPATH = ".//p|.//h2|.//h3|.//li|.//blockquote"
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fast_extract(html):
+    """
+    Lightweight main-content extraction with lxml: boilerplate elements are
+    dropped, and the text blocks of the element holding the most paragraph
+    text (an <article> if the page has one) are returned.
+    """
+    root = lxml.html.fromstring(html)
+    for element in root.xpath(_BOILERPLATE_XPATH):
+        element.drop_tree()
+
+    best = root.find(".//article")
+    if best is None:
+        scores = {}
+        for paragraph in root.iter("p"):
+            parent = paragraph.getparent()
+            scores[parent] = scores.get(parent, 0) + len(paragraph.text_content())
+        best = max(scores, key=scores.get) if scores else root
+
+    blocks = (_WHITESPACE_RE.sub(" ", element.text_content()).strip() for element in best.xpath(_CONTENT_XPATH))
+    return "\n\n".join(block for block in blocks if block)
+
+
+def extract_text(html, url, mode="newspaper"):
+    """Extracts the article text from raw HTML bytes (runs in the extraction processes)."""
+    if mode == "fast":
+        return fast_extract(html)
+    article = Article(url)
+    article.set_html(html)
+    # avoid another downloading of the article
+    article.is_downloaded = True
+    article.parse()
+    return article.text.strip()
+
+
+def _extraction_pool():
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            # spawn: the workers never inherit the download threads' state
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extract_pool
+
+
+def shutdown_extract_pool():
+    """Stops the extraction processes, cancelling the queued extractions; the next one starts a new pool."""
+    global _extract_pool
+    with _extract_pool_lock:
+        pool, _extract_pool = _extract_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def extract_article(html, url, deadline=None):
+    """
+    Extracts the text of a downloaded article, on the process pool unless
+    EXTRACT_PROCESSES is 0, so CPU-bound parsing runs on every core instead
+    of under the GIL of the request threads. On the pool, an extraction still
+    running at `deadline` (a time.monotonic() value) raises FuturesTimeout.
+    """
+    mode = "fast" if urlparse(url).netloc in FAST_EXTRACT_HOSTS else ARTICLE_EXTRACTOR
+    if EXTRACT_PROCESSES <= 0:
+        return extract_text(html, url, mode)
+    future = _extraction_pool().submit(extract_text, html, url, mode)
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        return future.result(timeout=timeout)
+    except FuturesTimeout:
+        # only drops an extraction still queued: one already running cannot be
+        # interrupted and keeps its process busy until it finishes
+        future.cancel()
+        raise
+
+
+def _download(url):
+    headers = {
+        'User-Agent': (
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+            'AppleWebKit/537.36 (KHTML, like Gecko) '
+            'Chrome/114.0.0.0 Safari/537.36'
+        ),
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    }
+    with STAGE_SECONDS.labels("article_download").time():
+        response = requests.get(url, headers=headers, timeout=ARTICLE_TIMEOUT)
+        response.raise_for_status()
+    return response
+
+
+def fetch_article(url, deadline=None, retries=ARTICLE_RETRIES):
+    """
+    Downloads and extracts an article ("" on failure). A download failing with a
+    timeout, a connection error, a 429 or a 5xx is retried with full-jitter
+    backoff, behind the host's circuit breaker and within `deadline` (a
+    time.monotonic() value, None = no deadline).
+    """
+    breaker = _host_breakers.get(url)
+    retries = max(1, retries)
+    for attempt in range(1, retries + 1):
+        if attempt > 1:
+            RETRIES.labels("article_download").inc()
+        try:
+            breaker.check()
+            response = _download(url)
+            breaker.record_success()
+            break
+        except CircuitOpenError as e:
+            SHORT_CIRCUITS.labels("article_download").inc()
+            print(f"Skipped: {url} => {e}")
+            return ""
+        except Exception as e:
+            print(f"Failed to fetch: {url} (attempt {attempt}) => {e}")
+            if _is_article_error(e):
+                breaker.record_success()
+                FAILURES.labels("article_download").inc()
+                return ""
+            breaker.record_failure()
+        wait = backoff_delay(attempt)
+        if attempt == retries or (deadline is not None and wait >= deadline - time.monotonic()):
+            FAILURES.labels("article_download").inc()
+            return ""
+        time.sleep(wait)
+
+    try:
+        with STAGE_SECONDS.labels("article_extraction").time():
+            # raw bytes: the extractor decodes them with the page's own charset
+            return extract_article(response.content, url, deadline)
+    except Exception as e:
+        FAILURES.labels("article_extraction").inc()
+        print(f"Failed to extract: {url} => {e}")
+        return ""
+
+
+def fetch_article_limited(url, deadline=None):
+    with _host_semaphore(url):
+        # past the deadline the entry was already returned as partial
+        if deadline is not None and time.monotonic() >= deadline:
+            return ""
+        return fetch_article(url, deadline)
+
+
+def build_item(entry, source, content, partial=False):
+    return {
+        "title": entry.title,
+        "content": content,
+        "link": entry.link,
+        "published": entry.get("published", ""),
+        "source": source,
+        "partial": partial
+    }
+
+
+def parse_feeds(feeds, cache=None):
+    """
+    Parse every feed and return (entry, feed_url) pairs in feed order.
+    With a cache, feeds are requested conditionally and a 304 reuses the
+    entries seen on the previous run.
+    """
+    entries = []
+    for url in feeds:
+        try:
+            if cache is None:
+                with STAGE_SECONDS.labels("feed_parse").time():
+                    feed = feedparser.parse(url)
+            else:
+                etag, modified = cache.feed_validators(url)
+                with STAGE_SECONDS.labels("feed_parse").time():
+                    feed = feedparser.parse(url, etag=etag, modified=modified)
+                if feed.get("status") == 304:
+                    CACHE_HITS.labels("feed").inc()
+                    print(f"Feed not modified: {url}")
+                    entries.extend((entry, url) for entry in cache.feed_entries(url))
+                    continue
+                CACHE_MISSES.labels("feed").inc()
+                cache.update_feed(url, feed.get("etag"), feed.get("modified"), feed.entries)
+            for entry in feed.entries:
+                entries.append((entry, url))
+        except Exception as e:
+            FAILURES.labels("feed_parse").inc()
+            print(f"Error parsing feed {url}: {e}")
+    return entries
+
+
+def published_at(entry):
+    """The entry's published timestamp as an aware UTC datetime, or None if the feed has none."""
+    parsed = entry.get("published_parsed") or entry.get("updated_parsed")
+    if not parsed:
+        return None
+    try:
+        return datetime.fromtimestamp(calendar.timegm(tuple(parsed)[:6]), tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def filter_entries(entries, since=None, until=None):
+    """
+    Keeps the (entry, feed_url) pairs published inside [since, until], before any
+    article is downloaded. Entries without a parseable date are kept.
+    Naive datetimes are taken as UTC.
+    """
+    if since is None and until is None:
+        return entries
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if until is not None and until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+
+    kept = []
+    for entry, url in entries:
+        published = published_at(entry)
+        if published is not None:
+            if since is not None and published < since:
+                continue
+            if until is not None and published > until:
+                continue
+        kept.append((entry, url))
+    return kept
+
+
+def iter_entries_concurrently(entries, deadline, cache=None):
+    """
+    Downloads and parses the articles of the given feed entries on a bounded
+    thread pool and yields (index, item) pairs as soon as each article is
+    extracted. Entries found in the cache are yielded first without being
+    downloaded again. Entries that are not finished when the deadline (a
+    time.monotonic() value) is reached are yielded with empty content and
+    "partial": True instead of blocking the response.
+    """
+    if not entries:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS)
+    try:
+        pending = {}
+        for index, (entry, source) in enumerate(entries):
+            content = cache.get(entry.link) if cache else None
+            if content is not None:
+                yield index, build_item(entry, source, content)
+            else:
+                pending[executor.submit(fetch_article_limited, entry.link, deadline)] = index
+
+        try:
+            for future in as_completed(list(pending), timeout=max(0.0, deadline - time.monotonic())):
+                index = pending.pop(future)
+                entry, source = entries[index]
+                yield index, build_item(entry, source, future.result())
+        except FuturesTimeout:
+            FAILURES.labels("deadline").inc(len(pending))
+            print(f"Deadline reached: {len(pending)}/{len(entries)} articles returned as partial")
+
+        for index in sorted(pending.values()):
+            entry, source = entries[index]
+            yield index, build_item(entry, source, "", partial=True)
+    finally:
+        # don't wait for the stragglers, and drop anything still queued
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_entries_concurrently(entries, deadline, cache=None):
+    """Same as iter_entries_concurrently(), collected back into feed order."""
+    items = [None] * len(entries)
+    for index, item in iter_entries_concurrently(entries, deadline, cache):
+        items[index] = item
+    return items
+
+
+def fetch_feed_items(feeds, concurrent=True, deadline_seconds=FETCH_DEADLINE, incremental=FETCH_INCREMENTAL,
+                     since=None, until=None, known=None):
+    """
+    Scrapes the feeds. `known` (e.g. an ArticleStore) is consulted like the
+    article cache for content extracted earlier, when incremental is off.
+    """
+    cache = __getattr__("article_cache") if incremental else None
+    lookup = cache if cache is not None else known
+    deadline = time.monotonic() + deadline_seconds
+    entries = filter_entries(parse_feeds(feeds, cache), since, until)
+
+    if concurrent:
+        items = fetch_entries_concurrently(entries, deadline, lookup)
+    else:
+        items = []
+        for entry, url in entries:
+            content = lookup.get(entry.link) if lookup else None
+            if content is None:
+                content = fetch_article(entry.link)
+            items.append(build_item(entry, url, content))
+
+    if cache is not None:
+        # failed and partial downloads are retried on the next run
+        for item in items:
+            if item["content"] and not item["partial"]:
+                cache.put(item["link"], item["content"])
+        cache.save()
+    return items
+
+
+def iter_feed_items(feeds, deadline_seconds=FETCH_DEADLINE, incremental=FETCH_INCREMENTAL, since=None, until=None):
+    """Streaming variant of fetch_feed_items(): yields every item as soon as it is extracted."""
+    cache = __getattr__("article_cache") if incremental else None
+    deadline = time.monotonic() + deadline_seconds
+    entries = filter_entries(parse_feeds(feeds, cache), since, until)
+    try:
+        for _, item in iter_entries_concurrently(entries, deadline, cache):
+            if cache is not None and item["content"] and not item["partial"]:
+                cache.put(item["link"], item["content"])
+            yield item
+    finally:
+        if cache is not None:
+            cache.save()
+
@@ -7,18 +7,17 @@ build_and_push() {
   IMAGE_NAME=$2
 
   echo "Building $IMAGE_NAME from $SERVICE_DIR ..."
-  cd "../$SERVICE_DIR" || exit 1
+  # the context is services/fetch_news_crypto, so the images get the shared common/ package
+  cd .. || exit 1
 
-  docker build -t "gcr.io/$PROJECT_ID/$IMAGE_NAME:v1" .
+  docker build -f "$SERVICE_DIR/Dockerfile" -t "gcr.io/$PROJECT_ID/$IMAGE_NAME:v1" .
   docker push "gcr.io/$PROJECT_ID/$IMAGE_NAME:v1"
 
-  cd ../
+  cd scripts
   echo "Done with $IMAGE_NAME"
   echo "---------------------------"
 }
 
 # Run for each service
 build_and_push "aggregator" "aggregator"
-build_and_push "service_1" "fetch_news_crypto_service_1"
-build_and_push "service_2" "fetch_news_crypto_service_2"
-build_and_push "service_3" "fetch_news_crypto_service_3"
+build_and_push "feed_worker" "fetch_news_crypto_feed_worker"
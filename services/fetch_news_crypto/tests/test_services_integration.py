@@ -1,19 +1,13 @@
 import pytest
 
-# Import the actual fetch functions from each microservice
-from service_1.utils import fetch_coindesk_cointelegraph_cryptopotato
-from service_2.utils import fetch_bitcoin_decrypt
-from service_3.utils import fetch_btc_utoday
+# Import the actual fetch function and the configured feeds of the feed worker
+from feed_worker.utils import fetch_feed_items, FEEDS
 
 @pytest.mark.integration
-@pytest.mark.parametrize("fetch_function", [
-    fetch_coindesk_cointelegraph_cryptopotato,
-    fetch_bitcoin_decrypt,
-    fetch_btc_utoday,
-])
-def test_fetch_news_integration(fetch_function):
+@pytest.mark.parametrize("feed", FEEDS)
+def test_fetch_news_integration(feed):
     # Call the function directly – performs real HTTP and RSS parsing
-    articles = fetch_function()
+    articles = fetch_feed_items([feed])
 
     # Validate the result is a list (can be empty if no articles available)
     assert isinstance(articles, list)
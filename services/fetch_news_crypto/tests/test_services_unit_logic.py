@@ -1,64 +1,468 @@
+import os
 import pytest
+import subprocess
+import sys
+import threading
+import time
 from unittest.mock import patch, MagicMock
+from feedparser import FeedParserDict
 
-# Import utility modules from each microservice
-from service_1 import utils as service1_utils
-from service_2 import utils as service2_utils
-from service_3 import utils as service3_utils
-
-def test_fetch_news_multiple_feeds_per_service():
-    # Define each microservice's module and corresponding fetch function
-    services = [
-        (service1_utils, "fetch_coindesk_cointelegraph_cryptopotato"),
-        (service2_utils, "fetch_bitcoin_decrypt"),
-        (service3_utils, "fetch_btc_utoday"),
+from feed_worker import sharding
+from feed_worker import utils as worker_utils
+
+
+def test_fetch_news_multiple_feeds():
+    with patch(f"{worker_utils.__name__}.feedparser.parse") as mock_parse, \
+         patch(f"{worker_utils.__name__}.requests.get") as mock_get, \
+         patch(f"{worker_utils.__name__}.Article") as mock_article_class, \
+         patch(f"{worker_utils.__name__}.EXTRACT_PROCESSES", 0):
+
+        # Simulate two RSS entries from two feeds
+        entry1 = MagicMock(title="News A", link="http://example.com/a", published="Yesterday")
+        entry2 = MagicMock(title="News B", link="http://example.com/b", published="Today")
+
+        # feedparser.parse is called twice – once for each feed
+        mock_parse.side_effect = [
+            MagicMock(entries=[entry1]),
+            MagicMock(entries=[entry2])
+        ]
+
+        # Simulate a successful HTTP response for article content
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.content = b"<html>mocked</html>"
+
+        # Simulate newspaper.Article parsing behavior
+        mock_article = MagicMock()
+        mock_article.text = "Simulated content"
+        mock_article.set_html.return_value = None
+        mock_article.parse.return_value = None
+        mock_article_class.return_value = mock_article
+
+        result = worker_utils.fetch_feed_items(["http://feed.example.com/a", "http://feed.example.com/b"])
+
+        # Validate returned article list
+        assert isinstance(result, list)
+        assert len(result) == 2  # Two feeds -> two articles
+
+        # Validate structure and content
+        for article in result:
+            assert isinstance(article, dict)
+            assert "title" in article and isinstance(article["title"], str)
+            assert "link" in article and isinstance(article["link"], str)
+            assert "content" in article and isinstance(article["content"], str)
+            assert "published" in article
+            assert "source" in article
+
+        # Validate expected titles
+        titles = [article["title"] for article in result]
+        assert "News A" in titles
+        assert "News B" in titles
+
+
+def test_fetch_news_deadline_marks_slow_entries_partial():
+    # Entries still downloading when the deadline hits come back as partial. One feed, so
+    # no straggler is left waiting for a host slot to call fetch_article after the patch
+    with patch(f"{worker_utils.__name__}.FEEDS", ["http://feed.example.com/rss"]), \
+         patch(f"{worker_utils.__name__}.feedparser.parse") as mock_parse, \
+         patch(f"{worker_utils.__name__}.fetch_article") as mock_fetch:
+
+        fast = MagicMock(title="Fast", link="http://fast.example.com/a", published="Today")
+        slow = MagicMock(title="Slow", link="http://slow.example.com/b", published="Today")
+        mock_parse.return_value = MagicMock(entries=[fast, slow])
+
+        release = threading.Event()
+
+        def fake_fetch(url, deadline=None):
+            if "slow" in url:
+                release.wait(5)
+            return f"content of {url}"
+
+        mock_fetch.side_effect = fake_fetch
+
+        try:
+            result = worker_utils.fetch_feed_items(worker_utils.FEEDS, deadline_seconds=0.5)
+        finally:
+            release.set()
+
+        # Feed order is preserved, one item per entry of every feed
+        assert [item["title"] for item in result] == ["Fast", "Slow"] * len(worker_utils.FEEDS)
+
+        for item in result:
+            if item["title"] == "Fast":
+                assert item["partial"] is False
+                assert item["content"] == "content of http://fast.example.com/a"
+            else:
+                assert item["partial"] is True
+                assert item["content"] == ""
+
+
+def test_incremental_fetch_skips_cached_articles_and_unmodified_feeds(tmp_path):
+    cache = worker_utils.ArticleCache(tmp_path / "article_cache.json")
+    entry = FeedParserDict(title="News A", link="http://example.com/a", published="Today")
+
+    with patch(f"{worker_utils.__name__}.article_cache", cache), \
+         patch(f"{worker_utils.__name__}.FEEDS", ["http://feed.example.com/rss"]), \
+         patch(f"{worker_utils.__name__}.feedparser.parse") as mock_parse, \
+         patch(f"{worker_utils.__name__}.fetch_article", return_value="Article body") as mock_fetch:
+
+        # First run: the feed is downloaded with its validators and the article is fetched
+        mock_parse.return_value = MagicMock(entries=[entry], **{"get.side_effect": {"etag": "v1"}.get})
+        first = worker_utils.fetch_feed_items(worker_utils.FEEDS, incremental=True)
+        assert first[0]["content"] == "Article body"
+        assert mock_fetch.call_count == 1
+
+        # Second run: the feed answers 304 and the article comes from the cache
+        mock_parse.return_value = MagicMock(entries=[], **{"get.side_effect": {"status": 304}.get})
+        second = worker_utils.fetch_feed_items(worker_utils.FEEDS, incremental=True)
+
+        mock_parse.assert_called_with("http://feed.example.com/rss", etag="v1", modified=None)
+        assert mock_fetch.call_count == 1
+        assert [item["title"] for item in second] == ["News A"]
+        assert second[0]["content"] == "Article body"
+
+    # The cache survives a restart
+    assert worker_utils.ArticleCache(tmp_path / "article_cache.json").get("http://example.com/a") == "Article body"
+
+
+def test_stream_yields_articles_in_completion_order():
+    with patch(f"{worker_utils.__name__}.FEEDS", ["http://feed.example.com/rss"]), \
+         patch(f"{worker_utils.__name__}.feedparser.parse") as mock_parse, \
+         patch(f"{worker_utils.__name__}.fetch_article") as mock_fetch:
+
+        slow = FeedParserDict(title="Slow", link="http://slow.example.com/a", published="Today")
+        fast = FeedParserDict(title="Fast", link="http://fast.example.com/b", published="Today")
+        mock_parse.return_value = MagicMock(entries=[slow, fast])
+
+        fast_done = threading.Event()
+
+        def fake_fetch(url, deadline=None):
+            if "slow" in url:
+                fast_done.wait(5)
+                time.sleep(0.1)  # let the fast fetch return after setting the event
+                return "slow content"
+            fast_done.set()
+            return "fast content"
+
+        mock_fetch.side_effect = fake_fetch
+
+        titles = [item["title"] for item in worker_utils.iter_feed_items(worker_utils.FEEDS)]
+
+        # The fast article is emitted first even though it is second in the feed
+        assert titles == ["Fast", "Slow"]
+
+
+def test_time_window_is_applied_before_downloading():
+    from datetime import datetime, timezone
+
+    recent = FeedParserDict(title="Recent", link="http://example.com/recent",
+                            published_parsed=(2025, 7, 29, 12, 0, 0, 1, 210, 0))
+    old = FeedParserDict(title="Old", link="http://example.com/old",
+                         published_parsed=(2025, 7, 27, 12, 0, 0, 6, 208, 0))
+    undated = FeedParserDict(title="Undated", link="http://example.com/undated")
+
+    with patch(f"{worker_utils.__name__}.FEEDS", ["http://feed.example.com/rss"]), \
+         patch(f"{worker_utils.__name__}.feedparser.parse") as mock_parse, \
+         patch(f"{worker_utils.__name__}.fetch_article", return_value="Body") as mock_fetch:
+
+        mock_parse.return_value = MagicMock(entries=[recent, old, undated])
+        result = worker_utils.fetch_feed_items(
+            worker_utils.FEEDS,
+            since=datetime(2025, 7, 29, tzinfo=timezone.utc),
+            until=datetime(2025, 7, 30),
+        )
+
+    # Entries outside the window are never downloaded; undated ones are kept
+    assert [item["title"] for item in result] == ["Recent", "Undated"]
+    assert sorted(call.args[0] for call in mock_fetch.call_args_list) == [
+        "http://example.com/recent", "http://example.com/undated"
     ]
 
-    for utils_module, function_name in services:
-        # Dynamically patch dependencies based on the module's name
-        with patch(f"{utils_module.__name__}.feedparser.parse") as mock_parse, \
-             patch(f"{utils_module.__name__}.requests.get") as mock_get, \
-             patch(f"{utils_module.__name__}.Article") as mock_article_class:
-
-            # Simulate two RSS entries from two feeds
-            entry1 = MagicMock(title="News A", link="http://example.com/a", published="Yesterday")
-            entry2 = MagicMock(title="News B", link="http://example.com/b", published="Today")
-
-            # feedparser.parse is called twice – once for each feed
-            mock_parse.side_effect = [
-                MagicMock(entries=[entry1]),
-                MagicMock(entries=[entry2])
-            ]
-
-            # Simulate a successful HTTP response for article content
-            mock_get.return_value.status_code = 200
-            mock_get.return_value.text = "<html>mocked</html>"
-
-            # Simulate newspaper.Article parsing behavior
-            mock_article = MagicMock()
-            mock_article.text = "Simulated content"
-            mock_article.set_html.return_value = None
-            mock_article.parse.return_value = None
-            mock_article_class.return_value = mock_article
-
-            # Call the target function (e.g., fetch_btc_utoday)
-            fetch_func = getattr(utils_module, function_name)
-            result = fetch_func()
-
-            # Validate returned article list
-            assert isinstance(result, list)
-            assert len(result) == 2  # Two feeds -> two articles
-
-            # Validate structure and content
-            for article in result:
-                assert isinstance(article, dict)
-                assert "title" in article and isinstance(article["title"], str)
-                assert "link" in article and isinstance(article["link"], str)
-                assert "content" in article and isinstance(article["content"], str)
-                assert "published" in article
-                assert "source" in article
-
-            # Validate expected titles
-            titles = [article["title"] for article in result]
-            assert "News A" in titles
-            assert "News B" in titles
+
+def test_fast_extract_and_process_pool_extraction():
+    html = (
+        b"<html><head><script>var x = 1;</script></head><body>"
+        b"<nav><p>Home | Markets | Login</p></nav>"
+        b"<div class='sidebar'><p>Related: other story</p></div>"
+        b"<div class='post'><h2>Bitcoin rallies</h2>"
+        b"<p>Bitcoin rose 5% on Monday as ETF inflows hit a record.</p>"
+        b"<p>Analysts expect the rally to continue into the weekend.</p></div>"
+        b"<footer><p>Copyright 2025</p></footer></body></html>"
+    )
+
+    # The fast mode keeps the main content block and drops navigation and footer
+    assert worker_utils.fast_extract(html) == (
+        "Bitcoin rallies\n\n"
+        "Bitcoin rose 5% on Monday as ETF inflows hit a record.\n\n"
+        "Analysts expect the rally to continue into the weekend."
+    )
+
+    # Hosts listed in FAST_EXTRACT_HOSTS are extracted in the fast mode, on the process pool
+    with patch(f"{worker_utils.__name__}.FAST_EXTRACT_HOSTS", {"fast.example.com"}), \
+         patch(f"{worker_utils.__name__}.EXTRACT_PROCESSES", 1), \
+         patch(f"{worker_utils.__name__}._extract_pool", None):
+        text = worker_utils.extract_article(html, "http://fast.example.com/a")
+        worker_utils.shutdown_extract_pool()
+        assert worker_utils._extract_pool is None
+
+    assert text.startswith("Bitcoin rallies")
+
+    # An extraction still running at the deadline does not block past it
+    from concurrent.futures import Future
+    stuck = MagicMock()
+    stuck.submit.return_value = Future()
+    with patch(f"{worker_utils.__name__}.EXTRACT_PROCESSES", 1), \
+         patch(f"{worker_utils.__name__}._extract_pool", stuck):
+        started = time.monotonic()
+        with pytest.raises(worker_utils.FuturesTimeout):
+            worker_utils.extract_article(html, "http://slow.example.com/a", deadline=started + 0.05)
+        assert time.monotonic() - started < 5
+
+
+def test_utils_import_loads_no_feeds(tmp_path):
+    # the extraction processes import utils: it must not read the feed list or the article cache
+    env = {**os.environ, "FEEDS_FILE": str(tmp_path / "missing.json"),
+           "ARTICLE_CACHE_PATH": str(tmp_path / "article_cache.json")}
+    env.pop("NEWS_FEEDS", None)
+    code = "from feed_worker import utils; assert 'FEEDS' not in vars(utils) and 'article_cache' not in vars(utils)"
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(worker_utils.__file__)),
+                   env=env, check=True)
+
+    # the feeds are loaded on first access instead
+    with patch.dict(os.environ, {"NEWS_FEEDS": "http://feed.example.com/rss"}), patch.dict(vars(worker_utils)):
+        vars(worker_utils).pop("FEEDS", None)
+        assert worker_utils.FEEDS == ["http://feed.example.com/rss"]
+
+
+def test_available_cpus_honours_the_cgroup_quota():
+    import io
+
+    def cgroup(files):
+        def fake_open(path, *args, **kwargs):
+            if path not in files:
+                raise FileNotFoundError(path)
+            return io.StringIO(files[path])
+        return patch(f"{worker_utils.__name__}.open", side_effect=fake_open, create=True)
+
+    # A pod limited to 1.5 CPUs on a 64-CPU node may use 2, not 64
+    with patch("os.sched_getaffinity", return_value=set(range(64)), create=True):
+        with cgroup({"/sys/fs/cgroup/cpu.max": "150000 100000\n"}):
+            assert worker_utils.available_cpus() == 2
+        with cgroup({"/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "50000\n", "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000\n"}):
+            assert worker_utils.available_cpus() == 1
+        # No quota: the affinity mask decides
+        with cgroup({"/sys/fs/cgroup/cpu.max": "max 100000\n"}):
+            assert worker_utils.available_cpus() == 64
+
+
+def test_poller_keeps_a_bounded_store_and_reuses_its_articles():
+    def item(link, published, content="Body", partial=False):
+        return {"title": link, "content": content, "link": link, "published": published,
+                "source": "http://feed.example.com/rss", "partial": partial}
+
+    store = worker_utils.ArticleStore(max_articles=2)
+    polls = [
+        [item("a", "Mon, 28 Jul 2025 10:00:00 +0000"), item("b", "Tue, 29 Jul 2025 10:00:00 +0000")],
+        # a timed-out download of "b" and a newer article "c"
+        [item("b", "Tue, 29 Jul 2025 10:00:00 +0000", content="", partial=True),
+         item("c", "Wed, 30 Jul 2025 10:00:00 +0000")],
+    ]
+    poller = worker_utils.FeedPoller(store, lambda: polls.pop(0), interval=60)
+
+    poller.poll_once()
+    assert store.refreshed.is_set()
+    assert store.get("a") == "Body"  # served as the content cache of the next poll
+
+    poller.poll_once()
+    items, updated_at = store.snapshot()
+    # the oldest article is evicted, the partial one does not replace the complete one
+    assert [(i["link"], i["content"]) for i in items] == [("c", "Body"), ("b", "Body")]
+    assert updated_at is not None
+
+    from datetime import datetime
+    recent, _ = store.snapshot(since=datetime(2025, 7, 30))
+    assert [i["link"] for i in recent] == ["c"]
+
+    # a failed poll keeps the articles and records the error
+    poller.poll_once()  # no polls left: IndexError
+    assert store.stats()["articles"] == 2
+    assert "pop from empty list" in store.stats()["last_error"]
+
+
+def test_projection_and_cursor_pagination():
+    items = [
+        {"title": f"T{day}", "content": f"Body {day}", "link": f"http://example.com/{day}",
+         "published": f"Mon, {day:02d} Jul 2025 10:00:00 +0000", "source": "feed", "partial": False}
+        for day in (21, 28, 14)
+    ]
+
+    page, cursor = worker_utils.paginate(items, limit=2)
+    assert [item["title"] for item in page] == ["T28", "T21"]
+
+    # an article added between the requests does not shift the next page
+    items.append({**items[0], "title": "T29", "link": "http://example.com/29",
+                  "published": "Tue, 29 Jul 2025 10:00:00 +0000"})
+    page, next_cursor = worker_utils.paginate(items, limit=2, cursor=cursor)
+    assert [item["title"] for item in page] == ["T14"] and next_cursor is None
+
+    fields = worker_utils.parse_fields("title,content_hash")
+    projected = worker_utils.project_item(items[0], fields)
+    assert list(projected) == ["title", "content_hash"] and len(projected["content_hash"]) == 40
+
+    with pytest.raises(ValueError):
+        worker_utils.parse_fields("title,body")
+    with pytest.raises(ValueError):
+        worker_utils.paginate(items, cursor="not-a-cursor")
+
+    assert worker_utils.accepted_encodings("gzip;q=0.5, zstd, br;q=0") == {"gzip": 0.5, "zstd": 1.0, "br": 0.0}
+
+
+def test_run_snapshots_scrape_once_per_run():
+    scrapes = []
+
+    def scrape():
+        scrapes.append(1)
+        return [{"link": f"http://x/{len(scrapes)}"}]
+
+    snapshots = worker_utils.RunSnapshots(ttl=60, max_runs=2)
+    first, _ = snapshots.get_or_scrape("run-1", scrape)
+    again, _ = snapshots.get_or_scrape("run-1", scrape)
+    assert first is again and len(scrapes) == 1
+
+    snapshots.get_or_scrape("run-2", scrape)
+    snapshots.get_or_scrape("run-3", scrape)  # evicts run-1
+    snapshots.get_or_scrape("run-1", scrape)
+    assert len(scrapes) == 4
+
+    expired = worker_utils.RunSnapshots(ttl=0)
+    expired.get_or_scrape("run", scrape)
+    time.sleep(0.01)
+    expired.get_or_scrape("run", scrape)
+    assert len(scrapes) == 6
+
+
+def test_compression_middleware_negotiates_and_streams():
+    import gzip
+    import json
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.add_middleware(worker_utils.CompressionMiddleware, minimum_size=100)
+    big = {"articles": ["Bitcoin rose 5% on Monday."] * 50}
+
+    @app.get("/big")
+    def big_response():
+        return big
+
+    @app.get("/small")
+    def small_response():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream_response():
+        return StreamingResponse((json.dumps({"i": i}) + "\n" for i in range(3)), media_type="application/x-ndjson")
+
+    client = TestClient(app)
+
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip" and "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == big  # decoded by the client
+
+    raw = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in raw.headers and raw.json() == {"ok": True}
+
+    response = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers and response.json() == big
+
+    # every streamed part is flushed, so the concatenation decodes to all the lines
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip" and "content-length" not in response.headers
+        body = b"".join(response.iter_raw())
+    lines = gzip.decompress(body).decode().splitlines()
+    assert [json.loads(line)["i"] for line in lines] == [0, 1, 2]
+
+    if worker_utils.zstandard is not None:
+        with client.stream("GET", "/big", headers={"Accept-Encoding": "gzip, zstd"}) as response:
+            assert response.headers["content-encoding"] == "zstd"
+            body = b"".join(response.iter_raw())
+        decoded = worker_utils.zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        assert json.loads(decoded) == big
+
+
+def test_consistent_hashing_spreads_feeds_and_moves_few_on_scaling():
+    feeds = [f"https://feed{i}.example.com/rss" for i in range(400)]
+    three = sharding.HashRing(["feed-worker-0", "feed-worker-1", "feed-worker-2"])
+    four = sharding.HashRing(["feed-worker-0", "feed-worker-1", "feed-worker-2", "feed-worker-3"])
+
+    # every feed has exactly one owner, and the shares are roughly even
+    shares = three.assign(feeds)
+    assert sorted(feed for owned in shares.values() for feed in owned) == sorted(feeds)
+    assert all(80 < len(owned) < 190 for owned in shares.values())
+
+    # adding a replica only moves feeds to the new replica, about a quarter of them
+    moved = [feed for feed in feeds if three.owner(feed) != four.owner(feed)]
+    assert all(four.owner(feed) == "feed-worker-3" for feed in moved)
+    assert 40 < len(moved) < 170
+
+    with patch(f"{sharding.__name__}.WORKER_NAME", "feed-worker-1"), \
+         patch(f"{sharding.__name__}.WORKER_MEMBERS", ["feed-worker-0", "feed-worker-1", "feed-worker-2"]):
+        assert sharding.owned_feeds(feeds) == shares["feed-worker-1"]
+
+    # a ring without members owns nothing
+    empty = sharding.HashRing([])
+    assert empty.owner(feeds[0]) is None
+    assert empty.assign(feeds) == {}
+
+
+def test_circuit_breaker_skips_a_failing_host():
+    import requests
+
+    def fake_get(url, **kwargs):
+        if "down.example.com" in url:
+            raise requests.exceptions.ConnectTimeout("timed out")
+        response = MagicMock(status_code=404)
+        response.raise_for_status.side_effect = requests.HTTPError("404", response=response)
+        return response
+
+    breakers = worker_utils.BreakerRegistry(failure_threshold=3, reset_timeout=120)
+    with patch(f"{worker_utils.__name__}.requests.get", side_effect=fake_get) as mock_get, \
+         patch(f"{worker_utils.__name__}._host_breakers", breakers):
+        for i in range(6):
+            assert worker_utils.fetch_article(f"https://down.example.com/{i}", retries=1) == ""
+        # a 404 is the article's problem, not the host's, and is not retried
+        for i in range(6):
+            assert worker_utils.fetch_article(f"https://up.example.com/{i}") == ""
+        stats = worker_utils.breaker_stats()
+
+    assert mock_get.call_count == 3 + 6
+    assert stats["https://down.example.com"] == {"state": "open", "consecutive_failures": 3, "rejected": 3}
+    assert stats["https://up.example.com"]["state"] == "closed"
+
+
+def test_failed_downloads_are_retried_with_backoff_within_the_deadline():
+    import requests
+
+    responses = [requests.exceptions.ConnectionError("reset"), MagicMock(status_code=503), MagicMock(content=b"<p>x</p>")]
+    responses[1].raise_for_status.side_effect = requests.HTTPError("503", response=responses[1])
+
+    def fake_get(url, **kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    breakers = worker_utils.BreakerRegistry(failure_threshold=5)
+    with patch(f"{worker_utils.__name__}.requests.get", side_effect=fake_get), \
+         patch(f"{worker_utils.__name__}._host_breakers", breakers), \
+         patch(f"{worker_utils.__name__}.backoff_delay", return_value=0.01) as backoff, \
+         patch(f"{worker_utils.__name__}.extract_article", return_value="Body"):
+        assert worker_utils.fetch_article("https://flaky.example.com/a", retries=3) == "Body"
+        assert [call.args[0] for call in backoff.call_args_list] == [1, 2]
+
+        # no retry whose wait would end past the deadline
+        responses[:] = [requests.exceptions.ConnectionError("reset"), MagicMock(content=b"")]
+        deadline = time.monotonic() + 0.005
+        assert worker_utils.fetch_article("https://flaky.example.com/b", deadline=deadline, retries=3) == ""
+        assert len(responses) == 1
+    assert breakers.get("https://flaky.example.com").state == "closed"